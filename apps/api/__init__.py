@@ -1,13 +1,24 @@
 from dotenv import load_dotenv
-from flask import Flask
-from flask_cors import CORS
+
+# The api modules read their configuration from the environment when they are imported,
+# so the .env file has to be loaded before any of them
+load_dotenv()
+
+from flask import Flask  # noqa: E402
+from flask_cors import CORS  # noqa: E402
+
+from api.upload_spool import SpoolingRequest, MAX_REQUEST_SIZE  # noqa: E402
 
 app = Flask(__name__, static_folder=None)
+app.request_class = SpoolingRequest
+# Requests announcing a larger body are rejected with 413 before anything is read
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_SIZE
 
-from api import routes
+from api import routes  # noqa: E402
 
 
 def create_app():
-    load_dotenv()
     CORS(app)
+    routes.warm_up()
+    routes.start_background_tasks()
     return app
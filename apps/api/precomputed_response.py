@@ -0,0 +1,54 @@
+import gzip
+import hashlib
+import zlib
+
+from flask import Response
+
+ENCODINGS = ["gzip", "deflate"]
+
+
+class PrecomputedResponse:
+    """
+    A response body that is serialized and compressed once and then served as is.
+
+    Each encoding gets its own strong ETag derived from the body digest, so conditional requests
+    can be answered with 304 Not Modified without touching the body at all.
+    """
+
+    def __init__(self, body: bytes, mimetype="application/json", max_age=3600):
+        self.mimetype = mimetype
+        self.cache_control = "public, max-age={}".format(max_age)
+
+        digest = hashlib.sha256(body).hexdigest()
+        self.variants = {
+            "identity": (body, digest),
+            # mtime=0 keeps the gzip bytes, and therefore the ETag, identical across processes
+            "gzip": (gzip.compress(body, compresslevel=9, mtime=0), digest + "-gzip"),
+            "deflate": (zlib.compress(body, 9), digest + "-deflate"),
+        }
+
+    def __negotiate_encoding(self, request):
+        best_encoding = "identity"
+        best_quality = 0
+        for encoding in ENCODINGS:
+            quality = request.accept_encodings[encoding]
+            if quality > best_quality:
+                best_encoding = encoding
+                best_quality = quality
+        return best_encoding
+
+    def respond(self, request) -> Response:
+        encoding = self.__negotiate_encoding(request)
+        body, etag = self.variants[encoding]
+
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=self.mimetype)
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = self.cache_control
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
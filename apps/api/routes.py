@@ -1,32 +1,115 @@
-import ctypes
-from io import BytesIO
-from uuid import uuid4
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 
-from flask import request, jsonify
-from google import genai
-from google.genai.types import UploadFileConfig
+from flask import request, jsonify, stream_with_context
 
 from api import app
-from semantic.classification_cache import ClassificationCache
+from api.precomputed_response import PrecomputedResponse
+from api.upload_spool import digest_of_upload
+from semantic.call_scheduler import call_priority, get_default_scheduler, PRIORITY_BULK
+from semantic.classification_cache import ClassificationCache, classification_cache_key
+from semantic.classification_jobs import ClassificationJobStore, ClassificationJobs, JobQueueFull
+from semantic.classification_store_sqlite import SqliteClassificationStore
+from semantic.classifiers.classifier_registry import ClassifierRegistry
 from semantic.classifiers.merged_classifier import MergedClassifier
 from semantic.classifiers.strategies.classifier_embeddings_gemini_v1 import ClassifierEmbeddingsGemini
 from semantic.classifiers.strategies.classifier_split_gemini_with_serialized_taxonomies_v1 import \
     ClassifierSplitGeminiWithSerializedTaxonomiesV1
-from semantic.ontology_loader import load_from_path
+from semantic.gemini_file_registry import GeminiFileRegistry
+from semantic.ontology_loader import load_from_path, load_from_world, ontology_version_of_path
 from semantic.ontology_serializer import serialize_entity_tree, serialize_entities_with_names, \
     serialize_entity_tree_with_parent_relations
-from semantic.ontology_util import OntologyUtil
+from semantic.ontology_index import OntologyIndex
+from semantic.single_flight import SingleFlight
 
 onto_ttl = "./core-ontology.ttl"
-onto_path = "./core-ontology.rdf"
-onto = load_from_path(onto_path)
-onto_util = OntologyUtil(onto)
+onto_path = os.getenv("ONTOLOGY_PATH", "./core-ontology.rdf")
+onto_world_dir = os.getenv("ONTOLOGY_WORLD_DIR")
 
-classification_cache = ClassificationCache()
+if onto_world_dir:
+    onto = load_from_world(onto_path, onto_world_dir)
+else:
+    onto = load_from_path(onto_path)
+onto_version = ontology_version_of_path(onto_path)
+onto_index = OntologyIndex(onto)
 
-root_areas = onto_util.list_root_entities(onto.Area)
-root_abilities = onto_util.list_root_entities(onto.Ability)
-root_scopes = onto_util.list_root_entities(onto.Scope)
+classification_cache_path = os.getenv("CLASSIFICATION_CACHE_PATH")
+classification_cache_max_entries = int(os.getenv("CLASSIFICATION_CACHE_MAX_ENTRIES", "1024"))
+
+if classification_cache_path:
+    # Shared by all workers on this host and kept across restarts
+    classification_cache = ClassificationCache(store=SqliteClassificationStore(
+        classification_cache_path, max_entries=classification_cache_max_entries))
+else:
+    classification_cache = ClassificationCache(max_entries=classification_cache_max_entries)
+
+STRATEGY_SPLIT_GEMINI_V1 = "split-gemini-v1"
+STRATEGY_EMBEDDINGS_GEMINI_V1 = "embeddings-gemini-v1"
+
+classifier_max_concurrency = int(os.getenv("CLASSIFIER_MAX_CONCURRENCY", "12"))
+
+gemini_context_caching = os.getenv("GEMINI_CONTEXT_CACHING", "false").lower() == "true"
+
+# Taxonomy matching of the embeddings strategy descends the hierarchy with this beam width if set.
+# Scoring every entry is faster for taxonomies of the current size, see HierarchicalMatcher.
+embedding_beam_width = int(os.getenv("EMBEDDING_BEAM_WIDTH")) if os.getenv("EMBEDDING_BEAM_WIDTH") else None
+
+classifier_registry = ClassifierRegistry(onto_index, onto_version)
+classifier_registry.register(
+    STRATEGY_SPLIT_GEMINI_V1,
+    lambda ontology, version: MergedClassifier(
+        ClassifierSplitGeminiWithSerializedTaxonomiesV1(
+            ontology, ontology_version=version, context_caching=gemini_context_caching),
+        concurrent=True,
+        max_workers=classifier_max_concurrency))
+classifier_registry.register(
+    STRATEGY_EMBEDDINGS_GEMINI_V1,
+    lambda ontology, version: ClassifierEmbeddingsGemini(
+        ontology, ontology_version=version, context_caching=gemini_context_caching,
+        beam_width=embedding_beam_width))
+
+classification_strategy = STRATEGY_SPLIT_GEMINI_V1
+
+gemini_file_registry = GeminiFileRegistry()
+
+# Concurrent requests for the same content share one classification
+classification_flights = SingleFlight()
+
+# Bounds how many files of batch requests are classified at once, shared by all batch requests
+classify_batch_max_concurrency = int(os.getenv("CLASSIFY_BATCH_MAX_CONCURRENCY", "4"))
+classify_batch_max_files = int(os.getenv("CLASSIFY_BATCH_MAX_FILES", "100"))
+classify_batch_executor = ThreadPoolExecutor(
+    max_workers=classify_batch_max_concurrency, thread_name_prefix="classify-batch")
+
+classification_jobs = ClassificationJobs(
+    ClassificationJobStore(os.getenv("CLASSIFICATION_JOBS_PATH", "./jobs/classification-jobs.sqlite3")),
+    lambda content_digest, content, mime_type: classify_job(content_digest, content, mime_type),
+    max_workers=int(os.getenv("CLASSIFICATION_JOBS_MAX_WORKERS", "4")),
+    max_queued=int(os.getenv("CLASSIFICATION_JOBS_MAX_QUEUED", "100")))
+
+root_areas = onto_index.root_nodes("Area")
+root_abilities = onto_index.root_nodes("Ability")
+root_scopes = onto_index.root_nodes("Scope")
+
+# The serialized ontology only changes with the ontology version
+ontology_responses = {}
+
+
+def warm_up():
+    ontology_responses[onto_version] = build_ontology_response()
+    classifier_registry.warm_up([classification_strategy])
+    app.logger.info('classifier %s warmed up for ontology %s', classification_strategy, onto_version)
+
+
+def start_background_tasks():
+    classification_cache.start_sweeper()
+    gemini_file_registry.start_sweeper()
+    classification_jobs.start_sweeper()
+    resumed_jobs = classification_jobs.resume()
+    if resumed_jobs > 0:
+        app.logger.info('resumed %d unfinished classification jobs', resumed_jobs)
 
 
 @app.route("/")
@@ -34,69 +117,188 @@ def root():
     return "OK"
 
 
+@app.route("/ready")
+def ready():
+    if not classifier_registry.warm:
+        return "WARMING UP", 503
+    return "OK"
+
+
 @app.route("/classify", methods=["POST"])
 def classify():
-    client = genai.Client()
-    request_name = request.values['name']
     request_file = request.files['file']
+    content_digest = digest_of_upload(request_file)
+    result = classify_upload(content_digest, request_file.stream, request_file.mimetype)
+    return app.response_class(result, mimetype="application/json")
+
+
+@app.route("/classify/batch", methods=["POST"])
+def classify_batch():
+    """
+    Classifies all files posted as 'file' and streams one NDJSON line per file as soon as its
+    classification is done, in completion order. Files with identical content are classified once.
+    """
+    request_files = request.files.getlist('file')
+    if len(request_files) == 0:
+        return "No files posted", 400
+    if len(request_files) > classify_batch_max_files:
+        return "At most {} files can be classified at once".format(classify_batch_max_files), 400
+
+    # The request closes its files as soon as this view returns, before the response is streamed,
+    # so the batch takes over their streams and closes them itself once the response is done
+    files_by_digest = {}
+    uploads = {}
+    streams = []
+    for request_file in request_files:
+        content_digest = digest_of_upload(request_file)
+        files_by_digest.setdefault(content_digest, []).append(request_file.filename)
+        uploads.setdefault(content_digest, (request_file.stream, request_file.mimetype))
+        streams.append(request_file.stream)
+        request_file.stream = io.BytesIO()
+
+    def close_uploads():
+        for stream in streams:
+            stream.close()
+
+    def generate():
+        futures = {
+            classify_batch_executor.submit(classify_upload_in_app_context, content_digest, stream, mime_type):
+                content_digest
+            for content_digest, (stream, mime_type) in uploads.items()
+        }
+        app.logger.info('batch classification of %d files (%d distinct) starting', len(request_files), len(futures))
+
+        try:
+            for future in as_completed(futures):
+                content_digest = futures[future]
+                try:
+                    line = {"result": json.loads(future.result())}
+                except Exception as e:
+                    app.logger.exception('batch classification of %s failed', content_digest)
+                    line = {"error": str(e)}
+                for filename in files_by_digest[content_digest]:
+                    yield json.dumps({"file": filename, "digest": content_digest, **line}) + "\n"
+        finally:
+            # If the client went away, files not started yet are skipped and the uploads are only
+            # closed once the running classifications are done with them
+            for future in futures:
+                future.cancel()
+            wait(futures)
+
+    response = app.response_class(stream_with_context(generate()), mimetype="application/x-ndjson")
+    response.call_on_close(close_uploads)
+    return response
+
+
+@app.route("/classify/jobs", methods=["POST"])
+def create_classification_job():
+    request_file = request.files['file']
+    content_digest = digest_of_upload(request_file)
+    try:
+        job_id = classification_jobs.create(content_digest, request_file.stream, request_file.mimetype)
+    except JobQueueFull:
+        return "Too many classification jobs, try again later", 503, {"Retry-After": "30"}
+    app.logger.info('classification job %s created', job_id)
+    return jsonify({"id": job_id, "status": classification_jobs.get(job_id)["status"]}), 202, \
+        {"Location": "/classify/jobs/{}".format(job_id)}
+
 
-    if request_name is None or request_name == '':
-        name = str(uuid4())
-    else:
-        name = request_name
+@app.route("/classify/jobs/<job_id>", methods=["GET"])
+def classification_job(job_id):
+    job = classification_jobs.get(job_id)
+    if job is None:
+        return "Unknown classification job", 404
 
-    name = str(ctypes.c_size_t(hash(name)).value)
+    response = {"id": job["id"], "status": job["status"]}
+    if job["result"] is not None:
+        response["result"] = json.loads(job["result"])
+    if job["error"] is not None:
+        response["error"] = job["error"]
+    return jsonify(response)
 
-    result = classification_cache.get(name)
+
+def classify_upload(content_digest, stream, mime_type):
+    """
+    Returns the serialized classification of an uploaded file, from the cache if possible.
+    """
+    cache_key = classification_cache_key(content_digest, classification_strategy, onto_version)
+    result = classification_cache.get(cache_key)
 
     if result is not None:
         app.logger.info('classification used from cache')
-    else:
+        return result
+
+    def classify_and_cache():
+        # A flight for the same content might have finished between the cache lookup and now,
+        # the miss of this request is already counted
+        cached_result = classification_cache.peek(cache_key)
+        if cached_result is not None:
+            return cached_result
+
         app.logger.info('classification starting')
-        mime_type = request_file.mimetype
+        file = gemini_file_registry.get_or_upload(content_digest, stream, mime_type)
 
-        file = None
-        try:
-            file = client.files.get(name=name)
-            app.logger.info('file %s retrieved from gemini', name)
-        except:
-            app.logger.info('file %s not in gemini', name)
-
-        if file is None:
-            file = client.files.upload(
-                file=BytesIO(request_file.stream.read()),
-                config=UploadFileConfig(
-                    name=name,
-                    mime_type=mime_type)
-            )
-            app.logger.info('file %s added to gemini', name)
-
-        classifier = MergedClassifier(ClassifierSplitGeminiWithSerializedTaxonomiesV1(onto))
-        #classifier = ClassifierEmbeddingsGemini(onto)
+        classifier = classifier_registry.get(classification_strategy)
         classification = classifier.classify_content(file)
-        classified_area = getattr(onto, classification["Area"][0])
+        classified_area = onto_index.node(classification["Area"][0])
 
-        result = jsonify({
-            "classification": {
-                "areas": serialize_entities_with_names(classification["Area"]),
-                "abilities": serialize_entities_with_names(classification["Ability"]),
-                "scopes": serialize_entities_with_names(classification["Scope"]),
-            },
-            "expansion": {
-                "areas": serialize_entity_tree_with_parent_relations([classified_area], "expandsArea", "partOfArea"),
-            }
-        })
+        classified_result = serialize_classification(classification, classified_area)
+        classification_cache.update(cache_key, classified_result)
+        return classified_result
 
-        classification_cache.update(name, result)
+    return classification_flights.do(cache_key, classify_and_cache)
 
-    return result
 
+def classify_upload_in_app_context(content_digest, stream, mime_type):
+    # For classifications running on background threads outside of a request
+    with app.app_context():
+        return classify_upload(content_digest, stream, mime_type)
 
-@app.route("/ontology", methods=["GET"])
-def ontology():
+
+def classify_job(content_digest, stream, mime_type):
+    # Jobs have no user waiting on the response, interactive requests go first
+    with call_priority(PRIORITY_BULK):
+        return classify_upload_in_app_context(content_digest, stream, mime_type)
+
+
+def serialize_classification(classification, classified_area):
+    return jsonify({
+        "classification": {
+            "areas": serialize_entities_with_names(classification["Area"]),
+            "abilities": serialize_entities_with_names(classification["Ability"]),
+            "scopes": serialize_entities_with_names(classification["Scope"]),
+        },
+        "expansion": {
+            "areas": serialize_entity_tree_with_parent_relations([classified_area], "expandsArea", "partOfArea"),
+        }
+    }).get_data()
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
     return jsonify({
+        "classification_cache": classification_cache.stats(),
+        "gemini_files": gemini_file_registry.stats(),
+        "classification_jobs": classification_jobs.stats(),
+        "classification_flights": classification_flights.stats(),
+        "gemini_calls": get_default_scheduler().stats()
+    })
+
+
+def build_ontology_response():
+    # Serialized without jsonify, which needs an app context that warm_up at startup does not have
+    return PrecomputedResponse(app.json.dumps({
         "taxonomy": {
             "areas": serialize_entity_tree(root_areas, "hasPartArea"),
             "abilities": serialize_entity_tree(root_abilities, "hasPartAbility"),
             "scopes": serialize_entity_tree(root_scopes, "hasPartScope")
-        }})
+        }}).encode("utf-8"))
+
+
+@app.route("/ontology", methods=["GET"])
+def ontology():
+    ontology_response = ontology_responses.get(onto_version)
+    if ontology_response is None:
+        ontology_response = build_ontology_response()
+        ontology_responses[onto_version] = ontology_response
+    return ontology_response.respond(request)
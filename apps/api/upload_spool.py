@@ -0,0 +1,64 @@
+import hashlib
+import os
+from tempfile import SpooledTemporaryFile
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+ONE_MEGABYTE = 1024 * 1024
+
+# Uploads are kept in memory up to this size and spill over to a temporary file beyond it
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(ONE_MEGABYTE)))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(50 * ONE_MEGABYTE)))
+MAX_REQUEST_SIZE = int(os.getenv("MAX_REQUEST_SIZE", str(200 * ONE_MEGABYTE)))
+
+
+class DigestingSpooledFile(SpooledTemporaryFile):
+    """
+    A spooled temporary file that computes the SHA-256 digest of everything written to it and
+    rejects content beyond max_file_size as soon as the limit is crossed.
+    """
+
+    def __init__(self, spool_threshold=UPLOAD_SPOOL_THRESHOLD, max_file_size=MAX_UPLOAD_SIZE):
+        super().__init__(max_size=spool_threshold, mode="w+b")
+        self.max_file_size = max_file_size
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_file_size:
+            raise RequestEntityTooLarge(
+                "Uploaded files must not be larger than {} bytes".format(self.max_file_size))
+        self.digest.update(data)
+        return super().write(data)
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+class SpoolingRequest(Request):
+    """
+    Streams uploaded files through a DigestingSpooledFile while the multipart body is parsed, so
+    the content digest is known without reading the file a second time and memory per request
+    stays bounded by the spool threshold.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return DigestingSpooledFile()
+
+
+def digest_of_upload(file_storage):
+    """
+    Returns the SHA-256 hex digest of an uploaded file and rewinds its stream for forwarding.
+    """
+    stream = file_storage.stream
+    if isinstance(stream, DigestingSpooledFile):
+        digest = stream.hexdigest()
+    else:
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(ONE_MEGABYTE), b""):
+            digest.update(chunk)
+        digest = digest.hexdigest()
+    stream.seek(0)
+    return digest
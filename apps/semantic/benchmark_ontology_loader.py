@@ -0,0 +1,42 @@
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from semantic.ontology_loader import compile_world, world_path_of_ontology
+
+# Every load runs in a fresh interpreter, as owlready2 keeps loaded ontologies in its default world
+LOAD_SCRIPT = """
+import sys, time
+from semantic import ontology_loader
+started_at = time.perf_counter()
+onto = ontology_loader.{}(*sys.argv[1:])
+list(onto.classes())
+print(time.perf_counter() - started_at)
+"""
+
+
+def time_load(loader, *args):
+    output = subprocess.run([sys.executable, "-c", LOAD_SCRIPT.format(loader), *args],
+                            check=True, capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def benchmark(path, repeat=5):
+    with tempfile.TemporaryDirectory() as world_dir:
+        started_at = time.perf_counter()
+        compile_world(path, world_path_of_ontology(path, world_dir))
+        print(f"{path}: compiling the world once took {time.perf_counter() - started_at:.3f} s")
+
+        from_path = [time_load("load_from_path", path) for _ in range(repeat)]
+        from_world = [time_load("load_from_world", path, world_dir) for _ in range(repeat)]
+
+    print(f"parsing RDF:            median {statistics.median(from_path):.3f} s of {repeat} starts")
+    print(f"opening compiled world: median {statistics.median(from_world):.3f} s of {repeat} starts")
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("ONTOLOGY_PATH", "./core-ontology.rdf")
+    benchmark(path)
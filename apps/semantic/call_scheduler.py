@@ -0,0 +1,267 @@
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+
+from google.genai import errors
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Calls made while serving a user wait ahead of calls made for jobs and backfills
+current_priority = contextvars.ContextVar("current_priority", default=PRIORITY_INTERACTIVE)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+@contextlib.contextmanager
+def call_priority(priority):
+    """
+    Runs all scheduled calls made in the block (and in contexts copied from it) with the priority.
+    """
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def is_retryable(error):
+    return isinstance(error, errors.APIError) and error.code in RETRYABLE_STATUS_CODES
+
+
+def retry_after_of(error):
+    """
+    Returns the delay in seconds the service asked for, from the Retry-After header or the
+    RetryInfo detail of the error body, or None.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        retry_after = headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", details).get("details", [])
+    for detail in details if isinstance(details, list) else []:
+        retry_delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        if retry_delay is not None:
+            match = re.fullmatch(r"([0-9.]+)s", retry_delay)
+            if match:
+                return float(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """
+    Allows rate calls per second on average and bursts of up to burst calls.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def take(self):
+        """
+        Takes a token and returns 0, or returns how many seconds to wait until a token is available.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ModelLane:
+    """
+    The state the scheduler keeps for one model: its token bucket, its concurrency limit and its
+    queue of waiting calls ordered by priority and arrival.
+    """
+
+    def __init__(self, requests_per_minute, initial_concurrency, max_concurrency):
+        rate = requests_per_minute / 60.0
+        self.bucket = TokenBucket(rate, burst=max(1.0, rate))
+        self.limit = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.queue = []
+        self.condition = threading.Condition()
+
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+
+
+class CallScheduler:
+    """
+    Schedules calls to the Gemini API for all classifiers and embedding strategies of a process.
+
+    Per model, calls pass a token bucket of requests_per_minute and an adaptive concurrency limit
+    (additive increase while calls are fast, multiplicative decrease on 429 or slow responses).
+    Waiting calls are served by priority first (see call_priority) and in arrival order second.
+    Retryable failures are retried with full-jitter exponential backoff; a delay requested by
+    the service pauses all calls to the model for that long, but at most max_delay.
+    """
+
+    def __init__(self, requests_per_minute=None, default_requests_per_minute=1000, initial_concurrency=4,
+                 max_concurrency=32, latency_target=30.0, max_attempts=5, base_delay=1.0, max_delay=60.0):
+        """
+        Args:
+            requests_per_minute (dict): The rate limits by model name.
+            default_requests_per_minute (float): The rate limit of models not listed.
+            initial_concurrency (int): The number of concurrent calls per model to start with.
+            max_concurrency (int): The upper bound of concurrent calls per model.
+            latency_target (float): Calls slower than this many seconds reduce the concurrency.
+            max_attempts (int): How often a call is tried before its error is raised.
+            base_delay (float): The backoff of the first retry in seconds, doubled with every retry.
+            max_delay (float): The upper bound of the backoff and of the delays the service asks for
+                               in seconds.
+        """
+        self.requests_per_minute = requests_per_minute or {}
+        self.default_requests_per_minute = default_requests_per_minute
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.lanes = {}
+        self.lock = threading.Lock()
+        self.sequence = itertools.count()
+
+    def __lane(self, model):
+        lane = self.lanes.get(model)
+        if lane is None:
+            with self.lock:
+                lane = self.lanes.get(model)
+                if lane is None:
+                    lane = ModelLane(self.requests_per_minute.get(model, self.default_requests_per_minute),
+                                     min(self.initial_concurrency, self.max_concurrency), self.max_concurrency)
+                    self.lanes[model] = lane
+        return lane
+
+    def __acquire(self, lane):
+        ticket = (current_priority.get(), next(self.sequence))
+        with lane.condition:
+            heapq.heappush(lane.queue, ticket)
+            try:
+                while True:
+                    wait = None
+                    if lane.queue[0] == ticket and lane.in_flight < int(lane.limit):
+                        wait = lane.paused_until - time.monotonic()
+                        if wait <= 0:
+                            wait = lane.bucket.take()
+                            if wait == 0:
+                                break
+                    lane.condition.wait(wait)
+            finally:
+                lane.queue.remove(ticket)
+                heapq.heapify(lane.queue)
+                lane.condition.notify_all()
+            lane.in_flight += 1
+            lane.calls += 1
+
+    def __release(self, lane, latency=None, throttled=False, retry_after=None):
+        with lane.condition:
+            lane.in_flight -= 1
+            if throttled:
+                lane.throttled += 1
+                lane.limit = max(1.0, lane.limit / 2)
+                if retry_after is not None:
+                    lane.paused_until = max(lane.paused_until, time.monotonic() + retry_after)
+            elif latency is not None:
+                if latency > self.latency_target:
+                    lane.limit = max(1.0, lane.limit * 0.9)
+                else:
+                    lane.limit = min(lane.max_concurrency, lane.limit + 1 / lane.limit)
+            lane.condition.notify_all()
+
+    def __backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, model, fn, /, *args, **kwargs):
+        """
+        Calls fn(*args, **kwargs) as a call to the model once the scheduler admits it and returns
+        its result, retrying retryable errors.
+        """
+        lane = self.__lane(model)
+        for attempt in range(self.max_attempts):
+            self.__acquire(lane)
+            started_at = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_attempts - 1:
+                    self.__release(lane)
+                    raise
+                retry_after = retry_after_of(e)
+                if retry_after is not None:
+                    # A huge or bogus delay must not block the calling threads for longer than any backoff
+                    retry_after = min(max(retry_after, 0.0), self.max_delay)
+                self.__release(lane, throttled=e.code == 429, retry_after=retry_after)
+                with lane.condition:
+                    lane.retries += 1
+                time.sleep(retry_after if retry_after is not None else self.__backoff(attempt))
+                continue
+            self.__release(lane, latency=time.monotonic() - started_at)
+            return result
+
+    def stats(self):
+        with self.lock:
+            lanes = dict(self.lanes)
+        stats = {}
+        for model, lane in lanes.items():
+            with lane.condition:
+                stats[model] = {
+                    "concurrency_limit": int(lane.limit),
+                    "in_flight": lane.in_flight,
+                    "queued": len(lane.queue),
+                    "calls": lane.calls,
+                    "throttled": lane.throttled,
+                    "retries": lane.retries,
+                }
+        return stats
+
+
+def requests_per_minute_of_env(value):
+    # e.g. "gemini-2.0-flash=2000,embedding-001=1500"
+    requests_per_minute = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        model, rate = entry.split("=")
+        requests_per_minute[model.strip()] = float(rate)
+    return requests_per_minute
+
+
+default_scheduler = None
+default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler():
+    """
+    Returns the scheduler shared by all strategies of the process, configured from the environment.
+    """
+    global default_scheduler
+    with default_scheduler_lock:
+        if default_scheduler is None:
+            default_scheduler = CallScheduler(
+                requests_per_minute=requests_per_minute_of_env(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "")),
+                default_requests_per_minute=float(os.getenv("GEMINI_DEFAULT_REQUESTS_PER_MINUTE", "1000")),
+                max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "32")),
+            )
+        return default_scheduler
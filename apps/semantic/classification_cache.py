@@ -1,25 +1,188 @@
+import hashlib
+import threading
+from abc import ABC, abstractmethod
 import time
+from collections import OrderedDict
 
 ONE_HOUR = 60 * 60.0
+ONE_MINUTE = 60.0
 
 
-class ClassificationCache:
+def classification_cache_key(content_digest, strategy, ontology_version):
+    """
+    Builds a cache key that is stable across processes and restarts: the same content classified
+    by the same strategy against the same ontology version always maps to the same key.
+    """
+    key_source = "\n".join([content_digest, strategy, ontology_version])
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+class ClassificationStore(ABC):
+    """
+    The storage backend of a ClassificationCache. Stores are responsible for expiring entries
+    after their TTL and for bounding their size.
+    """
+
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def put(self, key, value):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def sweep(self) -> int:
+        pass
+
+    @abstractmethod
+    def stats(self) -> dict:
+        pass
 
-    def __init__(self, expires=ONE_HOUR):
-        self.cached_results = {}
+    def close(self):
+        pass
+
+
+class MemoryClassificationStore(ClassificationStore):
+    """
+    A thread-safe in-memory store that evicts entries after they expire and, once max_entries
+    is reached, evicts the least recently used entry.
+    """
+
+    def __init__(self, expires=ONE_HOUR, max_entries=1024):
+        self.cached_results = OrderedDict()
         self.expires = expires
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+        self.evictions = 0
+        self.expirations = 0
 
     def get(self, key):
-        if key in self.cached_results:
-            timestamp, value = self.cached_results[key]
-            if time.time() - timestamp < self.expires:
-                return value
+        with self.lock:
+            if key in self.cached_results:
+                timestamp, value = self.cached_results[key]
+                if time.time() - timestamp < self.expires:
+                    self.cached_results.move_to_end(key)
+                    return value
+                else:
+                    del self.cached_results[key]  # Remove expired entry
+                    self.expirations += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.cached_results[key] = (time.time(), value)
+            self.cached_results.move_to_end(key)
+            while len(self.cached_results) > self.max_entries:
+                self.cached_results.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.cached_results.pop(key, None)
+
+    def sweep(self):
+        now = time.time()
+        with self.lock:
+            expired_keys = [key for key, (timestamp, _) in self.cached_results.items()
+                            if now - timestamp >= self.expires]
+            for key in expired_keys:
+                del self.cached_results[key]
+            self.expirations += len(expired_keys)
+        return len(expired_keys)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.cached_results),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class ClassificationCache:
+    """
+    Caches classification results in a ClassificationStore (in memory by default) and keeps
+    track of hits and misses.
+    """
+
+    def __init__(self, expires=ONE_HOUR, max_entries=1024, store=None):
+        if store is None:
+            store = MemoryClassificationStore(expires, max_entries)
+        self.store = store
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        self.sweeper = None
+        self.sweeper_stopped = threading.Event()
+
+    def get(self, key):
+        value = self.store.get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
             else:
-                del self.cached_results[key]  # Remove expired entry
-        return None
+                self.hits += 1
+        return value
+
+    def peek(self, key):
+        """
+        Looks up a value like get() without counting a hit or miss, e.g. for checking again a key
+        whose lookup was already counted.
+        """
+        return self.store.get(key)
 
     def update(self, key, value):
-        self.cached_results[key] = (time.time(), value)
+        self.store.put(key, value)
 
     def timeout(self, key):
-        self.cached_results[key] = None
+        self.store.delete(key)
+
+    def sweep(self):
+        """
+        Removes all expired entries and returns how many were removed.
+        """
+        return self.store.sweep()
+
+    def start_sweeper(self, interval=ONE_MINUTE):
+        """
+        Starts a daemon thread that sweeps expired entries every interval seconds.
+        """
+        if self.sweeper is not None:
+            return
+        self.sweeper_stopped.clear()
+
+        def run():
+            while not self.sweeper_stopped.wait(interval):
+                self.sweep()
+
+        self.sweeper = threading.Thread(target=run, name="classification-cache-sweeper", daemon=True)
+        self.sweeper.start()
+
+    def stop_sweeper(self):
+        if self.sweeper is None:
+            return
+        self.sweeper_stopped.set()
+        self.sweeper.join()
+        self.sweeper = None
+
+    def close(self):
+        self.stop_sweeper()
+        self.store.close()
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+        stats.update(self.store.stats())
+        return stats
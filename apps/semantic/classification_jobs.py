@@ -0,0 +1,303 @@
+import datetime
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+ONE_DAY = datetime.timedelta(days=1)
+TEN_MINUTES = datetime.timedelta(minutes=10)
+ONE_MINUTE = datetime.timedelta(minutes=1)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS classification_jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    content_digest TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    result BLOB,
+    error TEXT,
+    worker_id TEXT,
+    lease_expires_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS classification_jobs_status ON classification_jobs (status);
+"""
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class ClassificationJobStore:
+    """
+    Persists classification jobs in a local SQLite file and their uploaded contents in a directory
+    next to it, one file per content digest, so that unfinished jobs can be picked up again after
+    a restart.
+
+    A job is claimed by the store instance that runs it, identified by an id generated when the
+    store is opened, so a restarted process never mistakes jobs of its predecessor for its own.
+    Claiming is a conditional update, so when several worker processes share the store, each job
+    runs in only one of them. A claim is a lease that its instance renews while the job runs. Jobs
+    whose lease ran out were left behind by a process that is gone and can be requeued.
+    """
+
+    def __init__(self, path, lease=ONE_MINUTE):
+        self.path = path
+        self.content_dir = path + ".contents"
+        os.makedirs(self.content_dir, exist_ok=True)
+        self.instance_id = uuid.uuid4().hex
+        self.lease = lease.total_seconds()
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def __content_path(self, content_digest):
+        return os.path.join(self.content_dir, content_digest)
+
+    def create(self, content_digest, content, mime_type):
+        """
+        Stores the content (a binary file-like object) and a pending job for it and returns the job id.
+        """
+        content_path = self.__content_path(content_digest)
+        temp_path = "{}.{}.tmp".format(content_path, uuid.uuid4().hex)
+        with open(temp_path, "wb") as f:
+            shutil.copyfileobj(content, f)
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            # Under the lock, so a finishing job of the same content cannot remove it in between
+            os.replace(temp_path, content_path)
+            self.connection.execute(
+                "INSERT INTO classification_jobs (id, status, content_digest, mime_type, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (job_id, JOB_PENDING, content_digest, mime_type, now, now))
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT id, status, content_digest, mime_type, result, error, created_at, updated_at "
+                "FROM classification_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ["id", "status", "content_digest", "mime_type", "result", "error", "created_at", "updated_at"]
+        return dict(zip(keys, row))
+
+    def claim(self, job_id):
+        """
+        Marks a pending job as running in this store instance. Returns False if the job is gone or
+        already claimed.
+        """
+        now = time.time()
+        with self.lock:
+            return self.connection.execute(
+                "UPDATE classification_jobs SET status = ?, worker_id = ?, lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = ?",
+                (JOB_RUNNING, self.instance_id, now + self.lease, now, job_id, JOB_PENDING)
+            ).rowcount == 1
+
+    def renew_leases(self):
+        """
+        Extends the leases of all jobs running in this store instance and returns their number.
+        """
+        with self.lock:
+            return self.connection.execute(
+                "UPDATE classification_jobs SET lease_expires_at = ? WHERE status = ? AND worker_id = ?",
+                (time.time() + self.lease, JOB_RUNNING, self.instance_id)).rowcount
+
+    def open_content(self, job):
+        return open(self.__content_path(job["content_digest"]), "rb")
+
+    def complete(self, job_id, result):
+        self.__finish(job_id, JOB_DONE, result=result)
+
+    def fail(self, job_id, error):
+        self.__finish(job_id, JOB_FAILED, error=error)
+
+    def __finish(self, job_id, status, result=None, error=None):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE classification_jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id))
+            content_digest = self.connection.execute(
+                "SELECT content_digest FROM classification_jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            still_needed = self.connection.execute(
+                "SELECT COUNT(*) FROM classification_jobs WHERE content_digest = ? AND status IN (?, ?)",
+                (content_digest, JOB_PENDING, JOB_RUNNING)).fetchone()[0] > 0
+            if not still_needed:
+                try:
+                    os.remove(self.__content_path(content_digest))
+                except FileNotFoundError:
+                    pass
+
+    def requeue_orphaned(self):
+        """
+        Sets running jobs whose lease ran out back to pending and returns their ids.
+        """
+        now = time.time()
+        with self.lock:
+            orphaned = [row[0] for row in self.connection.execute(
+                "SELECT id FROM classification_jobs WHERE status = ? "
+                "AND (lease_expires_at IS NULL OR lease_expires_at < ?)", (JOB_RUNNING, now))]
+            for job_id in orphaned:
+                self.connection.execute(
+                    "UPDATE classification_jobs SET status = ?, worker_id = NULL, lease_expires_at = NULL, "
+                    "updated_at = ? WHERE id = ? AND status = ?", (JOB_PENDING, now, job_id, JOB_RUNNING))
+        return orphaned
+
+    def pending(self):
+        with self.lock:
+            return [row[0] for row in self.connection.execute(
+                "SELECT id FROM classification_jobs WHERE status = ? ORDER BY created_at", (JOB_PENDING,))]
+
+    def purge(self, older_than):
+        """
+        Removes finished jobs that were last updated more than older_than seconds ago.
+        """
+        with self.lock:
+            return self.connection.execute(
+                "DELETE FROM classification_jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (JOB_DONE, JOB_FAILED, time.time() - older_than)).rowcount
+
+    def counts(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT status, COUNT(*) FROM classification_jobs GROUP BY status").fetchall()
+        counts = {JOB_PENDING: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class ClassificationJobs:
+    """
+    Runs classification jobs from a ClassificationJobStore on a bounded pool of worker threads.
+
+    The handler is called as handler(content_digest, content, mime_type) and returns the serialized
+    classification. At most max_workers jobs run at once and at most max_queued jobs of this process
+    are waiting or running; beyond that create() raises JobQueueFull. Finished jobs are kept for
+    retention before they are purged.
+
+    The sweeper renews the leases of running jobs and picks up jobs whose lease ran out, e.g. those
+    of a process that crashed while this one is running.
+    """
+
+    def __init__(self, store, handler, max_workers=4, max_queued=100, retention=ONE_DAY):
+        self.store = store
+        self.handler = handler
+        self.max_queued = max_queued
+        self.retention = retention.total_seconds()
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="classification-job")
+        self.lock = threading.Lock()
+        self.queued = 0
+
+        self.sweeper = None
+        self.sweeper_stopped = threading.Event()
+
+    def create(self, content_digest, content, mime_type):
+        with self.lock:
+            if self.queued >= self.max_queued:
+                raise JobQueueFull("Too many classification jobs are waiting")
+            self.queued += 1
+        try:
+            job_id = self.store.create(content_digest, content, mime_type)
+        except BaseException:
+            with self.lock:
+                self.queued -= 1
+            raise
+        self.executor.submit(self.__run, job_id)
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def resume(self):
+        """
+        Picks up jobs left unfinished by a previous run. Returns how many jobs were resumed.
+        """
+        self.store.requeue_orphaned()
+        job_ids = self.store.pending()
+        self.__submit(job_ids)
+        return len(job_ids)
+
+    def __submit(self, job_ids):
+        with self.lock:
+            self.queued += len(job_ids)
+        for job_id in job_ids:
+            self.executor.submit(self.__run, job_id)
+
+    def __run(self, job_id):
+        try:
+            if not self.store.claim(job_id):
+                return
+            job = self.store.get(job_id)
+            try:
+                with self.store.open_content(job) as content:
+                    result = self.handler(job["content_digest"], content, job["mime_type"])
+                self.store.complete(job_id, result)
+            except Exception as e:
+                logger.exception("Classification job %s failed", job_id)
+                self.store.fail(job_id, str(e))
+        finally:
+            with self.lock:
+                self.queued -= 1
+
+    def start_sweeper(self, interval=TEN_MINUTES):
+        if self.sweeper is not None:
+            return
+        self.sweeper_stopped.clear()
+
+        def run():
+            purged_at = time.monotonic()
+            # Leases are renewed well before they run out
+            while not self.sweeper_stopped.wait(self.store.lease / 3):
+                try:
+                    self.store.renew_leases()
+                    orphaned = self.store.requeue_orphaned()
+                    if len(orphaned) > 0:
+                        logger.info("Requeued %d orphaned classification jobs", len(orphaned))
+                        self.__submit(orphaned)
+                    if time.monotonic() - purged_at >= interval.total_seconds():
+                        self.store.purge(self.retention)
+                        purged_at = time.monotonic()
+                except sqlite3.Error:
+                    logger.exception("Maintaining classification jobs failed")
+
+        self.sweeper = threading.Thread(target=run, name="classification-jobs-sweeper", daemon=True)
+        self.sweeper.start()
+
+    def stop_sweeper(self):
+        if self.sweeper is None:
+            return
+        self.sweeper_stopped.set()
+        self.sweeper.join()
+        self.sweeper = None
+
+    def stats(self):
+        with self.lock:
+            queued = self.queued
+        return {"queued": queued, **self.store.counts()}
+
+    def close(self):
+        self.stop_sweeper()
+        self.executor.shutdown(wait=True)
+        self.store.close()
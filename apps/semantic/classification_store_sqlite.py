@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import threading
+import time
+
+from semantic.classification_cache import ClassificationStore, ONE_HOUR
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS classification_results (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS classification_results_expires_at ON classification_results (expires_at);
+CREATE INDEX IF NOT EXISTS classification_results_created_at ON classification_results (created_at);
+"""
+
+
+class SqliteClassificationStore(ClassificationStore):
+    """
+    A ClassificationStore in a local SQLite file that all worker processes on a host can share
+    and that survives restarts.
+
+    The database runs in WAL mode so that reads never wait for writes. Every thread reads through
+    its own connection without taking a Python lock. Writes are buffered and flushed in a single
+    transaction once batch_size entries are pending or every flush_interval seconds. Pending
+    writes are visible to reads of the same process right away. Entries expire through their
+    expires_at column and, once max_entries is exceeded, the oldest entries are evicted first.
+    """
+
+    def __init__(self, path, expires=ONE_HOUR, max_entries=100_000, batch_size=32, flush_interval=1.0):
+        self.path = path
+        self.expires = expires
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self.pending = {}
+        self.evictions = 0
+        self.expirations = 0
+
+        self.writer = self.__connect()
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.writer.executescript(SCHEMA)
+
+        self.closed = threading.Event()
+        self.flusher = threading.Thread(target=self.__flush_periodically, args=(flush_interval,),
+                                        name="classification-store-flusher", daemon=True)
+        self.flusher.start()
+
+    def __connect(self):
+        connection = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def __reader(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.__connect()
+            self.local.connection = connection
+        return connection
+
+    def get(self, key):
+        now = time.time()
+
+        entry = self.pending.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            return value if expires_at > now else None
+
+        row = self.__reader().execute(
+            "SELECT value FROM classification_results WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, key, value):
+        with self.write_lock:
+            self.pending[key] = (value, time.time() + self.expires)
+            if len(self.pending) >= self.batch_size:
+                self.__flush_locked()
+
+    def delete(self, key):
+        with self.write_lock:
+            self.pending.pop(key, None)
+            self.writer.execute("DELETE FROM classification_results WHERE key = ?", (key,))
+
+    def flush(self):
+        with self.write_lock:
+            self.__flush_locked()
+
+    def __flush_locked(self):
+        if len(self.pending) == 0:
+            return
+
+        now = time.time()
+        rows = [(key, value, now, expires_at) for key, (value, expires_at) in self.pending.items()]
+
+        self.writer.execute("BEGIN IMMEDIATE")
+        try:
+            self.writer.executemany(
+                "INSERT OR REPLACE INTO classification_results (key, value, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?)", rows)
+            overflow = self.writer.execute("SELECT COUNT(*) FROM classification_results").fetchone()[0] \
+                - self.max_entries
+            if overflow > 0:
+                self.writer.execute(
+                    "DELETE FROM classification_results WHERE key IN "
+                    "(SELECT key FROM classification_results ORDER BY created_at LIMIT ?)", (overflow,))
+                self.evictions += overflow
+            self.writer.execute("COMMIT")
+        except BaseException:
+            self.writer.execute("ROLLBACK")
+            raise
+
+        self.pending = {}
+
+    def __flush_periodically(self, interval):
+        while not self.closed.wait(interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Error flushing classification results to '{self.path}': {e}")
+
+    def sweep(self):
+        self.flush()
+        with self.write_lock:
+            removed = self.writer.execute(
+                "DELETE FROM classification_results WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+            self.expirations += removed
+        return removed
+
+    def stats(self):
+        # Counted under the write lock, so no flush moves pending entries into the table meanwhile
+        with self.write_lock:
+            pending_keys = list(self.pending.keys())
+            entries = self.writer.execute("SELECT COUNT(*) FROM classification_results").fetchone()[0]
+            # Pending writes that replace a stored entry are already counted
+            if len(pending_keys) > 0:
+                entries -= self.writer.execute(
+                    "SELECT COUNT(*) FROM classification_results WHERE key IN ({})".format(
+                        ",".join("?" * len(pending_keys))),
+                    pending_keys).fetchone()[0]
+        return {
+            "entries": entries + len(pending_keys),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def close(self):
+        self.closed.set()
+        self.flusher.join()
+        self.flush()
+        self.writer.close()
@@ -0,0 +1,320 @@
+import datetime
+import json
+import os
+import tempfile
+import time
+import typing
+import uuid
+
+from google import genai
+from google.genai import types
+
+DIMENSIONS = ["Area", "Ability", "Scope"]
+
+ONE_MINUTE = datetime.timedelta(minutes=1)
+
+FINISHED_JOB_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+FAILED_JOB_STATES = {"JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+REQUEST_INDEX_LABEL = "request_index"
+
+
+class BatchJobFailed(Exception):
+    pass
+
+
+class GeminiBatchBackend:
+    """
+    Runs generate_content requests as a Gemini batch prediction job on Vertex AI.
+
+    The google-genai version this project depends on supports batch jobs only on Vertex AI,
+    reading the requests from and writing the responses to Cloud Storage. The requests of a job
+    are written as JSONL to the bucket, every request labeled with its position, as the output is
+    not in the order of the input. The client must be a Vertex AI client (GOOGLE_GENAI_USE_VERTEXAI,
+    GOOGLE_CLOUD_PROJECT and GOOGLE_CLOUD_LOCATION) and files must be referenced by gs:// URIs.
+    """
+
+    def __init__(self, bucket, client=None, prefix="batch-classification"):
+        """
+        Args:
+            bucket: The google.cloud.storage bucket for the requests and responses of the jobs.
+            client: A google.genai client for Vertex AI.
+            prefix (str): The folder in the bucket to keep the jobs in.
+        """
+        self.bucket = bucket
+        self.client = genai.Client(vertexai=True) if client is None else client
+        self.prefix = prefix
+
+    def submit(self, model, requests, display_name):
+        """
+        Submits a list of (contents, config) requests as one batch job and returns the job name.
+        """
+        # Jobs submitted within the same second share their display name
+        job_prefix = "{}/{}-{}".format(self.prefix, display_name, uuid.uuid4().hex[:8])
+        lines = [json.dumps({"request": request_of(contents, config, index)})
+                 for index, (contents, config) in enumerate(requests)]
+        self.bucket.blob(job_prefix + "/requests.jsonl").upload_from_string(
+            "\n".join(lines) + "\n", content_type="application/jsonl")
+
+        job = self.client.batches.create(
+            model=model,
+            src="gs://{}/{}/requests.jsonl".format(self.bucket.name, job_prefix),
+            config=types.CreateBatchJobConfig(
+                display_name=display_name,
+                dest="gs://{}/{}/responses".format(self.bucket.name, job_prefix),
+            ),
+        )
+        return job.name
+
+    def poll(self, job_name, request_count):
+        """
+        Returns None while the job is running. Once it is done, returns one (response_text, error)
+        pair for each of the request_count requests, in the order of the submitted requests.
+        """
+        job = self.client.batches.get(name=job_name)
+        state = job.state.name
+        if state in FAILED_JOB_STATES:
+            raise BatchJobFailed("Batch job {} ended with {}: {}".format(job_name, state, job.error))
+        if state not in FINISHED_JOB_STATES:
+            return None
+
+        results = {}
+        output_prefix = job.dest.gcs_uri.removeprefix("gs://{}/".format(self.bucket.name))
+        for blob in self.bucket.list_blobs(prefix=output_prefix):
+            if not blob.name.endswith("predictions.jsonl"):
+                continue
+            for line in blob.download_as_bytes().decode("utf-8").splitlines():
+                if line.strip() == "":
+                    continue
+                prediction = json.loads(line)
+                index = int(prediction["request"]["labels"][REQUEST_INDEX_LABEL])
+                if prediction.get("status") or "response" not in prediction:
+                    results[index] = (None, prediction.get("status") or "No response")
+                else:
+                    response = types.GenerateContentResponse.model_validate(prediction["response"])
+                    results[index] = (response.text, None)
+
+        # Requests the job left out of its output count as failed
+        return [results.get(index, (None, "No response")) for index in range(request_count)]
+
+
+class BatchClassifier:
+    """
+    Classifies many files offline with the requests of ClassifierSplitGeminiWithSerializedTaxonomiesV1,
+    submitted as batch jobs instead of one interactive call per file and dimension.
+
+    Submitted jobs and finished classifications are written to a JSON checkpoint after every
+    step. Running classify_files again with the same checkpoint polls the jobs that are still
+    running instead of submitting them again, and only submits what is neither classified nor
+    in flight yet, including requests that failed in a previous run.
+    """
+
+    def __init__(self, classifier, backend, checkpoint_path, max_batch_size=1000, poll_interval=ONE_MINUTE):
+        """
+        Args:
+            classifier: A ClassifierSplitGeminiWithSerializedTaxonomiesV1 to build requests and parse responses.
+            backend: A GeminiBatchBackend or an object with the same submit and poll methods.
+            checkpoint_path (str): The JSON file to keep the progress in.
+            max_batch_size (int): The maximum number of requests per batch job.
+            poll_interval (datetime.timedelta): How long to wait between polling running jobs.
+        """
+        self.classifier = classifier
+        self.backend = backend
+        self.checkpoint_path = checkpoint_path
+        self.max_batch_size = max_batch_size
+        self.poll_interval = poll_interval.total_seconds()
+        self.checkpoint = self.__load_checkpoint()
+
+    def __load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return {"jobs": {}, "classifications": {}, "errors": {}}
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def __save_checkpoint(self):
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.checkpoint, f)
+            os.replace(tmp_path, self.checkpoint_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def __open_requests(self, keys):
+        in_flight = {tuple(entry) for entries in self.checkpoint["jobs"].values() for entry in entries}
+        classifications = self.checkpoint["classifications"]
+        return [
+            (key, dimension) for key in keys for dimension in DIMENSIONS
+            if dimension not in classifications.get(key, {}) and (key, dimension) not in in_flight
+        ]
+
+    def submit(self, gemini_files):
+        """
+        Submits batch jobs for all files and dimensions that are neither classified nor in flight.
+
+        Args:
+            gemini_files (dict): Files to classify by a key of the caller's choice (e.g. a path).
+        """
+        open_requests = self.__open_requests(gemini_files.keys())
+        for start in range(0, len(open_requests), self.max_batch_size):
+            entries = open_requests[start:start + self.max_batch_size]
+            requests = [
+                self.classifier.build_request(dimension, file_part(gemini_files[key]), use_context_cache=False)
+                for key, dimension in entries
+            ]
+            job_name = self.backend.submit(self.classifier.model, requests,
+                                           "classification-{}".format(int(time.time())))
+            print(f"Submitted batch job {job_name} with {len(entries)} requests")
+            self.checkpoint["jobs"][job_name] = [list(entry) for entry in entries]
+            for key, dimension in entries:
+                self.checkpoint["errors"].get(key, {}).pop(dimension, None)
+            self.__save_checkpoint()
+
+    def poll(self):
+        """
+        Collects the results of all finished jobs. Returns the number of jobs still running.
+        """
+        for job_name, entries in list(self.checkpoint["jobs"].items()):
+            try:
+                results = self.backend.poll(job_name, len(entries))
+            except BatchJobFailed as e:
+                print(e)
+                results = [(None, str(e))] * len(entries)
+            if results is None:
+                continue
+
+            for (key, dimension), (response_text, error) in zip(entries, results):
+                if error is None:
+                    try:
+                        entity_names = self.classifier.entity_names_of_response(dimension, response_text)
+                        self.checkpoint["classifications"].setdefault(key, {})[dimension] = entity_names
+                        continue
+                    except Exception as e:
+                        error = "Could not parse response: {}".format(e)
+                self.checkpoint["errors"].setdefault(key, {})[dimension] = error
+
+            del self.checkpoint["jobs"][job_name]
+            self.__save_checkpoint()
+        return len(self.checkpoint["jobs"])
+
+    def classify_files(self, gemini_files):
+        """
+        Submits and polls until all jobs are done.
+
+        Returns:
+            The classifications of all completely classified files by key, and the errors of the
+            dimensions that failed by key.
+        """
+        self.submit(gemini_files)
+        while self.poll() > 0:
+            time.sleep(self.poll_interval)
+
+        classifications = {
+            key: classification for key, classification in self.checkpoint["classifications"].items()
+            if key in gemini_files and all(dimension in classification for dimension in DIMENSIONS)
+        }
+        errors = {
+            key: dimension_errors for key, dimension_errors in self.checkpoint["errors"].items()
+            if key in gemini_files and len(dimension_errors) > 0
+        }
+        return classifications, errors
+
+
+def file_part(gemini_file):
+    # Batch requests are serialized to JSON, so files are referenced by their URI
+    if isinstance(gemini_file, types.File):
+        return types.Part.from_uri(file_uri=gemini_file.uri, mime_type=gemini_file.mime_type)
+    return gemini_file
+
+
+def request_of(contents, config, index):
+    """
+    Serializes a generate_content request to the JSON of a line of a batch prediction input file.
+    """
+    if config.cached_content is not None:
+        raise ValueError("Batch requests cannot reference cached content")
+    generation_config = {
+        "candidateCount": config.candidate_count,
+        "temperature": config.temperature,
+        "responseMimeType": config.response_mime_type,
+        "responseSchema": schema_of(config.response_schema) if config.response_schema is not None else None,
+    }
+    return {
+        "contents": [{"role": "user", "parts": [part_of(content) for content in contents]}],
+        "generationConfig": {key: value for key, value in generation_config.items() if value is not None},
+        "labels": {REQUEST_INDEX_LABEL: str(index)},
+    }
+
+
+def part_of(content):
+    if isinstance(content, str):
+        return {"text": content}
+    return content.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+
+def schema_of(annotation):
+    """
+    Converts the response schemas of the classifiers (TypedDicts of strings and lists of strings)
+    to the OpenAPI schema of a generation config.
+    """
+    if annotation is str:
+        return {"type": "STRING"}
+    if typing.get_origin(annotation) is list:
+        return {"type": "ARRAY", "items": schema_of(typing.get_args(annotation)[0])}
+    if typing.is_typeddict(annotation):
+        properties = typing.get_type_hints(annotation)
+        return {
+            "type": "OBJECT",
+            "properties": {name: schema_of(value) for name, value in properties.items()},
+            "required": list(properties),
+            "propertyOrdering": list(properties),
+        }
+    raise ValueError("Unsupported response schema {}".format(annotation))
+
+
+if __name__ == "__main__":
+    import hashlib
+    import mimetypes
+    import sys
+
+    from dotenv import load_dotenv
+
+    from semantic.classifiers.strategies.classifier_split_gemini_with_serialized_taxonomies_v1 import \
+        ClassifierSplitGeminiWithSerializedTaxonomiesV1
+    from google.cloud import storage
+
+    from semantic.ontology_index import OntologyIndex
+    from semantic.ontology_loader import load_from_path
+
+    load_dotenv()
+
+    checkpoint_path = sys.argv[1]
+    material_dir = sys.argv[2]
+    bucket = storage.Client().bucket(sys.argv[3])
+
+    client = genai.Client(vertexai=True)
+    batch_classifier = BatchClassifier(
+        ClassifierSplitGeminiWithSerializedTaxonomiesV1(OntologyIndex(load_from_path("./core-ontology.rdf")),
+                                                        client=client),
+        GeminiBatchBackend(bucket, client),
+        checkpoint_path
+    )
+
+    # Vertex AI reads the materials from the bucket, stored by content digest so they are uploaded once
+    material_files = {}
+    for file_name in sorted(os.listdir(material_dir)):
+        material_path = os.path.join(material_dir, file_name)
+        mime_type = mimetypes.guess_type(material_path)[0]
+        with open(material_path, "rb") as f:
+            content = f.read()
+        blob = bucket.blob("batch-classification/materials/{}".format(hashlib.sha256(content).hexdigest()))
+        if not blob.exists():
+            blob.upload_from_string(content, content_type=mime_type)
+        material_files[material_path] = types.Part.from_uri(
+            file_uri="gs://{}/{}".format(bucket.name, blob.name), mime_type=mime_type)
+
+    material_classifications, material_errors = batch_classifier.classify_files(material_files)
+    print(json.dumps({"classifications": material_classifications, "errors": material_errors}, indent=2))
@@ -0,0 +1,65 @@
+import threading
+
+
+class ClassifierRegistry:
+    """
+    Builds each registered classifier once per ontology version and hands out the shared instance.
+
+    Classifiers are expensive to construct (serialized taxonomies, API clients, embedding stores)
+    but hold no per-request state, so one instance can safely serve all request threads.
+    """
+
+    def __init__(self, onto, ontology_version):
+        self.onto = onto
+        self.ontology_version = ontology_version
+        self.factories = {}
+        self.instances = {}
+        self.warm = False
+        self.lock = threading.Lock()
+
+    def register(self, name, factory):
+        """
+        Registers a factory that builds a classifier for an ontology version:
+        factory(onto, ontology_version) -> classifier
+        """
+        with self.lock:
+            self.factories[name] = factory
+
+    def get(self, name):
+        key = (name, self.ontology_version)
+        classifier = self.instances.get(key)
+        if classifier is not None:
+            return classifier
+
+        with self.lock:
+            # Another thread might have built the classifier while we were waiting for the lock
+            classifier = self.instances.get(key)
+            if classifier is None:
+                if name not in self.factories:
+                    raise KeyError("No classifier registered for '{}'".format(name))
+                classifier = self.factories[name](self.onto, self.ontology_version)
+                self.instances[key] = classifier
+            return classifier
+
+    def warm_up(self, names=None):
+        """
+        Builds the given classifiers (all registered ones by default) ahead of the first request.
+        """
+        if names is None:
+            names = list(self.factories.keys())
+        for name in names:
+            self.get(name)
+        self.warm = True
+
+    def update_ontology(self, onto, ontology_version):
+        """
+        Switches to another ontology version. Classifiers of the previous version are dropped
+        and rebuilt lazily (or by the next warm_up) for the new version.
+        """
+        with self.lock:
+            if ontology_version == self.ontology_version:
+                return
+            self.onto = onto
+            self.ontology_version = ontology_version
+            self.instances = {}
+            self.warm = False
@@ -1,12 +1,75 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ClassificationError(Exception):
+    """
+    Raised when at least one dimension could not be classified. The dimensions that succeeded
+    are still available in partial_classification.
+    """
+
+    def __init__(self, errors, partial_classification):
+        super().__init__("Classification failed for {}".format(", ".join(errors.keys())))
+        self.errors = errors
+        self.partial_classification = partial_classification
+
+
 class MergedClassifier:
 
-    def __init__(self, classifier):
+    def __init__(self, classifier, concurrent=False, max_workers=None):
+        """
+        Args:
+            classifier: A strategy providing classify_area, classify_ability and classify_scope.
+            concurrent (bool): Dispatch the three dimensions at once instead of one after another.
+            max_workers (int): The maximum number of dimension calls in flight across all requests
+                               sharing this classifier when running concurrently. Defaults to the
+                               ThreadPoolExecutor default.
+        """
         self.classifier = classifier
+        self.concurrent = concurrent
+        self.executor = None
+        if concurrent:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="merged-classifier")
+
+    def __dimension_classifiers(self):
+        return {
+            "Area": self.classifier.classify_area,
+            "Ability": self.classifier.classify_ability,
+            "Scope": self.classifier.classify_scope
+        }
 
     def classify_content(self, file):
+        if self.concurrent:
+            return self.__classify_concurrently(file)
+
         classification = {
             "Area": self.classifier.classify_area(file),
             "Ability": self.classifier.classify_ability(file),
             "Scope": self.classifier.classify_scope(file)
         }
         return classification
+
+    def __classify_concurrently(self, file):
+        # Each dimension runs in a copy of the caller's context, so it keeps e.g. the call priority
+        futures = {
+            dimension: self.executor.submit(contextvars.copy_context().run, classify, file)
+            for dimension, classify in self.__dimension_classifiers().items()
+        }
+
+        # A failing dimension does not cancel the others, all results are collected first
+        classification = {}
+        errors = {}
+        for dimension, future in futures.items():
+            try:
+                classification[dimension] = future.result()
+            except Exception as e:
+                errors[dimension] = e
+
+        if len(errors) > 0:
+            raise ClassificationError(errors, classification)
+
+        return classification
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
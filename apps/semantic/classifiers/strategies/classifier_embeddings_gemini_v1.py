@@ -3,6 +3,7 @@ from google.cloud import storage
 from dotenv import load_dotenv
 import json
 import io # Used for simulating file-like object from string
+import os
 
 import numpy as np
 
@@ -11,9 +12,16 @@ from pydantic import BaseModel
 from google import genai
 from google.genai import types
 
+from semantic.call_scheduler import get_default_scheduler
 from semantic.classifiers.context_builder import build_taxonomy
+from semantic.embeddings.embedding_store import EmbeddingStore, convert_ndjson_to_store
+from semantic.embeddings.hierarchical_matcher import HierarchicalMatcher
+from semantic.embeddings.similarity_index import SimilarityIndex
 from semantic.embeddings.strategies.embedding_strategy_gemini_v1 import GeminiEmbeddingStrategy
-from semantic.ontology_util import OntologyUtil
+from semantic.gemini_context_cache import GeminiContextCache, context_cache_name
+from semantic.ontology_index import OntologyIndex
+
+DEFAULT_EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "./embeddings")
 
 
 def load_ndjson_from_gcs(bucket_name: str, blob_name: str) -> list[dict]:
@@ -69,63 +77,28 @@ def load_ndjson_from_gcs(bucket_name: str, blob_name: str) -> list[dict]:
         print(f"An error occurred while loading from GCS: {e}")
         return []
 
-def load_taxonomy_embeddings(name):
+def load_taxonomy_embeddings_ndjson(name):
     bucket_name = "edugraph-embeddings"
     blob_name = "classification/zeroshot/embeddings-{}.json".format(name)
-    embedding_objects = load_ndjson_from_gcs(bucket_name, blob_name)
+    return load_ndjson_from_gcs(bucket_name, blob_name)
+
+def load_taxonomy_embeddings(name):
+    embedding_objects = load_taxonomy_embeddings_ndjson(name)
     embedding_tuples = map(lambda embedding: (embedding["name"], embedding["embedding"]), embedding_objects)
     embedding_map = dict(embedding_tuples)
     return embedding_map
 
-def cosine_similarity(embedding1, embedding2):
-    """
-    Calculates the cosine similarity between two embeddings.
-
-    Args:
-        embedding1 (np.array): The first embedding vector.
-        embedding2 (np.array): The second embedding vector.
-
-    Returns:
-        float: The cosine similarity between the two embeddings.
-               Ranges from -1 (completely dissimilar) to 1 (completely similar).
-    """
-    dot_product = np.dot(embedding1, embedding2)
-    norm_embedding1 = np.linalg.norm(embedding1)
-    norm_embedding2 = np.linalg.norm(embedding2)
-
-    if norm_embedding1 == 0 or norm_embedding2 == 0:
-        return 0.0  # Handle cases where one or both embeddings are zero vectors
-
-    return dot_product / (norm_embedding1 * norm_embedding2)
-
-def cosine_distance(embedding1, embedding2):
+def load_taxonomy_index(name, store_dir=DEFAULT_EMBEDDING_STORE_DIR) -> SimilarityIndex:
     """
-    Calculates a "cosine distance" from cosine similarity.
-    This is often defined as 1 - cosine_similarity.
-
-    Args:
-        embedding1 (np.array): The first embedding vector.
-        embedding2 (np.array): The second embedding vector.
-
-    Returns:
-        float: The cosine distance between the two embeddings.
-               Ranges from 0 (completely similar) to 2 (completely dissimilar).
+    Opens the memory-mapped embedding store of a taxonomy. The store is only built from the
+    NDJSON embeddings in GCS when it does not exist locally yet.
     """
-    return 1 - cosine_similarity(embedding1, embedding2)
-
+    store = EmbeddingStore(os.path.join(store_dir, name))
+    if not store.exists():
+        print(f"Embedding store '{store.path}' not found, converting from GCS")
+        convert_ndjson_to_store(load_taxonomy_embeddings_ndjson(name), store)
+    return store.open()
 
-def find_closest_embeddings(target_embedding, candidate_embeddings_dict):
-    results = []
-    for key, candidate_embedding in candidate_embeddings_dict.items():
-        distance = cosine_distance(target_embedding, candidate_embedding)
-        # Store the distance and the key (name)
-        results.append((distance, key))  # Store distance first for easy sorting
-
-    # Sort the results by distance (the first element of the tuple)
-    # The default sort order is ascending, which means smallest distance first.
-    results.sort(key=lambda x: x[0])
-
-    return results
 
 system_instruction = """
 You are presented with learning material that you shall describe using terms a provided taxonomy:
@@ -157,6 +130,10 @@ scope_description: Identify up to 10 scopes in the learning material and describ
 Make sure to not repeat yourself in your answers and primarily use terminology from the provided taxonomy.
 """
 
+cached_prompt = """
+Describe the provided learning material as instructed in the context, primarily using terminology from the taxonomy provided in the context.
+"""
+
 class PromptResponse(BaseModel):
     area: str
     abilities: list[str]
@@ -164,65 +141,100 @@ class PromptResponse(BaseModel):
 
 class ClassifierEmbeddingsGemini:
 
-    def __init__(self, onto):
-        self.onto = onto
-        self.onto_util = OntologyUtil(onto)
+    def __init__(self, onto_index: OntologyIndex, embedding_store_dir=DEFAULT_EMBEDDING_STORE_DIR,
+                 ontology_version=None, context_caching=False, client=None, scheduler=None,
+                 embedding_strategy=None, beam_width=None):
+        self.onto_index = onto_index
 
         self.model = 'gemini-2.0-flash'
-        self.client = genai.Client()
+        self.client = genai.Client() if client is None else client
+        self.scheduler = get_default_scheduler() if scheduler is None else scheduler
 
-        self.embedding_strategy = GeminiEmbeddingStrategy(self.client)
+        if embedding_strategy is None:
+            embedding_strategy = GeminiEmbeddingStrategy(self.client, scheduler=self.scheduler)
+        self.embedding_strategy = embedding_strategy
 
         self.prompt = prompt.format(
-            build_taxonomy("Areas", self.onto_util.list_root_entities(onto.Area)),
-            build_taxonomy("Abilities", self.onto_util.list_root_entities(onto.Ability)),
-            build_taxonomy("Scopes", self.onto_util.list_root_entities(onto.Scope)),
+            build_taxonomy("Areas", onto_index.root_nodes("Area")),
+            build_taxonomy("Abilities", onto_index.root_nodes("Ability")),
+            build_taxonomy("Scopes", onto_index.root_nodes("Scope")),
         )
 
         self.system_instruction = system_instruction
 
-        self.embedding_map_area = load_taxonomy_embeddings("Area")
-        self.embedding_map_ability = load_taxonomy_embeddings("Ability")
-        self.embedding_map_scope = load_taxonomy_embeddings("Scope")
+        # The taxonomy prompt and the system instruction are static and can be kept in cached content
+        self.context_cache = None
+        if context_caching:
+            if ontology_version is None:
+                raise ValueError("Context caching requires an ontology version")
+            self.context_cache = GeminiContextCache(
+                client=self.client,
+                name=context_cache_name("taxonomy-description", self.model, ontology_version),
+                model=self.model,
+                system_instruction=self.system_instruction,
+                content=[self.prompt],
+            )
+            self.context_cache.start_refresher()
 
+        self.embedding_index_area = load_taxonomy_index("Area", embedding_store_dir)
+        self.embedding_index_ability = load_taxonomy_index("Ability", embedding_store_dir)
+        self.embedding_index_scope = load_taxonomy_index("Scope", embedding_store_dir)
 
-    def describe_content(self, gemini_file):
+        # Optionally descend the taxonomy hierarchies instead of scoring every entry
+        if beam_width is not None:
+            self.embedding_index_area = HierarchicalMatcher.from_ontology_index(
+                onto_index, "Area", self.embedding_index_area, beam_width=beam_width)
+            self.embedding_index_ability = HierarchicalMatcher.from_ontology_index(
+                onto_index, "Ability", self.embedding_index_ability, beam_width=beam_width)
+            self.embedding_index_scope = HierarchicalMatcher.from_ontology_index(
+                onto_index, "Scope", self.embedding_index_scope, beam_width=beam_width)
 
-        result = self.client.models.generate_content(
+
+    def describe_content(self, gemini_file):
+        cached_content = None
+        if self.context_cache is not None:
+            cached_content = self.context_cache.get()
+
+        if cached_content is None:
+            contents = [gemini_file, self.prompt]
+            system_instruction = self.system_instruction
+        else:
+            contents = [gemini_file, cached_prompt]
+            system_instruction = None
+
+        result = self.scheduler.call(
+            self.model,
+            self.client.models.generate_content,
             model=self.model,
-            contents=[gemini_file, self.prompt],
+            contents=contents,
             config=types.GenerateContentConfig(
                 candidate_count=1,
                 temperature=0,
                 response_mime_type="application/json",
                 response_schema=PromptResponse,
-                system_instruction=self.system_instruction,
+                system_instruction=system_instruction,
+                cached_content=cached_content,
             )
         )
         result_obj = json.loads(result.text)
         return result_obj
 
-    def find_best_matches (self, targets, candidates):
-
-        embedding_targets = self.embedding_strategy.embed_entries(dict(enumerate(targets)))
-
-        best_matches = []
-        for embedding_target in embedding_targets.values():
-            best_match = find_closest_embeddings(embedding_target, candidates)[0][1]
-            best_matches.append(best_match)
-
-        return best_matches
-
-    def find_best_match (self, target, candidates):
-        target = self.embedding_strategy.embed_entry(target)
-        return find_closest_embeddings(target, candidates)[0][1]
-
     def classify_content(self, gemini_file):
         descriptions = self.describe_content(gemini_file)
 
-        closest_area = self.find_best_match(descriptions["area"], self.embedding_map_area)
-        closest_abilities = self.find_best_matches(descriptions["abilities"], self.embedding_map_ability)
-        closest_scopes = self.find_best_matches(descriptions["scopes"], self.embedding_map_scope)
+        # All descriptions are embedded in one batched call and split back per dimension
+        abilities = descriptions["abilities"]
+        scopes = descriptions["scopes"]
+        texts = [descriptions["area"]] + abilities + scopes
+        embeddings = np.asarray(
+            list(self.embedding_strategy.embed_entries(dict(enumerate(texts))).values()), dtype=np.float32)
+
+        ability_embeddings = embeddings[1:1 + len(abilities)]
+        scope_embeddings = embeddings[1 + len(abilities):]
+
+        closest_area = self.embedding_index_area.best_match(embeddings[0])
+        closest_abilities = self.embedding_index_ability.best_matches(ability_embeddings) if len(abilities) > 0 else []
+        closest_scopes = self.embedding_index_scope.best_matches(scope_embeddings) if len(scopes) > 0 else []
 
         print(closest_area)
         print(closest_abilities)
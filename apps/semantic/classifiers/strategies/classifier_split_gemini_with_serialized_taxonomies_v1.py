@@ -4,8 +4,11 @@ import typing
 from google import genai
 from google.genai import types
 
+from semantic.call_scheduler import get_default_scheduler
 from semantic.classifiers.context_builder import build_taxonomy
-from semantic.ontology_util import entity_name_of_natural_name, OntologyUtil
+from semantic.gemini_context_cache import GeminiContextCache, context_cache_name
+from semantic.ontology_index import OntologyIndex
+from semantic.ontology_util import entity_name_of_natural_name
 
 system_instruction = """
 You are presented with learning material that you shall classify using a given taxonomy.
@@ -121,6 +124,22 @@ Step 2: Consider the following taxonomy within "---" for classification:
 Step 3: Only using terms from the taxonomy, {2}. When responding the matched terms, respond without their index and description.
 """
 
+cached_single_prompt = """
+Step 1: {1}
+
+Step 2: Consider the taxonomy of {0} provided in the context for classification.
+
+Step 3: Only using terms from the taxonomy, {2}. When responding the matched term, respond without its index and description.
+"""
+
+cached_multi_prompt = """
+Step 1: {1}
+
+Step 2: Consider the taxonomy of {0} provided in the context for classification.
+
+Step 3: Only using terms from the taxonomy, {2}. When responding the matched terms, respond without their index and description.
+"""
+
 
 class PromptSingleResponse(typing.TypedDict):
     step_1: str
@@ -134,66 +153,131 @@ class PromptMultiResponse(typing.TypedDict):
 
 class ClassifierSplitGeminiWithSerializedTaxonomiesV1:
 
-    def __init__(self, onto):
-        onto_util = OntologyUtil(onto)
+    def __init__(self, onto_index: OntologyIndex, ontology_version=None, context_caching=False, client=None,
+                 scheduler=None):
+        """
+        Args:
+            onto_index (OntologyIndex): The ontology to classify against.
+            ontology_version (str): Identifies the ontology in the names of the context caches.
+            context_caching (bool): Keep the taxonomies in Gemini cached content instead of sending
+                                    them with every request. Requires ontology_version.
+            client (genai.Client): The client to use, a new one is created by default.
+            scheduler (CallScheduler): Schedules the calls to the model, the scheduler shared by the
+                                       process by default.
+        """
         self.model = 'gemini-2.0-flash'
-        self.client = genai.Client()
-        self.area_taxonomy = build_taxonomy("Areas", onto_util.list_root_entities(onto.Area))
-        self.ability_taxonomy = build_taxonomy("Abilities", onto_util.list_root_entities(onto.Ability))
-        self.scope_taxonomy = build_taxonomy("Scopes", onto_util.list_root_entities(onto.Scope))
-
-    def __find_best_match(self, taxonomy, priming_instruction, matching_instruction, gemini_file):
-        prompt = single_prompt.format(taxonomy, priming_instruction, matching_instruction)
-        result = self.client.models.generate_content(
-            model=self.model,
-            contents=[gemini_file, prompt],
-            config=types.GenerateContentConfig(
-                candidate_count=1,
-                temperature=0,
-                response_mime_type="application/json",
-                response_schema=PromptSingleResponse,
-            )
+        self.client = genai.Client() if client is None else client
+        self.scheduler = get_default_scheduler() if scheduler is None else scheduler
+        self.area_taxonomy = build_taxonomy("Areas", onto_index.root_nodes("Area"))
+        self.ability_taxonomy = build_taxonomy("Abilities", onto_index.root_nodes("Ability"))
+        self.scope_taxonomy = build_taxonomy("Scopes", onto_index.root_nodes("Scope"))
+
+        self.context_caches = {}
+        if context_caching:
+            if ontology_version is None:
+                raise ValueError("Context caching requires an ontology version")
+            for taxonomy_name, taxonomy in [("Areas", self.area_taxonomy),
+                                            ("Abilities", self.ability_taxonomy),
+                                            ("Scopes", self.scope_taxonomy)]:
+                context_cache = GeminiContextCache(
+                    client=self.client,
+                    name=context_cache_name("taxonomy-" + taxonomy_name.lower(), self.model, ontology_version),
+                    model=self.model,
+                    # Requests without the cache send no system instruction, cached ones must not either
+                    system_instruction=None,
+                    content=[taxonomy],
+                )
+                context_cache.start_refresher()
+                self.context_caches[taxonomy_name] = context_cache
+
+    def __dimension_prompts(self):
+        return {
+            "Area": {
+                "taxonomy": self.area_taxonomy,
+                "taxonomy_name": "Areas",
+                "multiple": False,
+                "priming_instruction": "Describe the precise area of learning covered by the provided learning material in one sentence.",
+                "matching_instruction": "find the term that best matches the description provided in step 1",
+            },
+            "Ability": {
+                "taxonomy": self.ability_taxonomy,
+                "taxonomy_name": "Abilities",
+                "multiple": True,
+                "priming_instruction": "Describe the student abilities challenged by the provided learning material in one sentence.",
+                "matching_instruction": "find the terms that best match the description provided in step 1",
+            },
+            "Scope": {
+                "taxonomy": self.scope_taxonomy,
+                "taxonomy_name": "Scopes",
+                "multiple": True,
+                "priming_instruction": "Describe the representative aspects of the learning material in up tp 200 words.",
+                "matching_instruction": "find the terms that best match the description of the learning material",
+            },
+        }
+
+    def build_request(self, dimension, gemini_file, use_context_cache=True):
+        """
+        Builds the generate_content request that classifies the file in one dimension.
+
+        Args:
+            dimension (str): "Area", "Ability" or "Scope".
+            gemini_file: The file to classify, anything generate_content accepts as content.
+            use_context_cache (bool): Reference the taxonomy in cached content if available. Requests
+                                      that run at an unknown later time (e.g. in batch jobs) should
+                                      carry the taxonomy inline instead.
+
+        Returns:
+            The contents and the GenerateContentConfig of the request.
+        """
+        dimension_prompt = self.__dimension_prompts()[dimension]
+        taxonomy_name = dimension_prompt["taxonomy_name"]
+        if dimension_prompt["multiple"]:
+            inline_prompt, cached_prompt, response_schema = multi_prompt, cached_multi_prompt, PromptMultiResponse
+        else:
+            inline_prompt, cached_prompt, response_schema = single_prompt, cached_single_prompt, PromptSingleResponse
+
+        cached_content = None
+        if use_context_cache and taxonomy_name in self.context_caches:
+            cached_content = self.context_caches[taxonomy_name].get()
+
+        if cached_content is None:
+            prompt = inline_prompt.format(dimension_prompt["taxonomy"], dimension_prompt["priming_instruction"],
+                                          dimension_prompt["matching_instruction"])
+        else:
+            prompt = cached_prompt.format(taxonomy_name, dimension_prompt["priming_instruction"],
+                                          dimension_prompt["matching_instruction"])
+
+        config = types.GenerateContentConfig(
+            candidate_count=1,
+            temperature=0,
+            response_mime_type="application/json",
+            response_schema=response_schema,
+            cached_content=cached_content,
         )
-        result_obj = json.loads(result.text)
-        return [result_obj['step_3']]
-
-    def __find_matches(self, taxonomy, priming_instruction, matching_instruction, gemini_file):
-        prompt = multi_prompt.format(taxonomy, priming_instruction, matching_instruction)
-        result = self.client.models.generate_content(
-            model=self.model,
-            contents=[gemini_file, prompt],
-            config=types.GenerateContentConfig(
-                candidate_count=1,
-                temperature=0,
-                response_mime_type="application/json",
-                response_schema=PromptMultiResponse,
-            ))
-        result_obj = json.loads(result.text)
-        return result_obj['step_3']
+        return [gemini_file, prompt], config
+
+    def entity_names_of_response(self, dimension, response_text):
+        """
+        Maps the JSON response of a request built by build_request to entity names.
+        """
+        result_obj = json.loads(response_text)
+        if self.__dimension_prompts()[dimension]["multiple"]:
+            matched_terms = result_obj['step_3']
+        else:
+            matched_terms = [result_obj['step_3']]
+        return [entity_name_of_natural_name(natural_name) for natural_name in matched_terms]
+
+    def __classify(self, dimension, gemini_file):
+        contents, config = self.build_request(dimension, gemini_file)
+        result = self.scheduler.call(self.model, self.client.models.generate_content,
+                                     model=self.model, contents=contents, config=config)
+        return self.entity_names_of_response(dimension, result.text)
 
     def classify_area(self, gemini_file):
-        matched_areas = self.__find_best_match(
-            taxonomy=self.area_taxonomy,
-            priming_instruction="Describe the precise area of learning covered by the provided learning material in one sentence.",
-            matching_instruction="find the term that best matches the description provided in step 1",
-            gemini_file=gemini_file
-        )
-        return [entity_name_of_natural_name(natural_name) for natural_name in matched_areas]
+        return self.__classify("Area", gemini_file)
 
     def classify_ability(self, gemini_file):
-        matched_abilities = self.__find_matches(
-            taxonomy=self.ability_taxonomy,
-            priming_instruction="Describe the student abilities challenged by the provided learning material in one sentence.",
-            matching_instruction="find the terms that best match the description provided in step 1",
-            gemini_file=gemini_file
-        )
-        return [entity_name_of_natural_name(natural_name) for natural_name in matched_abilities]
+        return self.__classify("Ability", gemini_file)
 
     def classify_scope(self, gemini_file):
-        matched_scopes = self.__find_matches(
-            taxonomy=self.scope_taxonomy,
-            priming_instruction="Describe the representative aspects of the learning material in up tp 200 words.",
-            matching_instruction="find the terms that best match the description of the learning material",
-            gemini_file=gemini_file
-        )
-        return [entity_name_of_natural_name(natural_name) for natural_name in matched_scopes]
+        return self.__classify("Scope", gemini_file)
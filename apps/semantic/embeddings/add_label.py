@@ -4,28 +4,57 @@ from typing import List, Dict, Any
 
 from dotenv import load_dotenv
 
+from semantic.embeddings.corpus_manifest import CorpusChanges
+
+restricts_data: List[Dict[str, Any]] = [
+    {
+        "namespace": "type",
+        "allow": ["material"]
+    },
+    {
+        "namespace": "locale",
+        "allow": ["de", "de-DE"]
+    }
+]
+
+
+def target_blob_name_of(target_folder: str, output_filename: str) -> str:
+    if not target_folder.strip('/'):  # Handle case where target_folder is root
+        return output_filename.lstrip('/')
+    return f"{target_folder.strip('/')}/{output_filename.lstrip('/')}"
+
+
+def read_jsonl_objects(content: bytes, name: str) -> List[Dict[str, Any]]:
+    json_objects = []
+    for line in content.decode('utf-8').strip().split('\n'):
+        if not line.strip():  # Skip empty lines
+            continue
+        try:
+            json_objects.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            # Skipping the line would leave its datapoint out of the aggregated output unnoticed
+            raise ValueError(f"Could not decode JSON line in {name}: '{line[:50]}...'. Error: {e}") from e
+    return json_objects
+
+
 def process_jsonl_files_in_gcs(
     bucket_name: str,
     source_folder: str,
     target_folder: str,
-    output_filename: str
-) -> None:
-    storage_client = storage.Client()
+    output_filename: str,
+    storage_client=None
+) -> bool:
+    """
+    Builds the aggregated output from all files of the source folder. It is not written if any file
+    could not be read, as it would silently lack that file's records. Returns whether it was written.
+    """
+    if storage_client is None:
+        storage_client = storage.Client()
     bucket = storage_client.bucket(bucket_name)
 
-    restricts_data: List[Dict[str, Any]] = [
-        {
-            "namespace": "type",
-            "allow": ["material"]
-        },
-        {
-            "namespace": "locale",
-            "allow": ["de", "de-DE"]
-        }
-    ]
-
     all_modified_objects: List[Dict[str, Any]] = []
     processed_files_count = 0
+    failed_files_count = 0
 
     # Ensure source_folder has a trailing slash for prefix matching if not empty
     source_prefix = f"{source_folder.strip('/')}/" if source_folder.strip('/') else ""
@@ -41,31 +70,27 @@ def process_jsonl_files_in_gcs(
 
         print(f"Processing file: gs://{bucket_name}/{blob.name}")
         try:
-            file_content_bytes = blob.download_as_bytes()
-            file_content_str = file_content_bytes.decode('utf-8')
-            lines = file_content_str.strip().split('\n')
             file_objects_count = 0
 
-            for line in lines:
-                if not line.strip():  # Skip empty lines
-                    continue
-                try:
-                    json_object = json.loads(line)
-                    json_object["restricts"] = restricts_data
-                    all_modified_objects.append(json_object)
-                    file_objects_count += 1
-                except json.JSONDecodeError as e:
-                    print(f"  Warning: Could not decode JSON line in {blob.name}: '{line[:50]}...'. Error: {e}")
+            for json_object in read_jsonl_objects(blob.download_as_bytes(), blob.name):
+                json_object["restricts"] = restricts_data
+                all_modified_objects.append(json_object)
+                file_objects_count += 1
             if file_objects_count > 0:
                 processed_files_count += 1
             print(f"  Processed {file_objects_count} JSON objects from {blob.name}")
 
         except Exception as e:
             print(f"  Error processing file {blob.name}: {e}")
+            failed_files_count += 1
+
+    if failed_files_count > 0:
+        print(f"Could not process {failed_files_count} file(s). Output file will not be created.")
+        return False
 
     if not all_modified_objects:
         print("No JSON objects were processed or found. Output file will not be created.")
-        return
+        return True
 
     print(f"\nProcessed a total of {len(all_modified_objects)} JSON objects from {processed_files_count} files.")
 
@@ -73,17 +98,72 @@ def process_jsonl_files_in_gcs(
     output_jsonl_content = "\n".join(json.dumps(obj) for obj in all_modified_objects)
 
     # Construct the full path for the output blob
-    target_blob_name = f"{target_folder.strip('/')}/{output_filename.lstrip('/')}"
-    if not target_folder.strip('/'):  # Handle case where target_folder is root
-        target_blob_name = output_filename.lstrip('/')
+    target_blob_name = target_blob_name_of(target_folder, output_filename)
+
+    output_blob = bucket.blob(target_blob_name)
+
+    try:
+        output_blob.upload_from_string(output_jsonl_content.encode('utf-8'), content_type='application/jsonl')
+        print(f"Successfully uploaded aggregated data to: gs://{bucket_name}/{target_blob_name}")
+        return True
+    except Exception as e:
+        print(f"Error uploading aggregated data to gs://{bucket_name}/{target_blob_name}: {e}")
+        return False
 
+
+def apply_changes_to_jsonl_in_gcs(
+    bucket_name: str,
+    changes: CorpusChanges,
+    source_folder: str,
+    target_folder: str,
+    output_filename: str,
+    storage_client=None
+) -> bool:
+    """
+    Updates the aggregated output with the changes of an embedding run instead of reading every
+    JSONL file again: records of removed datapoints are dropped and only the files written by the
+    run are read. Without an existing output, it is built from all files of the source folder.
+    Returns whether the output is up to date with the changes.
+    """
+    if storage_client is None:
+        storage_client = storage.Client()
+    bucket = storage_client.bucket(bucket_name)
+
+    target_blob_name = target_blob_name_of(target_folder, output_filename)
     output_blob = bucket.blob(target_blob_name)
+    if not output_blob.exists():
+        print(f"No aggregated data at gs://{bucket_name}/{target_blob_name} yet, processing all files.")
+        return process_jsonl_files_in_gcs(bucket_name, source_folder, target_folder, output_filename,
+                                          storage_client=storage_client)
+
+    if len(changes.embedded) == 0 and len(changes.removed_ids) == 0:
+        print(f"No changes to apply to gs://{bucket_name}/{target_blob_name}.")
+        return True
+
+    new_objects: List[Dict[str, Any]] = []
+    for path in changes.embedded:
+        print(f"Processing file: gs://{bucket_name}/{path}")
+        for json_object in read_jsonl_objects(bucket.blob(path).download_as_bytes(), path):
+            json_object["restricts"] = restricts_data
+            new_objects.append(json_object)
+
+    # Changed files replace their records, deleted files and pages lose them
+    replaced_ids = changes.removed_ids | {json_object["id"] for json_object in new_objects}
+    kept_objects = [json_object for json_object in read_jsonl_objects(output_blob.download_as_bytes(), target_blob_name)
+                    if json_object["id"] not in replaced_ids]
+    all_modified_objects = kept_objects + new_objects
+
+    print(f"Kept {len(kept_objects)} and updated {len(new_objects)} JSON objects, "
+          f"removed {len(changes.removed_ids)} datapoints.")
 
+    output_jsonl_content = "\n".join(json.dumps(obj) for obj in all_modified_objects)
     try:
         output_blob.upload_from_string(output_jsonl_content.encode('utf-8'), content_type='application/jsonl')
         print(f"Successfully uploaded aggregated data to: gs://{bucket_name}/{target_blob_name}")
+        return True
     except Exception as e:
         print(f"Error uploading aggregated data to gs://{bucket_name}/{target_blob_name}: {e}")
+        return False
 
 
 # Example Usage (replace with your actual values):
@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+
+from semantic.embeddings.hierarchical_matcher import HierarchicalMatcher
+from semantic.embeddings.similarity_index import SimilarityIndex
+
+
+def synthetic_taxonomy(branching=8, depth=4, dimensions=768, spread=0.3, seed=0):
+    """
+    Builds a taxonomy of branching ** level nodes per level in which every child is its parent's
+    embedding plus noise, so that subtrees cluster around their roots like real taxonomies do.
+
+    Returns:
+        The ids, the embedding matrix, the children rows of every node and the root rows.
+    """
+    rng = np.random.default_rng(seed)
+    ids = []
+    vectors = []
+    children = []
+
+    def add_node(name, vector):
+        ids.append(name)
+        vectors.append(vector / np.linalg.norm(vector))
+        children.append([])
+        return len(ids) - 1
+
+    roots = [add_node("n{}".format(i), rng.normal(size=dimensions)) for i in range(branching)]
+    level = roots
+    for _ in range(depth - 1):
+        next_level = []
+        for parent in level:
+            for i in range(branching):
+                noise = spread * rng.normal(size=dimensions) / np.sqrt(dimensions)
+                child = add_node("{}.{}".format(ids[parent], i), vectors[parent] + noise)
+                children[parent].append(child)
+                next_level.append(child)
+        level = next_level
+
+    return ids, np.asarray(vectors, dtype=np.float32), children, roots
+
+
+def synthetic_queries(matrix, count=500, noise=3.0, seed=1):
+    # Queries are noisy copies of random taxonomy entries, like descriptions of matching material
+    rng = np.random.default_rng(seed)
+    targets = rng.integers(0, len(matrix), size=count)
+    queries = matrix[targets] + noise * rng.normal(size=(count, matrix.shape[1])) / np.sqrt(matrix.shape[1])
+    return queries.astype(np.float32)
+
+
+def benchmark(branching=8, depth=4, dimensions=768, query_count=500, beam_widths=(1, 2, 4, 8, 16)):
+    ids, matrix, children, roots = synthetic_taxonomy(branching, depth, dimensions)
+    queries = synthetic_queries(matrix, query_count)
+
+    brute_force = SimilarityIndex(ids, matrix)
+    started_at = time.perf_counter()
+    expected = [brute_force.best_match(query) for query in queries]
+    brute_force_seconds = time.perf_counter() - started_at
+    print(f"{len(ids)} entries, {query_count} queries one by one")
+    print(f"brute force:   {brute_force_seconds / query_count * 1e6:8.1f} µs/query")
+
+    started_at = time.perf_counter()
+    brute_force.best_matches(queries)
+    print(f"brute force, all queries in one matrix product: "
+          f"{(time.perf_counter() - started_at) / query_count * 1e6:.1f} µs/query")
+
+    for beam_width in beam_widths:
+        matcher = HierarchicalMatcher(ids, matrix, children, roots, beam_width=beam_width)
+        started_at = time.perf_counter()
+        matched = [matcher.best_match(query) for query in queries]
+        seconds = time.perf_counter() - started_at
+        recall = np.mean([match == expectation for match, expectation in zip(matched, expected)])
+        print(f"beam width {beam_width:2d}: {seconds / query_count * 1e6:8.1f} µs/query, "
+              f"recall@1 {recall:.3f} against brute force")
+
+
+if __name__ == "__main__":
+    import sys
+
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    benchmark(depth=depth)
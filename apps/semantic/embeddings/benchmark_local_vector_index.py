@@ -0,0 +1,47 @@
+import time
+
+import numpy as np
+
+from semantic.embeddings.local_vector_index import LocalVectorIndex
+from semantic.embeddings.similarity_index import SimilarityIndex
+
+
+def clustered_vectors(count=100_000, dimensions=1408, clusters=200, spread=1.0, seed=0):
+    # Embeddings of real materials cluster by topic, uniform random vectors would not
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    labels = rng.integers(0, clusters, size=count)
+    noise = spread * rng.normal(size=(count, dimensions)) / np.sqrt(dimensions)
+    return (centers[labels] + noise).astype(np.float32)
+
+
+def benchmark(count=100_000, dimensions=1408, query_count=200, k=10, n_probes=(1, 4, 8, 16, 32)):
+    vectors = clustered_vectors(count + query_count, dimensions)
+    vectors, queries = vectors[:count], vectors[count:]
+    ids = [str(i) for i in range(count)]
+
+    started_at = time.perf_counter()
+    index = LocalVectorIndex.build(ids, vectors)
+    print(f"{count} vectors with {dimensions} dimensions, built {index.n_lists} lists "
+          f"in {time.perf_counter() - started_at:.1f}s")
+
+    exact = SimilarityIndex(ids, vectors)
+    started_at = time.perf_counter()
+    expected = [{neighbor for neighbor, _ in matches} for matches in exact.search(queries, k=k)]
+    exact_seconds = time.perf_counter() - started_at
+    print(f"exact search:   {query_count / exact_seconds:8.1f} QPS")
+
+    for n_probe in n_probes:
+        started_at = time.perf_counter()
+        results = index.find_neighbors(queries, num_neighbors=k, n_probe=n_probe)
+        seconds = time.perf_counter() - started_at
+        recall = np.mean([len(expectation & {neighbor.id for neighbor in neighbors}) / k
+                          for expectation, neighbors in zip(expected, results)])
+        print(f"n_probe {n_probe:3d}:    {query_count / seconds:8.1f} QPS, recall@{k} {recall:.3f}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    benchmark(count=int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
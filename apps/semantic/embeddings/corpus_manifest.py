@@ -0,0 +1,137 @@
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+class CorpusChanges:
+    """
+    What an embedding run changed in the corpus: the source files it found added, changed,
+    unchanged and deleted, the embedding JSON files it wrote and the ids of the datapoints that no
+    longer exist or were replaced. The embedding files and ids include those of earlier runs that
+    were not applied to the aggregated output yet.
+    """
+
+    def __init__(self):
+        self.added: List[str] = []
+        self.changed: List[str] = []
+        self.unchanged: List[str] = []
+        self.deleted: List[str] = []
+        self.embedded: List[str] = []
+        self.removed_ids: Set[str] = set()
+        self.stats: Dict[str, Dict] = {}
+
+    def summary(self) -> str:
+        return "{} added, {} changed, {} unchanged, {} deleted".format(
+            len(self.added), len(self.changed), len(self.unchanged), len(self.deleted))
+
+
+class CorpusManifest:
+    """
+    Remembers for every source blob of a corpus the version that was embedded and the outputs
+    that embedding produced, so that a run only processes new and changed blobs and can remove the
+    outputs of deleted ones.
+
+    A blob is unchanged if its MD5 hash matches the embedded version, or its generation does if
+    no hash is known, and it was embedded with the same options (e.g. model and render resolution).
+    The MD5 hash survives re-uploads of the same content, the generation does not.
+
+    The manifest also keeps the changes that were not applied to the aggregated output yet, the
+    embedding files written and the datapoint ids removed since, and is saved with them. A run that
+    dies before the output is updated leaves them to the next one instead of losing them.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, Dict]] = None, pending: Optional[Dict[str, List[str]]] = None):
+        self.entries = {} if entries is None else entries
+        pending = {} if pending is None else pending
+        self.pending_embedded: List[str] = list(pending.get("embedded", []))
+        self.pending_removed_ids: Set[str] = set(pending.get("removed_ids", []))
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, bucket, path: str) -> "CorpusManifest":
+        blob = bucket.blob(path)
+        if not blob.exists():
+            return cls()
+        manifest = json.loads(blob.download_as_bytes().decode("utf-8"))
+        return cls(manifest["entries"], manifest.get("pending"))
+
+    def save(self, bucket, path: str) -> None:
+        with self.lock:
+            content = json.dumps({
+                "version": MANIFEST_VERSION,
+                "entries": self.entries,
+                "pending": self.__pending(),
+            }, sort_keys=True)
+        bucket.blob(path).upload_from_string(content.encode("utf-8"), content_type="application/json")
+
+    def __pending(self) -> Dict[str, List[str]]:
+        return {"embedded": list(self.pending_embedded), "removed_ids": sorted(self.pending_removed_ids)}
+
+    def pending(self) -> Dict[str, List[str]]:
+        """
+        Returns the changes not applied to the aggregated output yet.
+        """
+        with self.lock:
+            return self.__pending()
+
+    def clear_pending(self) -> None:
+        with self.lock:
+            self.pending_embedded = []
+            self.pending_removed_ids = set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, name: str) -> Optional[Dict]:
+        with self.lock:
+            return self.entries.get(name)
+
+    def is_unchanged(self, blob, options: Optional[Dict] = None) -> bool:
+        entry = self.get(blob.name)
+        if entry is None or entry.get("options") != options:
+            return False
+        md5_hash = getattr(blob, "md5_hash", None)
+        if md5_hash is not None and entry.get("md5_hash") is not None:
+            return md5_hash == entry["md5_hash"]
+        return blob.generation == entry.get("generation")
+
+    def record(self, blob, normalized: List[str], embedded: str, ids: List[str],
+               options: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Records the outputs of a completely embedded blob and the options it was embedded with, and
+        returns the entry it replaces, if any.
+        """
+        if len(ids) == 0:
+            raise ValueError("{} has no embedded pages to record".format(blob.name))
+        with self.lock:
+            previous = self.entries.get(blob.name)
+            if embedded not in self.pending_embedded:
+                self.pending_embedded.append(embedded)
+            if previous is not None:
+                # Pages a changed blob no longer has
+                self.pending_removed_ids.update(set(previous["ids"]) - set(ids))
+            self.entries[blob.name] = {
+                "generation": blob.generation,
+                "md5_hash": getattr(blob, "md5_hash", None),
+                "normalized": normalized,
+                "embedded": embedded,
+                "ids": ids,
+                "options": options,
+            }
+            return previous
+
+    def remove(self, name: str) -> Optional[Dict]:
+        with self.lock:
+            entry = self.entries.pop(name, None)
+            if entry is not None:
+                if entry["embedded"] in self.pending_embedded:
+                    self.pending_embedded.remove(entry["embedded"])
+                self.pending_removed_ids.update(entry["ids"])
+            return entry
+
+    def names(self) -> Iterable[str]:
+        with self.lock:
+            return list(self.entries.keys())
@@ -1,75 +1,308 @@
 import os
+import threading
+from typing import Optional
 
 import vertexai  # Only for type hinting if GenerativeModel is not directly imported
 from dotenv import load_dotenv
 from google.cloud import storage
 
-from semantic.embeddings.embedder_google import GoogleMultiModalEmbedder, generate_jsonl_from_embeddings, \
-    upload_blobs_as_new_files
+from semantic.embeddings.embedder_google import GoogleMultiModalEmbedder, generate_jsonl_from_embeddings
+from semantic.embeddings.add_label import apply_changes_to_jsonl_in_gcs
+from semantic.embeddings.corpus_manifest import MANIFEST_FILENAME, CorpusChanges, CorpusManifest
+from semantic.staged_pipeline import Stage, StagedPipeline
+
+
+def folder_prefix(bucket_path: str) -> str:
+    # Remove leading/trailing slashes, then add a trailing slash if it's not the root
+    normalized_folder_path = bucket_path.strip('/')
+    return normalized_folder_path + '/' if normalized_folder_path else ""
+
+
+def embedding_json_filename(filename: str) -> str:
+    return f"{filename.replace(".", "-")}.json"
+
+
+class EmbeddingFile:
+    """
+    A file whose pages go through the embedding pipeline in batches. It is done once the batches
+    of all its pages are uploaded, and failed as soon as one of them failed.
+    """
+
+    def __init__(self, blob):
+        self.blob = blob
+        self.lock = threading.Lock()
+        self.batch_count = 0
+        self.rendered = False
+        self.failed = False
+        self.outputs_of_batches = {}
+
+    def next_batch(self, pages, last=False) -> "PageBatch":
+        # The last batch is known before it is passed on, so whichever batch finishes last completes the file
+        with self.lock:
+            batch = PageBatch(self, self.batch_count, pages)
+            self.batch_count += 1
+            self.rendered = last
+        return batch
+
+    def batch_done(self, index, normalized, embeddings_data) -> Optional["EmbeddingFile"]:
+        """
+        Keeps the outputs of a batch and returns the file if it was the last one to finish.
+        """
+        with self.lock:
+            self.outputs_of_batches[index] = (normalized, embeddings_data)
+            done = self.rendered and not self.failed and len(self.outputs_of_batches) == self.batch_count
+        return self if done else None
+
+    def outputs(self):
+        """
+        Returns the paths of the normalized images and the embeddings of all pages in page order.
+        """
+        normalized, embeddings_data = [], []
+        for index in range(self.batch_count):
+            batch_normalized, batch_embeddings_data = self.outputs_of_batches[index]
+            normalized.extend(batch_normalized)
+            embeddings_data.extend(batch_embeddings_data)
+        return normalized, embeddings_data
+
+
+class PageBatch:
+
+    def __init__(self, file, index, pages):
+        self.file = file
+        self.index = index
+        self.pages = pages
+        self.embedding_results = None
 
 
 class GoogleMultiModalBatchEmbedder:
-    def __init__(self, project, location, bucket_name, embedder):
+    """
+    Embeds the files of a bucket folder in a pipeline of stages that download, render, embed and
+    upload files at the same time, each with its own concurrency.
+
+    A manifest in the folder records the version of every embedded file and its outputs, so a run
+    only embeds files that are new or changed since the last one, and removes the outputs of files
+    that were deleted. The manifest is saved every few files, so an interrupted run resumes with
+    the files it did not finish.
+
+    Pages are rendered and passed on in batches, so a file's pages are embedded and uploaded while its
+    later pages are still rendered. Only the batches in flight are held in memory, however many pages
+    a file has. A file is recorded once all of its batches are uploaded.
+    """
+
+    def __init__(self, project, location, bucket_name, embedder, storage_client=None,
+                 download_concurrency=8, render_concurrency=2, embed_concurrency=4, upload_concurrency=8,
+                 report_interval=30.0, manifest_save_every=25, page_batch_size=8):
+        """
+        Args:
+            embedder (GoogleMultiModalEmbedder): Embeds the images of the files.
+            storage_client (storage.Client): The client to use, a new one is created by default.
+            download_concurrency, render_concurrency, embed_concurrency, upload_concurrency (int):
+                The number of files (page batches for embed and upload) each stage works on at once.
+            report_interval (float): Seconds between progress reports, None disables them.
+            manifest_save_every (int): The number of embedded files after which the manifest is saved.
+            page_batch_size (int): The number of pages passed between the stages at once.
+        """
         self.project = project
         self.location = location
         self.bucket_name = bucket_name
         self.embedder = embedder
+        self.storage_client = storage_client
+        self.download_concurrency = download_concurrency
+        self.render_concurrency = render_concurrency
+        self.embed_concurrency = embed_concurrency
+        self.upload_concurrency = upload_concurrency
+        self.report_interval = report_interval
+        self.manifest_save_every = manifest_save_every
+        self.page_batch_size = page_batch_size
 
         vertexai.init(project=self.project, location=self.location)
 
-    def embed_files(self, bucket_path, content_type, content_locale):
+    def __bucket(self):
+        if self.storage_client is None:
+            self.storage_client = storage.Client()
+        return self.storage_client.bucket(self.bucket_name)
+
+    def __pending_blobs(self, blobs, manifest, changes, options):
+        for blob in blobs:
+            # Skip objects that represent folders (common convention is ending with '/')
+            if blob.name.endswith('/'):
+                continue
+            if manifest.is_unchanged(blob, options):
+                changes.unchanged.append(blob.name)
+                continue
+            if manifest.get(blob.name) is None:
+                changes.added.append(blob.name)
+            else:
+                changes.changed.append(blob.name)
+            yield blob
+
+    def __upload(self, bucket, path, content):
+        bucket.blob(path).upload_from_string(content)
+
+    def __delete(self, bucket, paths):
+        for path in paths:
+            try:
+                bucket.blob(path).delete()
+                print(f"Deleted gs://{self.bucket_name}/{path}")
+            except Exception as e:
+                print(f"Error deleting gs://{self.bucket_name}/{path}: {e}")
+
+    def embed_files(self, bucket_path, content_type, content_locale, incremental=True) -> Optional[CorpusChanges]:
+        """
+        Embeds the files in <bucket_path>/raw, uploads their normalized images to
+        <bucket_path>/normalized and their embeddings to <bucket_path>/embedded.
+
+        Args:
+            incremental (bool): Only embed files that are new or changed since the last run.
+
+        Returns:
+            The changes of the corpus, or None if the bucket could not be read.
+        """
         bucket_path_raw = bucket_path + "/raw"
         bucket_path_normalized = bucket_path + "/normalized"
         bucket_path_embedded = bucket_path + "/embedded"
+        manifest_path = folder_prefix(bucket_path) + MANIFEST_FILENAME
 
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(self.bucket_name)
-
-            prefix = bucket_path_raw
-            if prefix and not prefix.endswith('/'):
-                prefix += '/'
-
-            blobs = bucket.list_blobs(prefix=prefix)
-
-            print(
-                f"Scanning folder '{bucket_path_raw if bucket_path_raw else 'root'}' in bucket '{self.bucket_name}'...")
-            file_count = 0
-            for blob in blobs:
-                # Skip objects that represent folders (common convention is ending with '/')
-                filename = os.path.basename(blob.name)
-                if blob.name.endswith('/'):
-                    continue
-
-                file_count += 1
-                print(f"Downloading and processing: {filename}")
-                try:
-                    file_content_bytes = blob.download_as_bytes()
-                    embedding_results = self.embedder.embed_document(filename, file_content_bytes)
-                    normalized_images = list(map(lambda x: (x["name"], x["image_data"]), embedding_results))
-                    embeddings_data = list(map(lambda x: (x["name"], x["embedding"]), embedding_results))
-                    embeddings_json = generate_jsonl_from_embeddings(embeddings_data, content_type=content_type,
-                                                                     content_locale=content_locale)
-                    upload_blobs_as_new_files(bucket_name=self.bucket_name,
-                                              bucket_path=bucket_path_normalized,
-                                              files_data=normalized_images)
-
-                    json_filename = f"{filename.replace(".", "-")}.json"
-                    upload_blobs_as_new_files(bucket_name=self.bucket_name,
-                                              bucket_path=bucket_path_embedded,
-                                              files_data=[(json_filename, embeddings_json.encode('utf-8'))])
-
-                except Exception as e:
-                    print(f"Error processing file {filename}: {e}")
-
-            if file_count == 0:
-                print(
-                    f"No files found in '{bucket_path_raw if bucket_path_raw else 'root'}' of bucket '{self.bucket_name}'.")
-            else:
-                print(f"Finished processing {file_count} file(s).")
-
+            bucket = self.__bucket()
+            manifest = CorpusManifest.load(bucket, manifest_path)
+            if not incremental:
+                # Every file is embedded again, only the changes not applied yet are kept
+                manifest = CorpusManifest(pending=manifest.pending())
+            blobs = list(bucket.list_blobs(prefix=folder_prefix(bucket_path_raw)))
         except Exception as e:
             print(f"An error occurred: {e}")
+            return None
+
+        changes = CorpusChanges()
+        changes_lock = threading.Lock()
+        recorded = [0]
+        options = self.embedder.output_options()
+
+        def download(blob):
+            print(f"Downloading: {os.path.basename(blob.name)}")
+            return blob, blob.download_as_bytes()
+
+        def render(item):
+            blob, file_content_bytes = item
+            file = EmbeddingFile(blob)
+            batch = []
+            try:
+                for image in self.embedder.iter_images_of_document(os.path.basename(blob.name), file_content_bytes):
+                    # A full batch is held back until the next page shows it is not the last one
+                    if len(batch) == self.page_batch_size:
+                        yield file.next_batch(batch)
+                        batch = []
+                    batch.append(image)
+                if len(batch) == 0:
+                    raise ValueError(f"{os.path.basename(blob.name)} has no pages to embed")
+                yield file.next_batch(batch, last=True)
+            except Exception:
+                file.failed = True
+                raise
+
+        def embed(batch):
+            if batch.file.failed:
+                return None
+            # The embedder skips pages it could not embed, a file missing some is not done
+            embedding_results = self.embedder.embed_images(batch.pages)
+            if len(embedding_results) < len(batch.pages):
+                raise RuntimeError(f"Could not embed {len(batch.pages) - len(embedding_results)} of "
+                                   f"{len(batch.pages)} pages of {os.path.basename(batch.file.blob.name)}")
+            batch.pages = None
+            batch.embedding_results = embedding_results
+            return batch
+
+        def upload(batch):
+            if batch.file.failed:
+                return None
+            normalized = []
+            for name, image_data in ((x["name"], x["image_data"]) for x in batch.embedding_results):
+                path = folder_prefix(bucket_path_normalized) + name.lstrip('/')
+                self.__upload(bucket, path, image_data)
+                normalized.append(path)
+            embeddings_data = [(x["name"], x["embedding"]) for x in batch.embedding_results]
+            # Only the file is passed on, once all of its batches are uploaded
+            return batch.file.batch_done(batch.index, normalized, embeddings_data)
+
+        def record(file):
+            blob = file.blob
+            normalized, embeddings_data = file.outputs()
+            embeddings_json = generate_jsonl_from_embeddings(embeddings_data, content_type=content_type,
+                                                             content_locale=content_locale)
+            embedded = folder_prefix(bucket_path_embedded) + embedding_json_filename(os.path.basename(blob.name))
+            self.__upload(bucket, embedded, embeddings_json.encode('utf-8'))
+
+            ids = [name for name, _ in embeddings_data]
+            previous = manifest.record(blob, normalized, embedded, ids, options)
+            if previous is not None:
+                # Pages a changed file no longer has
+                self.__delete(bucket, [path for path in previous["normalized"] if path not in normalized])
+
+            with changes_lock:
+                recorded[0] += 1
+                save = recorded[0] % self.manifest_save_every == 0
+            if save:
+                manifest.save(bucket, manifest_path)
+            return blob.name
+
+        def describe(item):
+            if isinstance(item, PageBatch):
+                return "{} (batch {})".format(describe(item.file), item.index + 1)
+            if isinstance(item, EmbeddingFile):
+                return describe(item.blob)
+            blob = item[0] if isinstance(item, tuple) else item
+            return os.path.basename(blob.name)
+
+        def failing_file(stage_fn):
+            # A file with a failed batch is not done, its remaining batches are skipped
+            def run(item):
+                try:
+                    return stage_fn(item)
+                except Exception:
+                    if isinstance(item, PageBatch):
+                        item.file.failed = True
+                    raise
+            return run
+
+        pipeline = StagedPipeline([
+            Stage("download", download, self.download_concurrency),
+            Stage("render", render, self.render_concurrency, fan_out=True),
+            Stage("embed", failing_file(embed), self.embed_concurrency),
+            Stage("upload", failing_file(upload), self.upload_concurrency),
+            Stage("record", record, self.upload_concurrency),
+        ], describe=describe, report_interval=self.report_interval)
+
+        print(f"Scanning folder '{bucket_path_raw}' in bucket '{self.bucket_name}'...")
+        changes.stats = pipeline.run(self.__pending_blobs(blobs, manifest, changes, options))
+
+        existing = {blob.name for blob in blobs}
+        for name in manifest.names():
+            if name not in existing:
+                entry = manifest.remove(name)
+                changes.deleted.append(name)
+                self.__delete(bucket, entry["normalized"] + [entry["embedded"]])
+
+        manifest.save(bucket, manifest_path)
+
+        # Includes the changes of earlier runs that were not applied to the aggregated output
+        pending = manifest.pending()
+        changes.embedded = pending["embedded"]
+        changes.removed_ids = set(pending["removed_ids"])
+
+        print(f"Finished processing {changes.stats['record']['processed']} file(s) ({changes.summary()}). "
+              f"{pipeline.progress()}")
+        return changes
+
+    def mark_changes_applied(self, bucket_path):
+        """
+        Forgets the pending changes of the corpus once they were applied to the aggregated output.
+        """
+        manifest_path = folder_prefix(bucket_path) + MANIFEST_FILENAME
+        bucket = self.__bucket()
+        manifest = CorpusManifest.load(bucket, manifest_path)
+        manifest.clear_pending()
+        manifest.save(bucket, manifest_path)
 
 
 if __name__ == "__main__":
@@ -80,4 +313,15 @@ if __name__ == "__main__":
         bucket_name="edugraph-embed",
         embedder=GoogleMultiModalEmbedder(model_name="multimodalembedding@001"),
     )
-    embedder.embed_files(bucket_path="examples", content_type=["material"], content_locale=["de", "de-DE"])
+    changes = embedder.embed_files(bucket_path="examples", content_type=["material"], content_locale=["de", "de-DE"])
+
+    if changes is not None:
+        applied = apply_changes_to_jsonl_in_gcs(
+            bucket_name="edugraph-embed",
+            changes=changes,
+            source_folder="examples/embedded",
+            target_folder="examples/embedded-with-labels",
+            output_filename="all_items_with_labels.json"
+        )
+        if applied:
+            embedder.mark_changes_applied(bucket_path="examples")
@@ -1,16 +1,42 @@
 import json
+import multiprocessing
 import os
-from typing import Optional, List, Dict, Tuple
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, List, Dict, Tuple, Iterable, Iterator
 
 import fitz
 from google.cloud import storage
 from vertexai.vision_models import MultiModalEmbeddingModel, Image
 
+DEFAULT_PDF_DPI = 300
+
+# The longest side of rendered pages in pixels. The embedding model works on much smaller images,
+# larger renders only cost memory, CPU and upload time.
+MAX_EMBEDDING_IMAGE_SIZE = 1024
+
+IMAGE_EXTENSIONS = {"png": "png", "jpeg": "jpg"}
+
 
 class GoogleMultiModalEmbedder:
 
-    def __init__(self, model_name):
+    def __init__(self, model_name, dpi: int = DEFAULT_PDF_DPI, image_format: str = "png", jpeg_quality: int = 85,
+                 max_image_size: Optional[int] = MAX_EMBEDDING_IMAGE_SIZE, pdf_processes: Optional[int] = None):
+        """
+        Args:
+            model_name (str): The multimodal embedding model.
+            dpi, image_format, jpeg_quality, max_image_size, pdf_processes: How PDF pages are rendered,
+                see iter_pdf_pages_as_images.
+        """
+        self.model_name = model_name
         self.model = MultiModalEmbeddingModel.from_pretrained(model_name)
+        self.render_options = {
+            "dpi": dpi,
+            "image_format": image_format,
+            "jpeg_quality": jpeg_quality,
+            "max_image_size": max_image_size,
+            "processes": pdf_processes,
+        }
 
     def embed_image(self,
                     image_blob: bytes,
@@ -58,22 +84,10 @@ class GoogleMultiModalEmbedder:
             print(f"An error occurred during Vertex AI text embedding generation: {e}")
             return None
 
-    def embed_document(self, filename, blob) -> List[Dict]:
-        # Initialize image_blobs as a list to handle single non-PDFs and multiple PDF pages
-        processed_image_blobs_with_names = []
-
-        if filename.lower().endswith(".pdf"):
-            pdf_pages_as_images = convert_pdf_blob_to_image_blobs(filename, blob)
-            if pdf_pages_as_images:
-                processed_image_blobs_with_names.extend(pdf_pages_as_images)
-        else:
-            # For non-PDFs, treat the blob as a single image
-            # Ensure the filename for non-PDFs is correctly passed if needed for naming
-            processed_image_blobs_with_names.append((filename, blob))
-
+    def embed_images(self, images: Iterable[Tuple[str, bytes]]) -> List[Dict]:
         embedding_results: List[Dict] = []
 
-        for name, image_data in processed_image_blobs_with_names:
+        for name, image_data in images:
             # Determine mime_type based on filename extension if possible, or assume default
             mime_type = "image/png"  # Default, adjust if you handle other types like jpeg
             if name.lower().endswith(".jpg") or name.lower().endswith(".jpeg"):
@@ -93,33 +107,126 @@ class GoogleMultiModalEmbedder:
 
         return embedding_results
 
+    def output_options(self) -> Dict:
+        """
+        The options that determine the page images and their embeddings. Files embedded with other
+        options have to be embedded again to be comparable.
+        """
+        options = {name: value for name, value in self.render_options.items() if name != "processes"}
+        return {"model_name": self.model_name, **options}
 
-def convert_pdf_blob_to_image_blobs(filename: str, pdf_blob: bytes, dpi: int = 300) -> Optional[
-    List[Tuple[str, bytes]]]:
-    image_blobs: List[(str, bytes)] = []
-    try:
-        # Open the PDF from the byte stream
-        doc = fitz.open(stream=pdf_blob, filetype="pdf")
-
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-
-            # Render page to an image (pixmap)
-            # The matrix can be used for scaling. Default is identity matrix (no scaling).
-            # Higher DPI increases resolution.
-            pix = page.get_pixmap(dpi=dpi)
-
-            # Get image bytes (default is PNG)
-            img_bytes = pix.tobytes("png")
-            if img_bytes:
-                name_without_extension, _ = os.path.splitext(filename)
-                name = "{}_{}.png".format(name_without_extension, page_num + 1)
-                image_blobs.append((name, img_bytes))
-            else:
-                print(f"Warning: Could not get image bytes for page {page_num + 1}.")
+    def iter_images_of_document(self, filename, blob) -> Iterator[Tuple[str, bytes]]:
+        return iter_images_of_document(filename, blob, **self.render_options)
 
+    def embed_document(self, filename, blob) -> List[Dict]:
+        # Pages are embedded while later pages are still rendered
+        return self.embed_images(iter_images_of_document(filename, blob, **self.render_options))
+
+
+def iter_images_of_document(filename: str, blob: bytes, **render_options) -> Iterator[Tuple[str, bytes]]:
+    # Errors of broken PDFs are raised, stopping early would pass off the pages so far as the whole document
+    if filename.lower().endswith(".pdf"):
+        yield from iter_pdf_pages_as_images(filename, blob, **render_options)
+    else:
+        # For non-PDFs, treat the blob as a single image
+        # Ensure the filename for non-PDFs is correctly passed if needed for naming
+        yield filename, blob
+
+
+def images_of_document(filename: str, blob: bytes, **render_options) -> List[Tuple[str, bytes]]:
+    return list(iter_images_of_document(filename, blob, **render_options))
+
+
+def page_zoom(page, dpi: int, max_image_size: Optional[int]) -> float:
+    # PDF coordinates are in points of 1/72 inch
+    zoom = dpi / 72
+    if max_image_size is not None:
+        longest_side = max(page.rect.width, page.rect.height) * zoom
+        if longest_side > max_image_size:
+            zoom *= max_image_size / longest_side
+    return zoom
+
+
+def render_page(doc, page_num: int, dpi: int, image_format: str, jpeg_quality: int,
+                max_image_size: Optional[int]) -> bytes:
+    page = doc.load_page(page_num)
+    zoom = page_zoom(page, dpi, max_image_size)
+
+    # Rendering at the final size keeps large pages from being rasterized at full resolution first
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    if image_format == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=jpeg_quality)
+    return pix.tobytes("png")
+
+
+# The document a rendering process works on, opened once per process
+worker_document = None
+
+
+def open_worker_document(pdf_blob: bytes) -> None:
+    global worker_document
+    worker_document = fitz.open(stream=pdf_blob, filetype="pdf")
+
+
+def render_worker_page(page_num: int, *render_args) -> bytes:
+    return render_page(worker_document, page_num, *render_args)
+
+
+def render_pages_in_processes(pdf_blob: bytes, page_count: int, render_args: Tuple, processes: int) -> Iterator[bytes]:
+    # Spawned rather than forked, forking a process with running threads is not safe
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=open_worker_document, initargs=(pdf_blob,)) as executor:
+        in_flight = deque()
+        next_page = 0
+        while next_page < page_count or len(in_flight) > 0:
+            # Keeps every process busy while holding at most two pages per process
+            while next_page < page_count and len(in_flight) < 2 * processes:
+                in_flight.append(executor.submit(render_worker_page, next_page, *render_args))
+                next_page += 1
+            yield in_flight.popleft().result()
+
+
+def iter_pdf_pages_as_images(filename: str, pdf_blob: bytes, dpi: int = DEFAULT_PDF_DPI, image_format: str = "png",
+                             jpeg_quality: int = 85, max_image_size: Optional[int] = MAX_EMBEDDING_IMAGE_SIZE,
+                             processes: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+    """
+    Renders the pages of a PDF to images and yields them in page order as they are rendered, so
+    only the pages in flight are held in memory.
+
+    Args:
+        dpi (int): The resolution pages are rendered at.
+        image_format (str): "png" or "jpeg".
+        jpeg_quality (int): The quality of JPEG images.
+        max_image_size (int): The longest side of a page image in pixels, larger pages are rendered
+                              smaller. None renders all pages at the full resolution.
+        processes (int): Renders pages in this many processes, in the calling thread by default.
+    """
+    if image_format not in IMAGE_EXTENSIONS:
+        raise ValueError("Unsupported image format '{}'".format(image_format))
+    name_without_extension, _ = os.path.splitext(filename)
+    render_args = (dpi, image_format, jpeg_quality, max_image_size)
+
+    doc = fitz.open(stream=pdf_blob, filetype="pdf")
+    try:
+        page_count = len(doc)
+        if processes is not None and processes > 1 and page_count > 1:
+            pages = render_pages_in_processes(pdf_blob, page_count, render_args, min(processes, page_count))
+        else:
+            pages = (render_page(doc, page_num, *render_args) for page_num in range(page_count))
+
+        for page_num, img_bytes in enumerate(pages):
+            if not img_bytes:
+                raise ValueError("Could not get image bytes for page {} of {}".format(page_num + 1, filename))
+            name = "{}_{}.{}".format(name_without_extension, page_num + 1, IMAGE_EXTENSIONS[image_format])
+            yield name, img_bytes
+    finally:
         doc.close()
-        return image_blobs
+
+
+def convert_pdf_blob_to_image_blobs(filename: str, pdf_blob: bytes, dpi: int = DEFAULT_PDF_DPI,
+                                    **render_options) -> Optional[List[Tuple[str, bytes]]]:
+    try:
+        return list(iter_pdf_pages_as_images(filename, pdf_blob, dpi=dpi, **render_options))
     except Exception as e:
         print(f"Error converting PDF to images: {e}")
         return None
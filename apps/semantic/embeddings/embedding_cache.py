@@ -0,0 +1,115 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+DEFAULT_EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embeddings/embedding-cache.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL
+);
+"""
+
+# SQLite limits the number of parameters of a statement
+MAX_KEYS_PER_QUERY = 500
+
+
+def normalize_text(text: str) -> str:
+    # Texts that only differ in unicode composition or whitespace get the same embedding
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def embedding_cache_key(model: str, task_type: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return "{}:{}:{}".format(model, task_type, digest)
+
+
+class EmbeddingCache:
+    """
+    Keeps embeddings by embedding_cache_key in memory.
+    """
+
+    def __init__(self):
+        self.embeddings = {}
+        self.lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        with self.lock:
+            return {key: self.embeddings[key] for key in keys if key in self.embeddings}
+
+    def put_many(self, embeddings: Dict[str, List[float]]) -> None:
+        with self.lock:
+            self.embeddings.update(embeddings)
+
+    def close(self):
+        pass
+
+
+class SqliteEmbeddingCache(EmbeddingCache):
+    """
+    Keeps embeddings by embedding_cache_key in a local SQLite file, so they survive restarts and
+    are shared by all processes on the host. Vectors are stored as float32 blobs.
+    """
+
+    def __init__(self, path=DEFAULT_EMBEDDING_CACHE_PATH):
+        super().__init__()
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        keys = list(keys)
+        embeddings = {}
+        with self.lock:
+            for start in range(0, len(keys), MAX_KEYS_PER_QUERY):
+                chunk = keys[start:start + MAX_KEYS_PER_QUERY]
+                rows = self.connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN ({})".format(",".join("?" * len(chunk))),
+                    chunk).fetchall()
+                for key, vector in rows:
+                    embeddings[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return embeddings
+
+    def put_many(self, embeddings: Dict[str, List[float]]) -> None:
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in embeddings.items()]
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+default_embedding_cache = None
+default_embedding_cache_lock = threading.Lock()
+
+
+def get_default_embedding_cache() -> EmbeddingCache:
+    """
+    Returns the embedding cache shared by all strategies of the process.
+    """
+    global default_embedding_cache
+    with default_embedding_cache_lock:
+        if default_embedding_cache is None:
+            default_embedding_cache = SqliteEmbeddingCache(DEFAULT_EMBEDDING_CACHE_PATH)
+        return default_embedding_cache
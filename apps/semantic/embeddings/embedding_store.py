@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from semantic.embeddings.similarity_index import SimilarityIndex, normalize_rows
+
+VECTOR_SUFFIX = ".npy"
+IDS_SUFFIX = ".ids.json"
+
+
+class EmbeddingStore:
+    """
+    An on-disk store for the embeddings of one taxonomy.
+
+    The vectors are kept row-normalized as float32 in a binary .npy file next to a JSON sidecar
+    holding the ids in row order. Opening the store memory-maps the vector file read-only, so
+    worker processes on the same host share the pages through the OS page cache instead of each
+    parsing and holding their own copy.
+
+    Args:
+        path (str): The path of the store without suffix (e.g. 'embeddings/Area').
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.vector_path = path + VECTOR_SUFFIX
+        self.ids_path = path + IDS_SUFFIX
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.vector_path) and os.path.isfile(self.ids_path)
+
+    def write(self, ids: Sequence[str], vectors) -> None:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError("Expected one vector per id, got shape {}".format(matrix.shape))
+
+        matrix = np.ascontiguousarray(normalize_rows(matrix))
+
+        # Each file is written next to its target and then renamed, so readers never observe a
+        # partially written file. The two renames are separate steps though: a reader opening the
+        # store between them sees the new vectors with the old ids, which open() rejects if the
+        # number of rows differs. Stores are meant to be rewritten while no worker is reading them.
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        self.__write_atomic(directory, self.vector_path, lambda f: np.save(f, matrix))
+        self.__write_atomic(directory, self.ids_path, lambda f: f.write(json.dumps(list(ids)).encode("utf-8")))
+
+    def open(self) -> SimilarityIndex:
+        with open(self.ids_path, "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        matrix = np.load(self.vector_path, mmap_mode="r")
+        if matrix.shape[0] != len(ids):
+            raise ValueError("Store '{}' has {} vectors but {} ids".format(self.path, matrix.shape[0], len(ids)))
+        return SimilarityIndex(ids, matrix, normalized=True)
+
+    @staticmethod
+    def __write_atomic(directory, target_path, write):
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def convert_ndjson_to_store(json_objects: List[Dict], store: EmbeddingStore) -> EmbeddingStore:
+    """
+    Converts parsed NDJSON embedding records into an embedding store.
+
+    Records may either use the taxonomy format ({"name": ..., "embedding": ...}) or the
+    vector search format written by generate_jsonl_from_embeddings ({"id": ..., "embedding": ...}).
+    """
+    ids = []
+    vectors = []
+    for json_object in json_objects:
+        key = json_object["name"] if "name" in json_object else json_object["id"]
+        ids.append(key)
+        vectors.append(json_object["embedding"])
+
+    if len(vectors) == 0:
+        raise ValueError("No embeddings to convert into '{}'".format(store.path))
+
+    store.write(ids, vectors)
+    return store
+
+
+if __name__ == "__main__":
+    import sys
+
+    from dotenv import load_dotenv
+
+    from semantic.classifiers.strategies.classifier_embeddings_gemini_v1 import load_taxonomy_embeddings_ndjson
+
+    load_dotenv()
+
+    store_dir = sys.argv[1] if len(sys.argv) > 1 else "./embeddings"
+
+    for taxonomy_name in ["Area", "Ability", "Scope"]:
+        print(f"Converting embeddings of {taxonomy_name}")
+        store = EmbeddingStore(os.path.join(store_dir, taxonomy_name))
+        convert_ndjson_to_store(load_taxonomy_embeddings_ndjson(taxonomy_name), store)
+        print(f"Wrote {store.vector_path}")
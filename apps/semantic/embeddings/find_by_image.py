@@ -1,8 +1,11 @@
-from typing import List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
 from google.cloud import aiplatform
 import os
+import sys
+import threading
 
 from semantic.embeddings.embedder_google import GoogleMultiModalEmbedder
 from google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint import MatchNeighbor, Namespace
@@ -28,6 +31,76 @@ def read_file_as_blob(relative_file_path: str) -> Optional[bytes]:
         print(f"An unexpected error occurred while reading '{absolute_file_path}': {e}")
         return None
 
+
+class VectorSearchClient:
+    """
+    A long-lived handle to a deployed Vertex AI Vector Search index. The AI Platform client is
+    initialized and the index endpoint is looked up once, on first use, and then reused for all
+    queries. LocalVectorIndex offers the same find_neighbors and query methods for offline use.
+    """
+
+    def __init__(self, project: str, location: str, index_endpoint: str, deployed_index: str,
+                 max_batch_size: int = 64):
+        """
+        Args:
+            project (str): The Google Cloud project.
+            location (str): The region of the index endpoint.
+            index_endpoint (str): The ID of your Index Endpoint, not the Index itself.
+            deployed_index (str): The ID of the deployed index on the endpoint.
+            max_batch_size (int): The maximum number of queries sent in one request.
+        """
+        self.project = project
+        self.location = location
+        self.index_endpoint = index_endpoint
+        self.deployed_index = deployed_index
+        self.max_batch_size = max_batch_size
+        self.endpoint = None
+        self.lock = threading.Lock()
+
+    def __endpoint(self):
+        if self.endpoint is None:
+            with self.lock:
+                if self.endpoint is None:
+                    aiplatform.init(project=self.project, location=self.location)
+                    self.endpoint = aiplatform.MatchingEngineIndexEndpoint(index_endpoint_name=self.index_endpoint)
+                    print(f"Initialized Index Endpoint: {self.index_endpoint}")
+        return self.endpoint
+
+    def find_neighbors(
+        self,
+        query_embeddings: List[List[float]],
+        num_neighbors: int = 5,
+        filter: Optional[List[Namespace]] = None,
+    ) -> List[List[MatchNeighbor]]:
+        """
+        Finds the neighbors of every query embedding, sending up to max_batch_size queries per request.
+        """
+        endpoint = self.__endpoint()
+        neighbors = []
+        for start in range(0, len(query_embeddings), self.max_batch_size):
+            neighbors.extend(endpoint.find_neighbors(
+                deployed_index_id=self.deployed_index,
+                queries=query_embeddings[start:start + self.max_batch_size],
+                filter=filter,
+                num_neighbors=num_neighbors
+            ))
+        return neighbors
+
+    def query(
+        self,
+        query_embedding: List[float],
+        num_neighbors: int = 5,
+        filter: Optional[List[Namespace]] = None,
+    ) -> List[MatchNeighbor]:
+        return self.find_neighbors([query_embedding], num_neighbors, filter)[0]
+
+
+@lru_cache(maxsize=None)
+def get_vector_search_client(project: str, location: str, index_endpoint: str,
+                             deployed_index: str) -> VectorSearchClient:
+    return VectorSearchClient(project, location, index_endpoint, deployed_index)
+
+
 def query_vector_search_index(
     project: str,
     location: str,
@@ -37,40 +110,49 @@ def query_vector_search_index(
     num_neighbors: int = 5,
     filter: Optional[List[Namespace]] = None,
 ) -> Optional[List[MatchNeighbor]]:
-    try:
-        # Initialize the AI Platform client
-        aiplatform.init(project=project, location=location)
-
-        # Get the Index Endpoint
-        endpoint = aiplatform.MatchingEngineIndexEndpoint(
-            index_endpoint_name=index_endpoint
-        )
-
-        print(f"Initialized Index Endpoint: {index_endpoint}")
-
-    except Exception as e:
-        print(f"An error occurred endpoint initialization: {e}")
-        return None
+    client = get_vector_search_client(project, location, index_endpoint, deployed_index)
 
     try:
         print(f"Querying neighbors for an embedding with {len(query_embedding)} dimensions")
 
-        # Perform the query
-        response = endpoint.find_neighbors(
-            deployed_index_id=deployed_index,
-            queries=[query_embedding], # Expects a list of queries
-            filter=filter,
-            num_neighbors=num_neighbors
-        )
+        neighbors = client.query(query_embedding, num_neighbors=num_neighbors, filter=filter)
 
-        print(f"Successfully queried index. Found {len(response[0]) if response else 0} neighbors.")
-        return response[0]
+        print(f"Successfully queried index. Found {len(neighbors)} neighbors.")
+        return neighbors
 
     except Exception as e:
         print(f"An error occurred during vector search query: {e}")
         return None
 
 
+def find_neighbors_of_files(
+    search_client,
+    embedder,
+    file_paths: List[str],
+    num_neighbors: int = 5,
+    filter: Optional[List[Namespace]] = None,
+) -> Dict[str, List[MatchNeighbor]]:
+    """
+    Embeds the files and looks up the neighbors of all of them with one batched search.
+
+    Args:
+        search_client: A VectorSearchClient or a LocalVectorIndex.
+        embedder: A GoogleMultiModalEmbedder.
+    """
+    embedded_paths = []
+    query_embeddings = []
+    for file_path in file_paths:
+        blob = read_file_as_blob(file_path)
+        if blob is None:
+            continue
+        embedded_paths.append(file_path)
+        query_embeddings.append(embedder.embed_document(file_path, blob)[0]["embedding"])
+
+    if len(query_embeddings) == 0:
+        return {}
+    neighbors = search_client.find_neighbors(query_embeddings, num_neighbors=num_neighbors, filter=filter)
+    return dict(zip(embedded_paths, neighbors))
+
 
 if __name__ == "__main__":
     load_dotenv()
@@ -78,32 +160,34 @@ if __name__ == "__main__":
     project = "edugraph-438718"
     location = "europe-west3"
 
-    query_file = "./temp/query-example-1.png"
-    query_blob = read_file_as_blob(query_file)
-
-    if query_blob is None:
-        exit(1)
-
     embedder = GoogleMultiModalEmbedder(
         model_name="multimodalembedding@001"
     )
 
-    query_embeddings = embedder.embed_document("query_file", query_blob)
-
-    neighbors = query_vector_search_index(
+    search_client = get_vector_search_client(
         project=project,
         location=location,
         index_endpoint="projects/575953891979/locations/europe-west3/indexEndpoints/6601907617818214400",
-        deployed_index="example_deploy_1749682778003",
-        query_embedding=query_embeddings[0]["embedding"],
+        deployed_index="example_deploy_1749682778003"
+    )
+
+    # A folder is looked up with one batched search, a single file as before
+    query_path = sys.argv[1] if len(sys.argv) > 1 else "./temp/query-example-1.png"
+    if os.path.isdir(query_path):
+        query_files = [os.path.join(query_path, name) for name in sorted(os.listdir(query_path))]
+    else:
+        query_files = [query_path]
+
+    neighbors_by_file = find_neighbors_of_files(
+        search_client,
+        embedder,
+        query_files,
         filter=[Namespace(
             name="type",
             allow_tokens=["taxonomy"]
         )]
     )
 
-    neighbor_ids = [(neighbor.id, neighbor.distance) for neighbor in neighbors]
-
-    print(neighbor_ids)
-
-
+    for query_file, neighbors in neighbors_by_file.items():
+        neighbor_ids = [(neighbor.id, neighbor.distance) for neighbor in neighbors]
+        print(query_file, neighbor_ids)
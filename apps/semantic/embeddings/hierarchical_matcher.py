@@ -0,0 +1,138 @@
+import heapq
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from semantic.embeddings.similarity_index import SimilarityIndex, normalize_rows
+
+
+class HierarchicalMatcher:
+    """
+    Matches queries against a taxonomy by descending its hierarchy instead of scoring every entry.
+
+    Starting with the roots, each level scores only the children of the beam_width nodes that
+    survived the previous level. Nodes are routed by the centroid of their subtree (their own
+    embedding and those of all their descendants), so a node whose subtree contains a good match
+    survives even if its own embedding is not close. Every node visited on the way is a candidate
+    and scored by its own embedding.
+
+    With a beam at least as wide as the widest level the result equals brute force matching,
+    narrower beams trade recall for scoring far fewer entries.
+
+    Queries descend one at a time, so this only pays off for taxonomies far larger than the
+    current ones, where scoring every entry dominates. Brute force is a single matrix product
+    and faster below that: with 4680 entries and 768 dimensions it takes 79.5 µs per query,
+    while a beam width of 1 takes 148 µs at a recall@1 of 0.77 and a beam width of 4 takes
+    245 µs at 0.976. With 584 entries every beam width is slower than brute force. Measure with
+    benchmark_hierarchical_matcher before enabling it.
+    """
+
+    def __init__(self, ids: Sequence[str], matrix: np.ndarray, children: Sequence[Sequence[int]],
+                 roots: Sequence[int], beam_width: int = 4, use_centroids: bool = True):
+        """
+        Args:
+            ids: The id of every row of the matrix.
+            matrix: The embedding of every node, one row per node.
+            children: The rows of the children of every node.
+            roots: The rows of the root nodes.
+            beam_width: How many nodes per level are descended into.
+            use_centroids: Route by subtree centroids instead of the nodes' own embeddings.
+        """
+        self.ids = list(ids)
+        self.matrix = normalize_rows(np.asarray(matrix, dtype=np.float32))
+        self.children = [np.asarray(node_children, dtype=np.intp) for node_children in children]
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.beam_width = beam_width
+        self.routing_matrix = self.__centroids() if use_centroids else self.matrix
+
+    def __centroids(self):
+        # Sums of the subtree embeddings, computed bottom-up so children are summed before their parents
+        sums = self.matrix.copy()
+        seen = np.zeros(len(self.ids), dtype=bool)
+        stack = [(row, False) for row in self.roots]
+        while len(stack) > 0:
+            row, children_summed = stack.pop()
+            if children_summed:
+                if len(self.children[row]) > 0:
+                    sums[row] = self.matrix[row] + sums[self.children[row]].sum(axis=0)
+                continue
+            if seen[row]:
+                continue
+            seen[row] = True
+            stack.append((row, True))
+            stack.extend((child, False) for child in self.children[row] if not seen[child])
+        return normalize_rows(sums)
+
+    @classmethod
+    def from_ontology_index(cls, onto_index, dimension: str, similarity_index: SimilarityIndex, **kwargs):
+        """
+        Builds a matcher over the hierarchy of a dimension of an OntologyIndex, using the embeddings
+        of a SimilarityIndex keyed by entity name. Entities without embedding are skipped and
+        their parts are attached to the closest ancestor with embedding.
+        """
+        rows = {name: row for row, name in enumerate(similarity_index.ids)}
+
+        def embedded_parts(node):
+            parts = []
+            for part in node.parts:
+                if part.name in rows:
+                    parts.append(rows[part.name])
+                else:
+                    parts.extend(embedded_parts(part))
+            return parts
+
+        children = [[] for _ in similarity_index.ids]
+        for name, row in rows.items():
+            if name in onto_index:
+                children[row] = embedded_parts(onto_index.node(name))
+
+        roots = []
+        for root in onto_index.root_nodes(dimension):
+            roots.extend([rows[root.name]] if root.name in rows else embedded_parts(root))
+
+        # Entries that are not reachable from the roots are still candidates on the first level
+        reachable = set(roots)
+        for node_children in children:
+            reachable.update(node_children)
+        roots.extend(row for row in range(len(rows)) if row not in reachable)
+
+        return cls(similarity_index.ids, similarity_index.matrix, children, roots, **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __search_one(self, query, k):
+        candidates = {}
+        frontier = self.roots
+        while len(frontier) > 0:
+            scores = self.matrix[frontier] @ query
+            candidates.update(zip(frontier.tolist(), scores.tolist()))
+
+            if len(frontier) > self.beam_width:
+                routing_scores = self.routing_matrix[frontier] @ query
+                beam = frontier[np.argpartition(-routing_scores, self.beam_width - 1)[:self.beam_width]]
+            else:
+                beam = frontier
+
+            next_children = [self.children[row] for row in beam if len(self.children[row]) > 0]
+            # Nodes with several parents are only visited once
+            frontier = np.unique(np.concatenate(next_children)) if len(next_children) > 0 \
+                else np.empty(0, dtype=np.intp)
+
+        best = heapq.nlargest(k, candidates.items(), key=lambda candidate: candidate[1])
+        return [(self.ids[row], float(score)) for row, score in best]
+
+    def search(self, queries, k: int = 1) -> List[List[Tuple[str, float]]]:
+        """
+        Finds the k most similar nodes visited for each query, like SimilarityIndex.search.
+        """
+        if len(self.ids) == 0:
+            raise ValueError("Cannot match against an empty hierarchy")
+        query_matrix = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        return [self.__search_one(query, k) for query in query_matrix]
+
+    def best_matches(self, queries) -> List[str]:
+        return [matches[0][0] for matches in self.search(queries, k=1)]
+
+    def best_match(self, query) -> str:
+        return self.best_matches([query])[0]
@@ -0,0 +1,254 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint import MatchNeighbor, Namespace
+
+from semantic.embeddings.similarity_index import normalize_rows
+
+# Rows scored at once while clustering, bounds the memory of the score matrix
+ASSIGNMENT_CHUNK_SIZE = 8192
+
+
+def read_jsonl_records(paths: Iterable[str]) -> List[Dict]:
+    """
+    Reads the records of JSONL files as written by generate_jsonl_from_embeddings and add_label.
+    """
+    records = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+    return records
+
+
+def kmeans(matrix: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Clusters row-normalized vectors by cosine similarity and returns the normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), size=n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_to_centroids(matrix, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, matrix)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Empty clusters are re-seeded with random vectors
+        empty = counts == 0
+        sums[empty] = matrix[rng.choice(len(matrix), size=int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def assign_to_centroids(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignments = np.empty(len(matrix), dtype=np.intp)
+    for start in range(0, len(matrix), ASSIGNMENT_CHUNK_SIZE):
+        chunk = matrix[start:start + ASSIGNMENT_CHUNK_SIZE]
+        assignments[start:start + ASSIGNMENT_CHUNK_SIZE] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class LocalVectorIndex:
+    """
+    An inverted file (IVF) index of embeddings that answers the queries Vertex AI Vector Search
+    answers for query_vector_search_index, but locally and offline.
+
+    Vectors are row-normalized and clustered with k-means into n_lists lists, and stored sorted by
+    list so that every list is a contiguous block of rows. A query scores the list centroids, then
+    only the blocks of the n_probe closest lists. Like a Vertex index with
+    DOT_PRODUCT_DISTANCE, the distance of a neighbor is its dot product with the query (higher is
+    closer). Restricts follow the Vertex semantics: for every Namespace of the filter, a datapoint
+    must carry one of the allow_tokens (if any are given) and none of the deny_tokens, and it is
+    excluded if one of the query's allow tokens is in its own deny list.
+    """
+
+    def __init__(self, ids: Sequence[str], matrix: np.ndarray, restricts: Sequence[Sequence[Dict]],
+                 centroids: np.ndarray, assignments: np.ndarray, n_probe: int = 8):
+        """
+        Args:
+            ids, matrix, restricts: The datapoints, sorted by their list.
+            centroids: The normalized centroid of every list.
+            assignments: The list of every datapoint.
+            n_probe: The number of lists a query searches by default.
+        """
+        if np.any(np.diff(assignments) < 0):
+            raise ValueError("Datapoints must be sorted by their list")
+        self.ids = list(ids)
+        self.matrix = matrix
+        self.restricts = [list(datapoint_restricts) for datapoint_restricts in restricts]
+        self.centroids = centroids
+        self.assignments = assignments
+        self.n_probe = n_probe
+
+        # The rows of list i are boundaries[i]:boundaries[i + 1]
+        self.boundaries = np.searchsorted(assignments, np.arange(len(centroids) + 1))
+        self.allow_masks, self.deny_masks = self.__token_masks()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, ids: Sequence[str], vectors, restricts: Optional[Sequence[Sequence[Dict]]] = None,
+              n_lists: Optional[int] = None, n_probe: int = 8, seed: int = 0) -> "LocalVectorIndex":
+        """
+        Args:
+            ids: The datapoint ids.
+            vectors: The embeddings, one per id.
+            restricts: The restricts of every datapoint in the JSONL format
+                       ([{"namespace": ..., "allow": [...], "deny": [...]}]).
+            n_lists: The number of lists, about the square root of the number of vectors by default.
+            n_probe: The number of lists a query searches by default.
+        """
+        matrix = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        if len(matrix) == 0:
+            raise ValueError("Cannot build a vector index without vectors")
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(len(matrix))))
+        n_lists = min(n_lists, len(matrix))
+
+        centroids = kmeans(matrix, n_lists, seed=seed)
+        assignments = assign_to_centroids(matrix, centroids)
+        if restricts is None:
+            restricts = [[] for _ in ids]
+
+        order = np.argsort(assignments, kind="stable")
+        return cls([ids[row] for row in order], matrix[order], [restricts[row] for row in order],
+                   centroids, assignments[order], n_probe=n_probe)
+
+    @classmethod
+    def from_jsonl(cls, paths: Iterable[str], **kwargs) -> "LocalVectorIndex":
+        records = read_jsonl_records(paths)
+        return cls.build(
+            [record["id"] for record in records],
+            [record["embedding"] for record in records],
+            [record.get("restricts", []) for record in records],
+            **kwargs
+        )
+
+    def __token_masks(self):
+        allow_masks = {}
+        deny_masks = {}
+        for row, datapoint_restricts in enumerate(self.restricts):
+            for restrict in datapoint_restricts:
+                namespace = restrict["namespace"]
+                for masks, tokens in [(allow_masks, restrict.get("allow", [])),
+                                      (deny_masks, restrict.get("deny", []))]:
+                    namespace_masks = masks.setdefault(namespace, {})
+                    for token in tokens:
+                        if token not in namespace_masks:
+                            namespace_masks[token] = np.zeros(len(self.ids), dtype=bool)
+                        namespace_masks[token][row] = True
+        return allow_masks, deny_masks
+
+    def __tokens_mask(self, masks, namespace, tokens):
+        mask = np.zeros(len(self.ids), dtype=bool)
+        for token in tokens:
+            token_mask = masks.get(namespace, {}).get(token)
+            if token_mask is not None:
+                mask |= token_mask
+        return mask
+
+    def filter_mask(self, filter: Optional[List[Namespace]]) -> Optional[np.ndarray]:
+        """
+        Returns which datapoints pass the filter, or None if everything passes.
+        """
+        if not filter:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        for namespace in filter:
+            if namespace.allow_tokens:
+                mask &= self.__tokens_mask(self.allow_masks, namespace.name, namespace.allow_tokens)
+                mask &= ~self.__tokens_mask(self.deny_masks, namespace.name, namespace.allow_tokens)
+            if namespace.deny_tokens:
+                mask &= ~self.__tokens_mask(self.allow_masks, namespace.name, namespace.deny_tokens)
+        return mask
+
+    def __score_lists(self, query, lists, mask):
+        rows = []
+        scores = []
+        for i in lists:
+            start, end = self.boundaries[i], self.boundaries[i + 1]
+            list_rows = np.arange(start, end)
+            list_scores = self.matrix[start:end] @ query
+            if mask is not None:
+                passing = mask[start:end]
+                list_rows = list_rows[passing]
+                list_scores = list_scores[passing]
+            rows.append(list_rows)
+            scores.append(list_scores)
+        return rows, scores
+
+    def __search_one(self, query, num_neighbors, mask, n_probe):
+        centroid_order = np.argsort(-(self.centroids @ query))
+        probed = min(self.n_lists, n_probe)
+        rows, scores = self.__score_lists(query, centroid_order[:probed], mask)
+
+        # Probes more lists while a restrictive filter leaves too few candidates
+        while sum(len(list_rows) for list_rows in rows) < num_neighbors and probed < self.n_lists:
+            more = min(self.n_lists, probed * 2)
+            more_rows, more_scores = self.__score_lists(query, centroid_order[probed:more], mask)
+            rows.extend(more_rows)
+            scores.extend(more_scores)
+            probed = more
+
+        rows = np.concatenate(rows)
+        scores = np.concatenate(scores)
+        if len(rows) > num_neighbors:
+            top = np.argpartition(-scores, num_neighbors - 1)[:num_neighbors]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top])]
+        return [MatchNeighbor(id=self.ids[rows[i]], distance=float(scores[i])) for i in top]
+
+    def find_neighbors(self, queries, num_neighbors: int = 5, filter: Optional[List[Namespace]] = None,
+                       n_probe: Optional[int] = None) -> List[List[MatchNeighbor]]:
+        """
+        Finds the neighbors of every query, like MatchingEngineIndexEndpoint.find_neighbors.
+        """
+        query_matrix = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        mask = self.filter_mask(filter)
+        n_probe = self.n_probe if n_probe is None else n_probe
+        return [self.__search_one(query, num_neighbors, mask, n_probe) for query in query_matrix]
+
+    def query(self, query_embedding: List[float], num_neighbors: int = 5,
+              filter: Optional[List[Namespace]] = None) -> Optional[List[MatchNeighbor]]:
+        """
+        Finds the neighbors of one embedding, like query_vector_search_index.
+        """
+        return self.find_neighbors([query_embedding], num_neighbors, filter)[0]
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "vectors.npy"), self.matrix)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "assignments.npy"), self.assignments)
+        with open(os.path.join(directory, "datapoints.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "restricts": self.restricts, "n_probe": self.n_probe}, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "LocalVectorIndex":
+        with open(os.path.join(directory, "datapoints.json"), "r", encoding="utf-8") as f:
+            datapoints = json.load(f)
+        return cls(
+            datapoints["ids"],
+            np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r"),
+            datapoints["restricts"],
+            np.load(os.path.join(directory, "centroids.npy")),
+            np.load(os.path.join(directory, "assignments.npy")),
+            n_probe=datapoints["n_probe"],
+        )
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python -m semantic.embeddings.local_vector_index <index dir> <jsonl files...>
+    index = LocalVectorIndex.from_jsonl(sys.argv[2:])
+    index.save(sys.argv[1])
+    print(f"Indexed {len(index)} datapoints in {index.n_lists} lists into '{sys.argv[1]}'")
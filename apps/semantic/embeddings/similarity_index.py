@@ -0,0 +1,97 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Scales every row of a matrix to unit length. Zero rows are left as zero rows so that
+    they score 0.0 against every query, matching the behaviour of cosine_similarity.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class SimilarityIndex:
+    """
+    Holds the embeddings of one taxonomy as a contiguous, row-normalized float32 matrix so that
+    a whole batch of queries can be scored against all candidates with a single matrix product.
+
+    Args:
+        ids (Sequence[str]): The candidate ids (entity names), one per matrix row.
+        matrix (np.ndarray): The candidate embeddings with shape (len(ids), dimensions).
+        normalized (bool): Set to True if the rows of the matrix are already unit length, in which
+                           case the matrix is used as is (e.g. a memory-mapped array).
+    """
+
+    def __init__(self, ids: Sequence[str], matrix: np.ndarray, normalized: bool = False):
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError("Expected a matrix with one row per id, got shape {}".format(matrix.shape))
+
+        self.ids = list(ids)
+        if normalized and matrix.dtype == np.float32:
+            self.matrix = matrix
+        else:
+            self.matrix = np.ascontiguousarray(normalize_rows(np.asarray(matrix, dtype=np.float32)))
+
+    @classmethod
+    def from_embedding_map(cls, embedding_map: Dict[str, Sequence[float]]) -> "SimilarityIndex":
+        ids = list(embedding_map.keys())
+        if len(ids) == 0:
+            return cls([], np.empty((0, 0), dtype=np.float32))
+        return cls(ids, np.array([embedding_map[key] for key in ids], dtype=np.float32))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def score(self, queries) -> np.ndarray:
+        """
+        Computes the cosine similarity of every query against every candidate.
+
+        Returns:
+            np.ndarray: A matrix with shape (len(queries), len(self)).
+        """
+        query_matrix = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        return normalize_rows(query_matrix) @ self.matrix.T
+
+    def search(self, queries, k: int = 1) -> List[List[Tuple[str, float]]]:
+        """
+        Finds the k most similar candidates for each query.
+
+        Returns:
+            List[List[Tuple[str, float]]]: For each query, up to k (id, similarity) tuples ordered
+                                           from most to least similar.
+        """
+        if len(self.ids) == 0:
+            return [[] for _ in np.atleast_2d(np.asarray(queries))]
+
+        scores = self.score(queries)
+        k = min(k, scores.shape[1])
+
+        # Partial selection of the top k columns per row, only those k get sorted
+        if k < scores.shape[1]:
+            top_columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top_columns = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        top_scores = np.take_along_axis(scores, top_columns, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top_columns = np.take_along_axis(top_columns, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        return [
+            [(self.ids[column], float(score)) for column, score in zip(columns, row_scores)]
+            for columns, row_scores in zip(top_columns, top_scores)
+        ]
+
+    def best_matches(self, queries) -> List[str]:
+        """
+        Returns the id of the most similar candidate for each query.
+        """
+        if len(self.ids) == 0:
+            raise ValueError("Cannot match against an empty similarity index")
+        best_columns = np.argmax(self.score(queries), axis=1)
+        return [self.ids[column] for column in best_columns]
+
+    def best_match(self, query) -> str:
+        return self.best_matches([query])[0]
@@ -1,58 +1,81 @@
+import contextvars
 import typing
+from concurrent.futures import ThreadPoolExecutor
 
 from google import genai
 from google.genai import types
 
+from semantic.call_scheduler import get_default_scheduler
+from semantic.embeddings.embedding_cache import embedding_cache_key, get_default_embedding_cache
 from semantic.embeddings.embedding_strategy import EmbeddingStrategy
 
+CHUNK_SIZE = 20
+
 
 class GeminiEmbeddingStrategy(EmbeddingStrategy):
-    def __init__(self, client=None):
+    def __init__(self, client=None, scheduler=None, cache=None, max_concurrency=4):
+        """
+        Args:
+            client (genai.Client): The client to use, a new one is created by default.
+            scheduler (CallScheduler): Schedules the calls to the model, the scheduler shared by the
+                                       process by default.
+            cache (EmbeddingCache): Remembers embedded texts, the cache shared by the process by default.
+            max_concurrency (int): The maximum number of chunks embedded at once by this strategy.
+        """
         if client is None:
             self.client = genai.Client()
         else:
             self.client = client
-
-    def embed_entry(self, entry) -> list:
-
-        response = self.client.models.embed_content(
-            model="embedding-001",
-            contents=entry,
-            config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY")
+        self.scheduler = get_default_scheduler() if scheduler is None else scheduler
+        self.cache = get_default_embedding_cache() if cache is None else cache
+        self.model = "embedding-001"
+        self.task_type = "SEMANTIC_SIMILARITY"
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gemini-embedding")
+
+    def __embed_chunk(self, chunk):
+        response = self.scheduler.call(
+            self.model,
+            self.client.models.embed_content,
+            model=self.model,
+            contents=chunk,
+            config=types.EmbedContentConfig(task_type=self.task_type)
         )
+        return [embedding.values for embedding in response.embeddings]
+
+    def __embed_texts(self, texts):
+        """
+        Returns the embeddings of the texts in their order, only embedding texts that are not cached.
+        """
+        keys = [embedding_cache_key(self.model, self.task_type, text) for text in texts]
+        embeddings = self.cache.get_many(set(keys))
+
+        # Texts that normalize to the same key are embedded once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in embeddings and key not in missing:
+                missing[key] = text
+
+        if len(missing) > 0:
+            missing_keys = list(missing.keys())
+            missing_texts = list(missing.values())
+            chunks = [missing_texts[i:i + CHUNK_SIZE] for i in range(0, len(missing_texts), CHUNK_SIZE)]
+
+            # Chunks run in copies of the caller's context, so they keep e.g. the call priority
+            futures = [self.executor.submit(contextvars.copy_context().run, self.__embed_chunk, chunk)
+                       for chunk in chunks]
+            new_embeddings = {}
+            for start, future in zip(range(0, len(missing_texts), CHUNK_SIZE), futures):
+                new_embeddings.update(zip(missing_keys[start:start + CHUNK_SIZE], future.result()))
+
+            self.cache.put_many(new_embeddings)
+            embeddings.update(new_embeddings)
+
+        return [embeddings[key] for key in keys]
 
-        return response.embeddings[0].values
+    def embed_entry(self, entry) -> list:
+        return self.__embed_texts([entry])[0]
 
     def embed_entries(self, entry_map: typing.Dict) -> typing.Dict:
-
-        def split_list_into_chunks(data_list, chunk_size):
-            chunks = []
-            for i in range(0, len(data_list), chunk_size):
-                chunks.append(data_list[i:i + chunk_size])
-            return chunks
-
-        # We want to make sure that we preserve order this is why we work with tuples
-
-        entry_tuples = list(entry_map.items())
-        entry_keys = [item[0] for item in entry_tuples]
-        entry_values = [item[1] for item in entry_tuples]
-
-        entry_value_chunks = split_list_into_chunks(entry_values, 20)
-        embeddings = []
-
-        for index, entry_value_chunk in enumerate(entry_value_chunks):
-            print("Processing chunk {}".format(index))
-            response = self.client.models.embed_content(
-                model="embedding-001",
-                contents=entry_value_chunk,
-                config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY")
-            )
-            embeddings.extend(response.embeddings)
-
-        # Because we preserved order we can simply zip the original keys with the returned embeddings
-
-        embeddings_values =  map(lambda x: x.values, embeddings)
-
-        return dict(zip(entry_keys, embeddings_values))
-
-
+        # Embeddings are returned in the order of the texts, so keys can simply be zipped with them
+        entry_keys = list(entry_map.keys())
+        return dict(zip(entry_keys, self.__embed_texts(list(entry_map.values()))))
@@ -1,30 +1,133 @@
 import datetime
+import threading
+import time
 
-import google.generativeai as gemini
-from google.generativeai import caching
+from google.genai import types
+
+ONE_HOUR = datetime.timedelta(minutes=60)
+TEN_MINUTES = datetime.timedelta(minutes=10)
+FIVE_MINUTES = datetime.timedelta(minutes=5)
+
+
+def context_cache_name(prefix, model, ontology_version):
+    """
+    Names a context cache after its content, the model and the ontology version, so that all
+    workers share one cache per combination and a new ontology version gets a new cache.
+    """
+    return "{}-{}-{}".format(prefix, model, ontology_version[:12])
 
 
 class GeminiContextCache:
-    def __init__(self, name, model, system_instruction, content):
+    """
+    Holds static prompt content (e.g. a serialized taxonomy and a system instruction) in Gemini
+    cached content, so that it does not have to be sent with every request.
+
+    get() returns the name of the cached content to pass as GenerateContentConfig.cached_content,
+    or None when caching is not available (e.g. the content is below the model's minimum size for
+    caching or the API call failed). Callers then fall back to sending the content inline until
+    the cache is tried again after retry_interval.
+    """
+
+    def __init__(self, client, name, model, system_instruction, content, ttl=ONE_HOUR, refresh_margin=TEN_MINUTES,
+                 retry_interval=FIVE_MINUTES):
+        self.client = client
         self.name = name
         self.system_instruction = system_instruction
         self.content = content
         self.model = model
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+
+        self.cached_content = None
+        self.retry_at = 0.0
+        self.lock = threading.Lock()
+
+        self.refresher = None
+        self.refresher_stopped = threading.Event()
 
     def get(self):
+        if time.monotonic() < self.retry_at:
+            return None
+
+        cached_content = self.cached_content
+        if cached_content is not None and not self.__expires_soon(cached_content):
+            return cached_content.name
+
+        with self.lock:
+            if self.cached_content is None or self.__expires_soon(self.cached_content):
+                try:
+                    self.cached_content = self.__retrieve() or self.__build()
+                except Exception as e:
+                    print(f"Context cache '{self.name}' not available, falling back to inline prompts: {e}")
+                    self.cached_content = None
+                    self.retry_at = time.monotonic() + self.retry_interval.total_seconds()
+                    return None
+            return self.cached_content.name
+
+    def refresh(self):
+        """
+        Extends the TTL of the cached content. If the content is gone it is rebuilt on the next get().
+        """
+        cached_content = self.cached_content
+        if cached_content is None:
+            return
         try:
-            return self.__retrieve()
+            self.cached_content = self.client.caches.update(
+                name=cached_content.name,
+                config=types.UpdateCachedContentConfig(ttl=self.__ttl_string()),
+            )
         except Exception as e:
-            return self.__build()
+            print(f"Could not refresh context cache '{self.name}': {e}")
+            with self.lock:
+                self.cached_content = None
+
+    def start_refresher(self):
+        """
+        Starts a daemon thread that refreshes the TTL before the cached content expires.
+        """
+        if self.refresher is not None:
+            return
+        self.refresher_stopped.clear()
+        interval = (self.ttl - self.refresh_margin).total_seconds()
+
+        def run():
+            while not self.refresher_stopped.wait(interval):
+                self.refresh()
+
+        self.refresher = threading.Thread(target=run, name=f"context-cache-{self.name}", daemon=True)
+        self.refresher.start()
+
+    def stop_refresher(self):
+        if self.refresher is None:
+            return
+        self.refresher_stopped.set()
+        self.refresher.join()
+        self.refresher = None
+
+    def __expires_soon(self, cached_content):
+        if cached_content.expire_time is None:
+            return False
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return cached_content.expire_time - now < self.refresh_margin
+
+    def __ttl_string(self):
+        return "{}s".format(int(self.ttl.total_seconds()))
 
     def __retrieve(self):
-        return gemini.caching.CachedContent.get(self.name)
+        # Another worker might already have created the cache for this name
+        for cached_content in self.client.caches.list():
+            if cached_content.display_name == self.name and not self.__expires_soon(cached_content):
+                return cached_content
+        return None
 
     def __build(self):
-        return caching.CachedContent.create(
+        return self.client.caches.create(
             model=self.model,
-            display_name=self.name,  # used to identify the cache
-            system_instruction=self.system_instruction,
-            contents=self.content,
-            ttl=datetime.timedelta(minutes=60),
+            config=types.CreateCachedContentConfig(
+                display_name=self.name,  # used to identify the cache
+                system_instruction=self.system_instruction,
+                contents=self.content,
+                ttl=self.__ttl_string(),
+            )
         )
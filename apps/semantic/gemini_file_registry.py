@@ -0,0 +1,182 @@
+import datetime
+import threading
+import time
+
+from google import genai
+from google.genai.types import UploadFileConfig
+
+# Files uploaded to the Gemini Files API are deleted by the service after 48 hours
+FILE_LIFETIME = datetime.timedelta(hours=48)
+ONE_HOUR = datetime.timedelta(hours=1)
+TEN_MINUTES = datetime.timedelta(minutes=10)
+
+
+def gemini_file_name(content_digest):
+    # Gemini file names are limited to 40 lowercase alphanumeric characters or dashes
+    return content_digest[:40]
+
+
+class GeminiFileRegistry:
+    """
+    Remembers which contents are already uploaded to the Gemini Files API, keyed by content digest,
+    together with their server-side expiry.
+
+    Known files are returned without any network round-trip. Entries are purged ahead of the
+    server-side expiry (the Files API offers no way to extend it), so the next request uploads
+    the content again instead of referencing a file that is about to vanish. As file names are
+    derived from the digest, the expiring file is deleted before it is uploaded again. Concurrent requests
+    for the same digest upload it only once.
+    """
+
+    def __init__(self, client=None, expiry_margin=ONE_HOUR):
+        self.client = client
+        self.expiry_margin = expiry_margin.total_seconds()
+        self.files = {}
+        self.lock = threading.Lock()
+        self.upload_locks = {}
+
+        self.hits = 0
+        self.uploads = 0
+        self.purges = 0
+        self.replacements = 0
+
+        self.sweeper = None
+        self.sweeper_stopped = threading.Event()
+
+    def __client(self):
+        if self.client is None:
+            self.client = genai.Client()
+        return self.client
+
+    def __usable(self, entry):
+        _, expires_at = entry
+        return expires_at - time.time() > self.expiry_margin
+
+    def get(self, content_digest):
+        entry = self.files.get(content_digest)
+        if entry is not None and self.__usable(entry):
+            return entry[0]
+        return None
+
+    def get_or_upload(self, content_digest, content, mime_type):
+        """
+        Returns the Gemini file of the content, uploading the content only if it is not known yet.
+
+        Args:
+            content_digest (str): The hex digest of the content.
+            content: A binary file-like object with the content, only read when uploading.
+            mime_type (str): The mime type of the content.
+        """
+        file = self.get(content_digest)
+        if file is not None:
+            with self.lock:
+                self.hits += 1
+            return file
+
+        with self.lock:
+            upload_lock = self.upload_locks.setdefault(content_digest, threading.Lock())
+
+        with upload_lock:
+            # A concurrent request might have uploaded the content while we were waiting
+            file = self.get(content_digest)
+            if file is not None:
+                with self.lock:
+                    self.hits += 1
+                return file
+
+            try:
+                file = self.__upload(content_digest, content, mime_type)
+                with self.lock:
+                    self.files[content_digest] = (file, self.__expires_at(file))
+                    self.uploads += 1
+                return file
+            finally:
+                with self.lock:
+                    self.upload_locks.pop(content_digest, None)
+
+    def __upload(self, content_digest, content, mime_type):
+        name = gemini_file_name(content_digest)
+        if content_digest in self.files:
+            # The file about to expire still holds the name, an upload under it would fail
+            self.__replace(name)
+        try:
+            return self.__upload_file(name, content, mime_type)
+        except Exception as upload_error:
+            # The file might already exist, e.g. uploaded by another worker or before a restart
+            try:
+                file = self.__client().files.get(name=name)
+            except Exception:
+                raise upload_error
+            if self.__usable((file, self.__expires_at(file))):
+                return file
+
+        # The existing file is about to expire as well
+        self.__replace(name)
+        content.seek(0)
+        return self.__upload_file(name, content, mime_type)
+
+    def __upload_file(self, name, content, mime_type):
+        return self.__client().files.upload(
+            file=content,
+            config=UploadFileConfig(name=name, mime_type=mime_type)
+        )
+
+    def __replace(self, name):
+        try:
+            self.__client().files.delete(name=name)
+        except Exception as e:
+            # Already gone, e.g. expired or replaced by another worker
+            print(f"Could not delete Gemini file {name} before replacing it: {e}")
+        with self.lock:
+            self.replacements += 1
+
+    @staticmethod
+    def __expires_at(file):
+        expiration_time = getattr(file, "expiration_time", None)
+        if isinstance(expiration_time, datetime.datetime):
+            return expiration_time.timestamp()
+        return time.time() + FILE_LIFETIME.total_seconds()
+
+    def forget(self, content_digest):
+        with self.lock:
+            self.files.pop(content_digest, None)
+
+    def purge(self):
+        """
+        Removes all entries that expire within the expiry margin and returns how many were removed.
+        """
+        with self.lock:
+            expiring_digests = [digest for digest, entry in self.files.items() if not self.__usable(entry)]
+            for digest in expiring_digests:
+                del self.files[digest]
+            self.purges += len(expiring_digests)
+        return len(expiring_digests)
+
+    def start_sweeper(self, interval=TEN_MINUTES):
+        if self.sweeper is not None:
+            return
+        self.sweeper_stopped.clear()
+
+        def run():
+            while not self.sweeper_stopped.wait(interval.total_seconds()):
+                self.purge()
+
+        self.sweeper = threading.Thread(target=run, name="gemini-file-registry-sweeper", daemon=True)
+        self.sweeper.start()
+
+    def stop_sweeper(self):
+        if self.sweeper is None:
+            return
+        self.sweeper_stopped.set()
+        self.sweeper.join()
+        self.sweeper = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "files": len(self.files),
+                "hits": self.hits,
+                "uploads": self.uploads,
+                "purges": self.purges,
+                "replacements": self.replacements,
+            }
@@ -0,0 +1,146 @@
+from types import MappingProxyType
+
+from semantic.ontology_util import natural_name_of_entity_name, definition_of_entity, OntologyUtil
+
+DIMENSIONS = ["Area", "Ability", "Scope"]
+
+
+class OntologyNode:
+    """
+    A read-only view of one entity in an OntologyIndex.
+
+    Besides its own attributes, a node answers the owlready2 attributes that ontology_util,
+    context_builder and ontology_serializer read from entities (INDIRECT_hasPart,
+    INDIRECT_partOf, isDefinedBy and the object properties such as hasPartArea), so it can be
+    passed wherever an entity is expected.
+    """
+
+    __slots__ = ("index", "id", "name", "natural_name", "definition")
+
+    def __init__(self, index, entity_id, name, natural_name, definition):
+        object.__setattr__(self, "index", index)
+        object.__setattr__(self, "id", entity_id)
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "natural_name", natural_name)
+        object.__setattr__(self, "definition", definition)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("OntologyNode is read-only")
+
+    def __repr__(self):
+        return "OntologyNode({})".format(self.name)
+
+    @property
+    def parts(self):
+        return self.index.nodes_of(self.index.parts[self.id])
+
+    @property
+    def parents(self):
+        return self.index.nodes_of(self.index.parents[self.id])
+
+    @property
+    def expansions(self):
+        return self.index.nodes_of(self.index.expansions[self.id])
+
+    @property
+    def INDIRECT_hasPart(self):
+        return self.parts
+
+    @property
+    def INDIRECT_partOf(self):
+        return self.parents
+
+    @property
+    def isDefinedBy(self):
+        return [self.definition] if len(self.definition) > 0 else []
+
+    def __getattr__(self, relation_name):
+        # Only called for attributes that are not defined above, i.e. object properties
+        index = object.__getattribute__(self, "index")
+        if relation_name not in index.relation_names:
+            raise AttributeError(relation_name)
+        entity_id = object.__getattribute__(self, "id")
+        return index.nodes_of(index.relations[entity_id].get(relation_name, ()))
+
+
+class OntologyIndex:
+    """
+    A frozen, in-memory snapshot of a loaded ontology built once at startup.
+
+    Entities are mapped to integer ids. Parts, parents, expansions and all direct object property
+    values are held as tuples of ids, natural names and definitions are precomputed, and the
+    root entities of each dimension are listed up front. Reading from the index never queries
+    owlready2.
+    """
+
+    def __init__(self, onto):
+        entities = list(onto.individuals())
+        ids = {entity: entity_id for entity_id, entity in enumerate(entities)}
+
+        def ids_of(related_entities):
+            return tuple(ids[entity] for entity in related_entities if entity in ids)
+
+        object_properties = list(onto.object_properties())
+
+        names = []
+        natural_names = []
+        definitions = []
+        parts = []
+        parents = []
+        expansions = []
+        relations = []
+
+        for entity in entities:
+            names.append(entity.name)
+            natural_names.append(natural_name_of_entity_name(entity.name))
+            definitions.append(definition_of_entity(entity))
+            parts.append(ids_of(entity.INDIRECT_hasPart or []))
+            parents.append(ids_of(entity.INDIRECT_partOf or []))
+            expansions.append(ids_of(entity.INDIRECT_expands or []) if hasattr(entity, "INDIRECT_expands") else ())
+
+            entity_relations = {}
+            for object_property in object_properties:
+                related_ids = ids_of(getattr(entity, object_property.python_name, None) or [])
+                if len(related_ids) > 0:
+                    entity_relations[object_property.python_name] = related_ids
+            relations.append(MappingProxyType(entity_relations))
+
+        onto_util = OntologyUtil(onto)
+        roots = {}
+        for dimension in DIMENSIONS:
+            dimension_class = getattr(onto, dimension, None)
+            if dimension_class is not None:
+                roots[dimension] = ids_of(onto_util.list_root_entities(dimension_class))
+
+        self.names = tuple(names)
+        self.natural_names = tuple(natural_names)
+        self.definitions = tuple(definitions)
+        self.parts = tuple(parts)
+        self.parents = tuple(parents)
+        self.expansions = tuple(expansions)
+        self.relations = tuple(relations)
+        self.relation_names = frozenset(object_property.python_name for object_property in object_properties)
+        self.roots = MappingProxyType(roots)
+        self.ids = MappingProxyType({name: entity_id for entity_id, name in enumerate(names)})
+        self.nodes = tuple(
+            OntologyNode(self, entity_id, names[entity_id], natural_names[entity_id], definitions[entity_id])
+            for entity_id in range(len(names))
+        )
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def id_of(self, name):
+        return self.ids[name]
+
+    def node(self, name):
+        return self.nodes[self.ids[name]]
+
+    def nodes_of(self, entity_ids):
+        return [self.nodes[entity_id] for entity_id in entity_ids]
+
+    def root_nodes(self, dimension):
+        return self.nodes_of(self.roots.get(dimension, ()))
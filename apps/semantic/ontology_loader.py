@@ -1,4 +1,8 @@
-from owlready2 import get_ontology
+import hashlib
+import os
+import tempfile
+
+from owlready2 import get_ontology, World
 
 BASE_IRI = "http://edugraph.io/edu#"
 
@@ -7,3 +11,62 @@ def load_from_path(path):
     onto = get_ontology(path).load()
     onto.base_iri = BASE_IRI
     return onto
+
+
+def ontology_version_of_path(path):
+    """
+    Identifies the version of a local ontology file by the SHA-256 digest of its content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def world_path_of_ontology(path, world_dir):
+    return os.path.join(world_dir, "ontology-{}.sqlite3".format(ontology_version_of_path(path)))
+
+
+def compile_world(path, world_path):
+    """
+    Parses the ontology file once into a persistent SQLite-backed owlready2 world.
+    """
+    world_dir = os.path.dirname(world_path) or "."
+    os.makedirs(world_dir, exist_ok=True)
+
+    # Compiled next to the target and renamed, so concurrent workers never open a partial world
+    fd, tmp_path = tempfile.mkstemp(dir=world_dir, prefix=".tmp-", suffix=".sqlite3")
+    os.close(fd)
+    os.remove(tmp_path)
+    try:
+        world = World(filename=tmp_path)
+        onto = world.get_ontology(path).load()
+        onto.base_iri = BASE_IRI
+        world.save()
+        world.close()
+
+        # owlready2 registers every ontology of a world on opening, which writes to the quadstore
+        # the first time. Doing that once here lets all later starts open the world read-only.
+        world = World(filename=tmp_path)
+        world.get_ontology(BASE_IRI)
+        world.save()
+        world.close()
+        os.replace(tmp_path, world_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_from_world(path, world_dir):
+    """
+    Loads the ontology from a persistent world compiled from the file at path. The world file is
+    keyed by the digest of the ontology file, so it is compiled on the first start after the
+    ontology changed and opened read-only without parsing RDF on every later start.
+    """
+    world_path = world_path_of_ontology(path, world_dir)
+    if not os.path.isfile(world_path):
+        compile_world(path, world_path)
+
+    world = World(filename=world_path, exclusive=False, read_only=True)
+    return world.get_ontology(BASE_IRI)
@@ -1,5 +1,5 @@
 from enum import Enum
-from functools import reduce
+from functools import reduce, lru_cache
 from re import finditer
 
 
@@ -11,6 +11,7 @@ def natural_name_of_entity(entity):
     return natural_name_of_entity_name(entity.name)
 
 
+@lru_cache(maxsize=4096)
 def natural_name_of_entity_name(entity_name):
     name_list = __camel_case_split(entity_name)
     name_words = __list_as_words(name_list)
@@ -0,0 +1,54 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the function, callers
+    arriving while it runs wait for its outcome instead of running it again.
+
+    Only the call in flight is shared. Once it has finished, results and failures alike are
+    forgotten, so a failure reaches every caller that waited for it but the next call for the
+    key runs the function again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self.lock:
+            self.calls += 1
+            flight = self.flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = Future()
+                self.flights[key] = flight
+                leader = True
+
+        if not leader:
+            return flight.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.flights[key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self.flights),
+            }
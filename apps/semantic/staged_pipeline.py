@@ -0,0 +1,194 @@
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Marks the end of the items of a queue, one is sent per worker of the consuming stage
+END = object()
+
+
+class Stage:
+    """
+    A step of a StagedPipeline. The function is called with an item of the previous stage and its
+    result is passed to the next stage, a result of None drops the item.
+
+    A fan-out stage splits an item into several: its function returns an iterable (e.g. is a
+    generator) whose elements are passed to the next stage one by one as they are produced, so
+    they are held in memory only while in flight. If it raises, the elements produced so far
+    have already been passed on.
+    """
+
+    def __init__(self, name: str, fn: Callable, concurrency: int = 1, queue_size: Optional[int] = None,
+                 fan_out: bool = False):
+        """
+        Args:
+            name: The name of the stage in logs and stats.
+            fn: The function applied to every item.
+            concurrency: The number of threads running the function.
+            queue_size: The number of items waiting for the stage, twice its concurrency by default.
+            fan_out: Whether the function returns an iterable of items for the next stage.
+        """
+        self.name = name
+        self.fn = fn
+        self.concurrency = concurrency
+        self.queue_size = 2 * concurrency if queue_size is None else queue_size
+        self.fan_out = fan_out
+
+
+class StageStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.busy_seconds = 0.0
+
+    def started(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def finished(self, seconds, failed):
+        with self.lock:
+            self.in_flight -= 1
+            self.busy_seconds += seconds
+            if failed:
+                self.failed += 1
+            else:
+                self.processed += 1
+
+
+class StagedPipeline:
+    """
+    Runs items through stages of worker threads connected by bounded queues, so that stages
+    bound by different resources (network, CPU, quotas) work at the same time while the number of
+    items held in memory stays bounded by the queue sizes and concurrencies.
+
+    A failing item is logged, counted and dropped, it never stops the pipeline.
+    """
+
+    def __init__(self, stages: List[Stage], describe: Callable = str, report_interval: Optional[float] = 30.0):
+        """
+        Args:
+            stages: The stages in order.
+            describe: Names an item in error messages.
+            report_interval: Seconds between progress reports while running, None disables them.
+        """
+        self.stages = stages
+        self.describe = describe
+        self.report_interval = report_interval
+        self.queues = []
+        self.stage_stats = [StageStats() for _ in stages]
+        self.started_at = None
+        self.finished_at = None
+
+    def __worker(self, index, remaining_workers, remaining_lock):
+        stage = self.stages[index]
+        stats = self.stage_stats[index]
+        in_queue = self.queues[index]
+        out_queue = self.queues[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            item = in_queue.get()
+            if item is END:
+                break
+
+            stats.started()
+            started_at = time.monotonic()
+            try:
+                if stage.fan_out:
+                    for result in stage.fn(item):
+                        self.__forward(result, out_queue)
+                else:
+                    result = stage.fn(item)
+            except Exception as e:
+                stats.finished(time.monotonic() - started_at, failed=True)
+                print(f"Error in stage '{stage.name}' for {self.describe(item)}: {e}")
+                continue
+            stats.finished(time.monotonic() - started_at, failed=False)
+
+            if not stage.fan_out:
+                self.__forward(result, out_queue)
+
+        # The last worker of a stage ends the next stage
+        with remaining_lock:
+            remaining_workers[index] -= 1
+            last = remaining_workers[index] == 0
+        if last and out_queue is not None:
+            for _ in range(self.stages[index + 1].concurrency):
+                out_queue.put(END)
+
+    @staticmethod
+    def __forward(result, out_queue):
+        if result is not None and out_queue is not None:
+            out_queue.put(result)
+
+    def __feed(self, items):
+        try:
+            for item in items:
+                self.queues[0].put(item)
+        except Exception as e:
+            print(f"Error reading the items of the pipeline: {e}")
+        finally:
+            for _ in range(self.stages[0].concurrency):
+                self.queues[0].put(END)
+
+    def __report(self, done):
+        while not done.wait(self.report_interval):
+            print(self.progress())
+
+    def run(self, items: Iterable) -> Dict[str, Dict]:
+        """
+        Runs all items through the pipeline and returns the stats of its stages.
+        """
+        self.queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+        remaining_workers = [stage.concurrency for stage in self.stages]
+        remaining_lock = threading.Lock()
+        threads = [threading.Thread(target=self.__feed, args=(items,), name="pipeline-feed", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for i in range(stage.concurrency):
+                threads.append(threading.Thread(target=self.__worker, args=(index, remaining_workers, remaining_lock),
+                                                name="pipeline-{}-{}".format(stage.name, i), daemon=True))
+
+        done = threading.Event()
+        reporter = None
+        if self.report_interval is not None:
+            reporter = threading.Thread(target=self.__report, args=(done,), name="pipeline-report", daemon=True)
+            reporter.start()
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.finished_at = time.monotonic()
+        done.set()
+        if reporter is not None:
+            reporter.join()
+        return self.stats()
+
+    def stats(self) -> Dict[str, Dict]:
+        end = time.monotonic() if self.finished_at is None else self.finished_at
+        elapsed = end - self.started_at if self.started_at is not None else 0.0
+        stats = {}
+        for index, (stage, stage_stats) in enumerate(zip(self.stages, self.stage_stats)):
+            with stage_stats.lock:
+                stats[stage.name] = {
+                    "processed": stage_stats.processed,
+                    "failed": stage_stats.failed,
+                    "in_flight": stage_stats.in_flight,
+                    "queued": self.queues[index].qsize() if index < len(self.queues) else 0,
+                    "busy_seconds": round(stage_stats.busy_seconds, 3),
+                    "per_second": round(stage_stats.processed / elapsed, 3) if elapsed > 0 else 0.0,
+                }
+        return stats
+
+    def progress(self) -> str:
+        return ", ".join(
+            "{}: {} done, {} failed, {} running, {} queued, {}/s".format(
+                name, stage["processed"], stage["failed"], stage["in_flight"], stage["queued"], stage["per_second"])
+            for name, stage in self.stats().items()
+        )
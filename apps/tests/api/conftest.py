@@ -0,0 +1,42 @@
+import os
+import tempfile
+
+import pytest
+
+# The api package loads the ontology and opens its stores on import
+os.environ.setdefault("ONTOLOGY_PATH", "./tests/test_data/test-ontology.rdf")
+os.environ.setdefault("CLASSIFICATION_JOBS_PATH", os.path.join(tempfile.mkdtemp(), "classification-jobs.sqlite3"))
+
+from api import app as flask_app, routes  # noqa: E402
+from semantic.classification_cache import ClassificationCache  # noqa: E402
+from semantic.gemini_file_registry import GeminiFileRegistry  # noqa: E402
+from semantic.single_flight import SingleFlight  # noqa: E402
+from tests.genai_mock import ClientMock  # noqa: E402
+
+
+class StrategyMock:
+    def __init__(self, failing_mime_type=None):
+        self.failing_mime_type = failing_mime_type
+        self.classified = []
+
+    def classify_content(self, file):
+        self.classified.append(file.name)
+        if file.mime_type == self.failing_mime_type:
+            raise RuntimeError("Classification failed")
+        return {"Area": ["IntegerMultiplication"], "Ability": ["ProcedureExecution"], "Scope": []}
+
+
+@pytest.fixture
+def strategy(monkeypatch):
+    strategy = StrategyMock(failing_mime_type="application/x-failing")
+    monkeypatch.setattr(routes, "classification_cache", ClassificationCache())
+    monkeypatch.setattr(routes, "classification_flights", SingleFlight())
+    monkeypatch.setattr(routes, "gemini_file_registry", GeminiFileRegistry(client=ClientMock()))
+    routes.classifier_registry.register(routes.classification_strategy, lambda onto, version: strategy)
+    routes.classifier_registry.instances = {}
+    return strategy
+
+
+@pytest.fixture
+def client(strategy):
+    return flask_app.test_client()
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from assertpy import assert_that
+
+from api import create_app
+
+
+class TestCreateApp:
+
+    def test_create_app(self, strategy):
+        app = create_app()
+        client = app.test_client()
+
+        assert_that(client.get("/ready").status_code).is_equal_to(200)
+        response = client.get("/ontology")
+        assert_that(response.status_code).is_equal_to(200)
+        assert_that(response.get_json()["taxonomy"]).contains_key("areas", "abilities", "scopes")
+
+    def test_reads_config_from_dotenv_file(self, tmp_path):
+        env_path = tmp_path / ".env"
+        env_path.write_text("ONTOLOGY_PATH=./tests/test_data/test-ontology.rdf\n"
+                            "CLASSIFICATION_JOBS_PATH={}\n".format(tmp_path / "jobs.sqlite3"))
+        # The .env file stands in for the one the api package finds next to it
+        script = textwrap.dedent("""
+            import dotenv
+            load_dotenv = dotenv.load_dotenv
+            dotenv.load_dotenv = lambda *args, **kwargs: load_dotenv({!r})
+            from api import routes
+            print(routes.onto_path)
+            print(routes.classification_jobs.store.path)
+        """).format(str(env_path))
+        env = {name: value for name, value in os.environ.items()
+               if name not in ("ONTOLOGY_PATH", "CLASSIFICATION_JOBS_PATH")}
+
+        output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True)
+
+        assert_that(output.stdout.splitlines()).is_equal_to(
+            ["./tests/test_data/test-ontology.rdf", str(tmp_path / "jobs.sqlite3")])
@@ -0,0 +1,22 @@
+import io
+
+from assertpy import assert_that
+
+from api import routes
+
+
+class TestClassify:
+
+    def test_cold_request_counts_one_miss(self, client, strategy):
+        response = client.post("/classify", data={"file": (io.BytesIO(b"a"), "a.png", "image/png")})
+
+        assert_that(response.status_code).is_equal_to(200)
+        assert_that(routes.classification_cache.stats()).contains_entry({"hits": 0}, {"misses": 1})
+
+    def test_repeated_request_counts_a_hit(self, client, strategy):
+        client.post("/classify", data={"file": (io.BytesIO(b"a"), "a.png", "image/png")})
+        response = client.post("/classify", data={"file": (io.BytesIO(b"a"), "a.png", "image/png")})
+
+        assert_that(response.get_json()["classification"]["areas"][0]["name"]).is_equal_to("IntegerMultiplication")
+        assert_that(routes.classification_cache.stats()).contains_entry({"hits": 1}, {"misses": 1})
+        assert_that(strategy.classified).is_length(1)
@@ -0,0 +1,78 @@
+import io
+import json
+
+from assertpy import assert_that
+
+from api import routes
+
+
+def upload(content, filename, mime_type="image/png"):
+    return io.BytesIO(content), filename, mime_type
+
+
+def lines_of(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+class TestClassifyBatch:
+
+    def test_rejects_requests_without_files(self, client):
+        response = client.post("/classify/batch", data={})
+
+        assert_that(response.status_code).is_equal_to(400)
+
+    def test_rejects_too_many_files(self, client, monkeypatch):
+        monkeypatch.setattr(routes, "classify_batch_max_files", 2)
+        response = client.post("/classify/batch", data={
+            "file": [upload(b"a", "a.png"), upload(b"b", "b.png"), upload(b"c", "c.png")]
+        })
+
+        assert_that(response.status_code).is_equal_to(400)
+
+    def test_streams_one_line_per_file(self, client, strategy):
+        response = client.post("/classify/batch", data={
+            "file": [upload(b"a", "a.png"), upload(b"b", "b.png")]
+        })
+
+        assert_that(response.mimetype).is_equal_to("application/x-ndjson")
+        lines = lines_of(response)
+        assert_that([line["file"] for line in lines]).contains_only("a.png", "b.png")
+        assert_that(lines[0]["result"]["classification"]["areas"][0]["name"]).is_equal_to("IntegerMultiplication")
+
+    def test_classifies_identical_files_once(self, client, strategy):
+        response = client.post("/classify/batch", data={
+            "file": [upload(b"same", "a.png"), upload(b"same", "b.png"), upload(b"other", "c.png")]
+        })
+
+        lines = lines_of(response)
+        assert_that(lines).is_length(3)
+        assert_that(strategy.classified).is_length(2)
+        digests = {line["file"]: line["digest"] for line in lines}
+        assert_that(digests["a.png"]).is_equal_to(digests["b.png"])
+
+    def test_reports_failing_files(self, client, strategy):
+        response = client.post("/classify/batch", data={
+            "file": [upload(b"a", "a.png"), upload(b"b", "b.bin", "application/x-failing")]
+        })
+
+        lines = {line["file"]: line for line in lines_of(response)}
+        assert_that(response.status_code).is_equal_to(200)
+        assert_that(lines["a.png"]).contains_key("result")
+        assert_that(lines["b.bin"]).contains_entry({"error": "Classification failed"})
+
+    def test_uploads_are_open_while_classified(self, client, monkeypatch):
+        streams = []
+
+        def classify_upload(content_digest, stream, mime_type):
+            streams.append((stream, stream.closed))
+            return json.dumps({"digest": content_digest}).encode()
+
+        monkeypatch.setattr(routes, "classify_upload_in_app_context", classify_upload)
+        response = client.post("/classify/batch", data={
+            "file": [upload(b"a", "a.png"), upload(b"b", "b.png")]
+        })
+        lines_of(response)
+        response.close()
+
+        assert_that([closed for _, closed in streams]).is_equal_to([False, False])
+        assert_that([stream.closed for stream, _ in streams]).is_equal_to([True, True])
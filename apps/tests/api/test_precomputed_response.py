@@ -0,0 +1,66 @@
+import gzip
+import zlib
+
+import pytest
+from assertpy import assert_that
+from flask import Flask, request
+
+from api.precomputed_response import PrecomputedResponse
+
+BODY = b'{"taxonomy": {"areas": []}}'
+
+
+class TestPrecomputedResponse:
+
+    @pytest.fixture
+    def client(self):
+        app = Flask(__name__)
+        precomputed = PrecomputedResponse(BODY)
+
+        @app.route("/")
+        def respond():
+            return precomputed.respond(request)
+
+        return app.test_client()
+
+    def test_identity(self, client):
+        response = client.get("/", headers={"Accept-Encoding": "identity"})
+
+        assert_that(response.data).is_equal_to(BODY)
+        assert_that(response.headers).does_not_contain_key("Content-Encoding")
+        assert_that(response.headers["Vary"]).is_equal_to("Accept-Encoding")
+
+    def test_gzip(self, client):
+        response = client.get("/", headers={"Accept-Encoding": "gzip, deflate"})
+
+        assert_that(response.headers["Content-Encoding"]).is_equal_to("gzip")
+        assert_that(gzip.decompress(response.data)).is_equal_to(BODY)
+
+    def test_deflate(self, client):
+        response = client.get("/", headers={"Accept-Encoding": "gzip;q=0.5, deflate"})
+
+        assert_that(response.headers["Content-Encoding"]).is_equal_to("deflate")
+        assert_that(zlib.decompress(response.data)).is_equal_to(BODY)
+
+    def test_etag_per_encoding(self, client):
+        identity_etag = client.get("/").headers["ETag"]
+        gzip_etag = client.get("/", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+
+        assert_that(identity_etag).is_not_equal_to(gzip_etag)
+        # Stable across instances, e.g. worker processes
+        other = PrecomputedResponse(BODY)
+        assert_that(other.variants["gzip"]).is_equal_to(PrecomputedResponse(BODY).variants["gzip"])
+
+    def test_not_modified(self, client):
+        etag = client.get("/", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+
+        response = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+
+        assert_that(response.status_code).is_equal_to(304)
+        assert_that(response.data).is_empty()
+        assert_that(response.headers["ETag"]).is_equal_to(etag)
+
+    def test_modified_for_other_etag(self, client):
+        response = client.get("/", headers={"If-None-Match": '"other"'})
+
+        assert_that(response.status_code).is_equal_to(200)
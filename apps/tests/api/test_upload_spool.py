@@ -0,0 +1,70 @@
+import hashlib
+import io
+
+import pytest
+from assertpy import assert_that
+from flask import Flask, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from api import app as api_app
+from api.upload_spool import DigestingSpooledFile, SpoolingRequest, digest_of_upload
+
+CONTENT = b"content of an uploaded file" * 1000
+
+
+class TestDigestingSpooledFile:
+
+    def test_digest(self):
+        file = DigestingSpooledFile()
+        file.write(CONTENT[:100])
+        file.write(CONTENT[100:])
+        assert_that(file.hexdigest()).is_equal_to(hashlib.sha256(CONTENT).hexdigest())
+
+    def test_stays_in_memory_below_threshold(self):
+        file = DigestingSpooledFile(spool_threshold=len(CONTENT) + 1)
+        file.write(CONTENT)
+        assert_that(file._rolled).is_false()
+
+    def test_spills_to_disk_above_threshold(self):
+        file = DigestingSpooledFile(spool_threshold=1024)
+        file.write(CONTENT)
+        assert_that(file._rolled).is_true()
+        file.seek(0)
+        assert_that(file.read()).is_equal_to(CONTENT)
+
+    def test_rejects_files_above_max_file_size(self):
+        file = DigestingSpooledFile(max_file_size=len(CONTENT) - 1)
+        with pytest.raises(RequestEntityTooLarge):
+            file.write(CONTENT)
+
+
+class TestSpoolingRequest:
+
+    @pytest.fixture
+    def client(self):
+        app = Flask(__name__)
+        app.request_class = SpoolingRequest
+
+        @app.route("/", methods=["POST"])
+        def upload():
+            request_file = request.files["file"]
+            return {
+                "digest": digest_of_upload(request_file),
+                "spooled": isinstance(request_file.stream, DigestingSpooledFile),
+                "content": hashlib.sha256(request_file.stream.read()).hexdigest(),
+            }
+
+        return app.test_client()
+
+    def test_digest_of_upload(self, client):
+        response = client.post("/", data={"file": (io.BytesIO(CONTENT), "a.png", "image/png")})
+
+        expected = hashlib.sha256(CONTENT).hexdigest()
+        # The stream is rewound, so it can be forwarded after its digest was taken
+        assert_that(response.get_json()).is_equal_to({"digest": expected, "spooled": True, "content": expected})
+
+    def test_rejects_requests_above_max_request_size(self, monkeypatch):
+        monkeypatch.setitem(api_app.config, "MAX_CONTENT_LENGTH", 1024)
+        response = api_app.test_client().post("/classify", data={"file": (io.BytesIO(CONTENT), "a.png", "image/png")})
+
+        assert_that(response.status_code).is_equal_to(413)
@@ -0,0 +1,201 @@
+import datetime
+import json
+import time
+from types import SimpleNamespace
+
+from google.genai import types
+
+
+class CachedContentMock:
+    def __init__(self, name, display_name, model, expire_time):
+        self.name = name
+        self.display_name = display_name
+        self.model = model
+        self.expire_time = expire_time
+
+
+class CachesMock:
+    """
+    An in-memory stand-in for client.caches of google.genai.
+    """
+
+    def __init__(self, failing=False):
+        self.failing = failing
+        self.cached_contents = {}
+        self.created = []
+        self.updated = []
+
+    def __expire_time(self, ttl):
+        seconds = int(ttl.rstrip("s"))
+        return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=seconds)
+
+    def create(self, *, model, config):
+        if self.failing:
+            raise RuntimeError("Cached content is too small")
+        name = "cachedContents/{}".format(len(self.created) + 1)
+        cached_content = CachedContentMock(name, config.display_name, model, self.__expire_time(config.ttl))
+        self.cached_contents[name] = cached_content
+        self.created.append(config)
+        return cached_content
+
+    def update(self, *, name, config):
+        if name not in self.cached_contents:
+            raise RuntimeError("Cached content {} not found".format(name))
+        self.cached_contents[name].expire_time = self.__expire_time(config.ttl)
+        self.updated.append(name)
+        return self.cached_contents[name]
+
+    def list(self, config=None):
+        return list(self.cached_contents.values())
+
+
+class ResponseMock:
+    def __init__(self, text):
+        self.text = text
+
+
+class ModelsMock:
+    """
+    An in-memory stand-in for client.models of google.genai that answers every generate_content
+    call with the same JSON response and embeds texts with embedding_of_text.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+        self.embed_calls = []
+
+    def generate_content(self, *, model, contents, config=None):
+        self.calls.append({"model": model, "contents": contents, "config": config})
+        return ResponseMock(json.dumps(self.response))
+
+    def embed_content(self, *, model, contents, config=None):
+        contents = contents if isinstance(contents, list) else [contents]
+        self.embed_calls.append(contents)
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=embedding_of_text(text)) for text in contents])
+
+
+def embedding_of_text(text):
+    # A deterministic stand-in for an embedding, exactly representable as float32
+    return [float(len(text)), float(sum(map(ord, text)) % 1024), 1.0]
+
+
+class FileMock:
+    def __init__(self, name, mime_type, expiration_time):
+        self.name = name
+        self.mime_type = mime_type
+        self.expiration_time = expiration_time
+
+
+class FilesMock:
+    """
+    An in-memory stand-in for client.files of google.genai.
+    """
+
+    def __init__(self, lifetime=datetime.timedelta(hours=48), upload_delay=0.0):
+        self.lifetime = lifetime
+        self.upload_delay = upload_delay
+        self.files = {}
+        self.uploaded = []
+        self.deleted = []
+        self.lookups = 0
+
+    def upload(self, *, file, config):
+        name = "files/" + config.name
+        if name in self.files:
+            raise RuntimeError("File {} already exists".format(name))
+        time.sleep(self.upload_delay)
+        self.uploaded.append(file.read())
+        expiration_time = datetime.datetime.now(datetime.timezone.utc) + self.lifetime
+        self.files[name] = FileMock(name, config.mime_type, expiration_time)
+        return self.files[name]
+
+    def delete(self, *, name):
+        if not name.startswith("files/"):
+            name = "files/" + name
+        if name not in self.files:
+            raise RuntimeError("File {} not found".format(name))
+        del self.files[name]
+        self.deleted.append(name)
+
+    def get(self, *, name):
+        self.lookups += 1
+        if not name.startswith("files/"):
+            name = "files/" + name
+        if name not in self.files:
+            raise RuntimeError("File {} not found".format(name))
+        return self.files[name]
+
+
+class ClientMock:
+    def __init__(self, response=None, failing_caches=False, batches=None):
+        self.caches = CachesMock(failing=failing_caches)
+        self.models = ModelsMock(response)
+        self.files = FilesMock()
+        self.batches = batches
+
+
+class BatchJobMock:
+    def __init__(self, name, src, dest):
+        self.name = name
+        self.src = src
+        self.state = types.JobState.JOB_STATE_PENDING
+        self.error = None
+        self.dest = SimpleNamespace(gcs_uri=dest)
+
+
+class BatchesMock:
+    """
+    An in-memory stand-in for client.batches of google.genai on Vertex AI, reading the requests
+    from and writing the predictions to a BucketMock. Jobs run once they were polled
+    polls_until_done times, answering every request with respond(request), which returns the
+    response text or raises to produce an error for that request. Like Vertex AI, the predictions
+    are not in the order of the requests.
+    """
+
+    def __init__(self, bucket, respond, polls_until_done=1, failing=False):
+        self.bucket = bucket
+        self.respond = respond
+        self.polls_until_done = polls_until_done
+        self.failing = failing
+        self.jobs = {}
+        self.polls = {}
+
+    def __blob_name(self, uri):
+        return uri.removeprefix("gs://{}/".format(self.bucket.name))
+
+    def requests(self, name):
+        content = self.bucket.blob(self.__blob_name(self.jobs[name].src)).download_as_bytes()
+        return [json.loads(line)["request"] for line in content.decode("utf-8").splitlines()]
+
+    def create(self, *, model, src, config=None):
+        name = "projects/test/locations/test/batchPredictionJobs/{}".format(len(self.jobs) + 1)
+        self.jobs[name] = BatchJobMock(name, src, config.dest)
+        self.polls[name] = 0
+        return self.jobs[name]
+
+    def get(self, *, name):
+        job = self.jobs[name]
+        self.polls[name] += 1
+        if self.polls[name] < self.polls_until_done:
+            job.state = types.JobState.JOB_STATE_RUNNING
+        elif self.failing:
+            job.state = types.JobState.JOB_STATE_FAILED
+            job.error = "Batch failed"
+        elif job.state != types.JobState.JOB_STATE_SUCCEEDED:
+            job.state = types.JobState.JOB_STATE_SUCCEEDED
+            predictions = [json.dumps(self.__predict(request)) for request in reversed(self.requests(name))]
+            self.bucket.put(self.__blob_name(job.dest.gcs_uri) + "/prediction-model-1/predictions.jsonl",
+                            "\n".join(predictions).encode("utf-8"))
+        return job
+
+    def __predict(self, request):
+        try:
+            text = self.respond(request)
+        except Exception as e:
+            return {"status": str(e), "request": request}
+        return {
+            "status": "",
+            "request": request,
+            "response": {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]},
+        }
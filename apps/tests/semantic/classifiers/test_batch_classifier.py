@@ -0,0 +1,147 @@
+import datetime
+import json
+
+import pytest
+from assertpy import assert_that
+
+from google.genai import types
+
+from semantic.classifiers.batch_classifier import BatchClassifier, GeminiBatchBackend, request_of
+from semantic.classifiers.strategies.classifier_split_gemini_with_serialized_taxonomies_v1 import \
+    ClassifierSplitGeminiWithSerializedTaxonomiesV1, PromptMultiResponse
+from semantic.ontology_index import OntologyIndex
+from semantic.ontology_loader import load_from_path
+from tests.genai_mock import BatchesMock, ClientMock
+from tests.storage_mock import BucketMock
+
+onto_index = OntologyIndex(load_from_path("./tests/test_data/test-ontology.rdf"))
+
+
+def respond(request):
+    file_part, prompt_part = request["contents"][0]["parts"]
+    if "Taxonomy of Scopes" in prompt_part["text"] and file_part["text"] == "broken":
+        raise RuntimeError("Request failed")
+    if request["generationConfig"]["responseSchema"]["properties"]["step_3"]["type"] == "STRING":
+        return json.dumps({"step_1": "description", "step_3": "Integer Multiplication"})
+    return json.dumps({"step_1": "description", "step_3": ["Integer Multiplication"]})
+
+
+def first_job(client):
+    return next(iter(client.batches.jobs))
+
+
+class TestBatchClassifier:
+
+    @pytest.fixture
+    def checkpoint_path(self, tmp_path):
+        return str(tmp_path / "checkpoint.json")
+
+    @pytest.fixture
+    def bucket(self):
+        return BucketMock("batches")
+
+    @pytest.fixture
+    def client(self, bucket):
+        return ClientMock(batches=BatchesMock(bucket, respond, polls_until_done=2))
+
+    def build_classifier(self, client, checkpoint_path, **kwargs):
+        return BatchClassifier(
+            ClassifierSplitGeminiWithSerializedTaxonomiesV1(onto_index, client=client),
+            GeminiBatchBackend(client.batches.bucket, client),
+            checkpoint_path,
+            poll_interval=datetime.timedelta(0),
+            **kwargs
+        )
+
+    def test_classifies_files(self, client, checkpoint_path):
+        batch_classifier = self.build_classifier(client, checkpoint_path)
+        classifications, errors = batch_classifier.classify_files({"a": "file-a", "b": "file-b"})
+        assert_that(classifications["a"]).is_equal_to({
+            "Area": ["IntegerMultiplication"],
+            "Ability": ["IntegerMultiplication"],
+            "Scope": ["IntegerMultiplication"],
+        })
+        assert_that(classifications).contains_key("b")
+        assert_that(errors).is_empty()
+        assert_that(client.batches.jobs).is_length(1)
+
+    def test_splits_into_jobs(self, client, checkpoint_path):
+        batch_classifier = self.build_classifier(client, checkpoint_path, max_batch_size=4)
+        classifications, _ = batch_classifier.classify_files({"a": "file-a", "b": "file-b"})
+        assert_that(client.batches.jobs).is_length(2)
+        assert_that({job.src for job in client.batches.jobs.values()}).is_length(2)
+        assert_that(classifications).contains_key("a", "b")
+
+    def test_requests_carry_taxonomy_inline(self, client, checkpoint_path):
+        batch_classifier = self.build_classifier(client, checkpoint_path)
+        batch_classifier.submit({"a": "file-a"})
+        requests = client.batches.requests(first_job(client))
+        assert_that(requests).is_length(3)
+        assert_that(requests[0]["contents"][0]["parts"][1]["text"]).contains(
+            batch_classifier.classifier.area_taxonomy)
+
+    def test_writes_requests_to_bucket(self, client, checkpoint_path):
+        self.build_classifier(client, checkpoint_path).submit({"a": "file-a"})
+        job = client.batches.jobs[first_job(client)]
+        assert_that(job.src).starts_with("gs://batches/batch-classification/classification-")
+        assert_that(job.src).ends_with("/requests.jsonl")
+        assert_that([request["labels"] for request in client.batches.requests(first_job(client))]).is_equal_to(
+            [{"request_index": "0"}, {"request_index": "1"}, {"request_index": "2"}])
+
+    def test_serializes_requests(self):
+        contents = [types.Part.from_uri(file_uri="gs://materials/a.pdf", mime_type="application/pdf"), "Classify"]
+        config = types.GenerateContentConfig(
+            candidate_count=1, temperature=0, response_mime_type="application/json",
+            response_schema=PromptMultiResponse)
+        assert_that(request_of(contents, config, 7)).is_equal_to({
+            "contents": [{"role": "user", "parts": [
+                {"fileData": {"fileUri": "gs://materials/a.pdf", "mimeType": "application/pdf"}},
+                {"text": "Classify"},
+            ]}],
+            "generationConfig": {
+                "candidateCount": 1,
+                "temperature": 0,
+                "responseMimeType": "application/json",
+                "responseSchema": {
+                    "type": "OBJECT",
+                    "properties": {"step_1": {"type": "STRING"},
+                                   "step_3": {"type": "ARRAY", "items": {"type": "STRING"}}},
+                    "required": ["step_1", "step_3"],
+                    "propertyOrdering": ["step_1", "step_3"],
+                },
+            },
+            "labels": {"request_index": "7"},
+        })
+
+    def test_rejects_cached_content(self):
+        config = types.GenerateContentConfig(cached_content="cachedContents/1")
+        with pytest.raises(ValueError):
+            request_of(["Classify"], config, 0)
+
+    def test_resumes_running_jobs(self, client, checkpoint_path):
+        self.build_classifier(client, checkpoint_path).submit({"a": "file-a"})
+
+        resumed = self.build_classifier(client, checkpoint_path)
+        classifications, errors = resumed.classify_files({"a": "file-a"})
+        assert_that(classifications).contains_key("a")
+        assert_that(client.batches.jobs).is_length(1)
+
+    def test_does_not_resubmit_classified_files(self, client, checkpoint_path):
+        self.build_classifier(client, checkpoint_path).classify_files({"a": "file-a"})
+        classifications, _ = self.build_classifier(client, checkpoint_path).classify_files({"a": "file-a"})
+        assert_that(classifications).contains_key("a")
+        assert_that(client.batches.jobs).is_length(1)
+
+    def test_reports_and_retries_failed_requests(self, client, checkpoint_path):
+        classifications, errors = self.build_classifier(client, checkpoint_path).classify_files({"a": "broken"})
+        assert_that(classifications).is_empty()
+        assert_that(errors["a"]).contains_key("Scope")
+
+        self.build_classifier(client, checkpoint_path).classify_files({"a": "broken"})
+        assert_that(client.batches.requests(list(client.batches.jobs)[1])).is_length(1)
+
+    def test_failed_job(self, bucket, checkpoint_path):
+        client = ClientMock(batches=BatchesMock(bucket, respond, failing=True))
+        classifications, errors = self.build_classifier(client, checkpoint_path).classify_files({"a": "file-a"})
+        assert_that(classifications).is_empty()
+        assert_that(errors["a"]).is_length(3)
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+from assertpy import assert_that
+
+from semantic.call_scheduler import CallScheduler
+from semantic.classifiers.strategies.classifier_embeddings_gemini_v1 import ClassifierEmbeddingsGemini
+from semantic.embeddings.embedding_cache import EmbeddingCache
+from semantic.embeddings.embedding_store import EmbeddingStore
+from semantic.embeddings.strategies.embedding_strategy_gemini_v1 import GeminiEmbeddingStrategy
+from semantic.ontology_index import OntologyIndex
+from semantic.ontology_loader import load_from_path
+from tests.genai_mock import ClientMock, embedding_of_text
+
+onto_index = OntologyIndex(load_from_path("./tests/test_data/test-ontology.rdf"))
+
+
+class TestClassifierEmbeddingsGemini:
+
+    @pytest.fixture
+    def store_dir(self, tmp_path):
+        # Each taxonomy entry is embedded like the description that should match it
+        taxonomies = {
+            "Area": {"IntegerMultiplication": "multiplying numbers", "IntegerAddition": "adding up numbers"},
+            "Ability": {"ProceduralFluency": "following steps", "AdaptiveCreativity": "creative ideas"},
+            "Scope": {"NumbersSmaller10": "small numbers only", "NumbersWithoutZero": "no zero anywhere"},
+        }
+        for name, entries in taxonomies.items():
+            EmbeddingStore(os.path.join(str(tmp_path), name)).write(
+                list(entries.keys()), [embedding_of_text(text) for text in entries.values()])
+        return str(tmp_path)
+
+    @pytest.fixture
+    def client(self):
+        return ClientMock(response={
+            "area": "multiplying numbers",
+            "abilities": ["following steps", "creative ideas"],
+            "scopes": ["no zero anywhere"],
+        })
+
+    @pytest.fixture
+    def classifier(self, client, store_dir):
+        scheduler = CallScheduler()
+        return ClassifierEmbeddingsGemini(
+            onto_index, embedding_store_dir=store_dir, client=client, scheduler=scheduler,
+            embedding_strategy=GeminiEmbeddingStrategy(client, scheduler=scheduler, cache=EmbeddingCache()))
+
+    def test_classify_content(self, classifier):
+        assert_that(classifier.classify_content("file")).is_equal_to({
+            "Area": ["IntegerMultiplication"],
+            "Ability": ["ProceduralFluency", "AdaptiveCreativity"],
+            "Scope": ["NumbersWithoutZero"],
+        })
+
+    def test_embeds_all_descriptions_in_one_call(self, classifier, client):
+        classifier.classify_content("file")
+        assert_that(client.models.embed_calls).is_equal_to([
+            ["multiplying numbers", "following steps", "creative ideas", "no zero anywhere"]
+        ])
+
+    def test_without_scopes(self, classifier, client):
+        client.models.response = {"area": "adding up numbers", "abilities": [], "scopes": []}
+        assert_that(classifier.classify_content("file")).is_equal_to({
+            "Area": ["IntegerAddition"], "Ability": [], "Scope": []
+        })
@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+from assertpy import assert_that
+
+from semantic.classifiers.classifier_registry import ClassifierRegistry
+
+
+class CountingFactory:
+    def __init__(self):
+        self.builds = []
+
+    def __call__(self, onto, ontology_version):
+        self.builds.append(onto)
+        return object()
+
+
+class TestClassifierRegistry:
+
+    @pytest.fixture
+    def factory(self):
+        return CountingFactory()
+
+    @pytest.fixture
+    def registry(self, factory):
+        registry = ClassifierRegistry('onto-1', 'v1')
+        registry.register('test', factory)
+        return registry
+
+    def test_get_builds_once(self, registry, factory):
+        first = registry.get('test')
+        second = registry.get('test')
+        assert first is second
+        assert_that(factory.builds).is_equal_to(['onto-1'])
+
+    def test_get_unknown(self, registry):
+        with pytest.raises(KeyError):
+            registry.get('unknown')
+
+    def test_warm_up(self, registry, factory):
+        assert not registry.warm
+        registry.warm_up()
+        assert registry.warm
+        assert len(factory.builds) == 1
+
+    def test_concurrent_get_builds_once(self, registry, factory):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.get('test'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(factory.builds) == 1
+        assert len(set(map(id, results))) == 1
+
+    def test_update_ontology_rebuilds(self, registry, factory):
+        first = registry.get('test')
+        registry.update_ontology('onto-2', 'v2')
+        second = registry.get('test')
+        assert first is not second
+        assert_that(factory.builds).is_equal_to(['onto-1', 'onto-2'])
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+from assertpy import assert_that
+
+from semantic.classifiers.merged_classifier import MergedClassifier, ClassificationError
+
+
+class StrategyMock:
+    def __init__(self, failing=None, barrier=None):
+        self.failing = failing or []
+        self.barrier = barrier
+
+    def __classify(self, dimension, file):
+        if self.barrier is not None:
+            # Only passes when all dimensions are in flight at the same time
+            self.barrier.wait(timeout=2)
+        if dimension in self.failing:
+            raise RuntimeError(dimension)
+        return [dimension + "-" + file]
+
+    def classify_area(self, file):
+        return self.__classify("Area", file)
+
+    def classify_ability(self, file):
+        return self.__classify("Ability", file)
+
+    def classify_scope(self, file):
+        return self.__classify("Scope", file)
+
+
+expected_classification = {
+    "Area": ["Area-f"],
+    "Ability": ["Ability-f"],
+    "Scope": ["Scope-f"]
+}
+
+
+class TestMergedClassifier:
+
+    def test_classify_sequentially(self):
+        classifier = MergedClassifier(StrategyMock())
+        assert_that(classifier.classify_content("f")).is_equal_to(expected_classification)
+
+    def test_classify_concurrently(self):
+        classifier = MergedClassifier(StrategyMock(barrier=threading.Barrier(3)), concurrent=True, max_workers=3)
+        assert_that(classifier.classify_content("f")).is_equal_to(expected_classification)
+        classifier.close()
+
+    def test_classify_concurrently_isolates_errors(self):
+        classifier = MergedClassifier(StrategyMock(failing=["Ability"]), concurrent=True)
+        with pytest.raises(ClassificationError) as error:
+            classifier.classify_content("f")
+        assert_that(error.value.errors).contains_only("Ability")
+        assert_that(error.value.partial_classification).is_equal_to({
+            "Area": ["Area-f"],
+            "Scope": ["Scope-f"]
+        })
+        classifier.close()
@@ -0,0 +1,251 @@
+import json
+
+import pytest
+from assertpy import assert_that
+
+from semantic.embeddings.add_label import apply_changes_to_jsonl_in_gcs
+from semantic.embeddings.embed_files import GoogleMultiModalBatchEmbedder
+from tests.storage_mock import BucketMock, StorageClientMock
+
+
+class EmbedderMock:
+    def __init__(self, failing_names=(), empty_names=(), page_count=1, max_image_size=1024):
+        self.failing_names = failing_names
+        self.empty_names = empty_names
+        self.page_count = page_count
+        self.max_image_size = max_image_size
+        self.embedded = []
+        self.rendered = []
+
+    def output_options(self):
+        return {"model_name": "model", "max_image_size": self.max_image_size}
+
+    def iter_images_of_document(self, filename, blob):
+        if filename in self.empty_names:
+            return
+        if self.page_count == 1:
+            yield filename, blob
+            return
+        name, extension = filename.rsplit(".", 1)
+        for page_num in range(self.page_count):
+            self.rendered.append(page_num)
+            yield "{}_{}.{}".format(name, page_num + 1, extension), blob
+
+    def embed_images(self, images):
+        # Like GoogleMultiModalEmbedder, pages that fail to embed are left out
+        self.embedded.extend(name for name, _ in images)
+        return [{"name": name, "mime_type": "image/png", "embedding": [1.0, 0.0], "image_data": image_data}
+                for name, image_data in images if name not in self.failing_names]
+
+
+class TestGoogleMultiModalBatchEmbedder:
+
+    @pytest.fixture
+    def bucket(self):
+        bucket = BucketMock("embed")
+        for i in range(5):
+            bucket.put("examples/raw/image-{}.png".format(i), "image-{}".format(i).encode())
+        return bucket
+
+    @pytest.fixture
+    def embedder(self):
+        return EmbedderMock()
+
+    def batch_embedder(self, bucket, embedder):
+        return GoogleMultiModalBatchEmbedder("project", "europe-west3", bucket.name, embedder,
+                                             storage_client=StorageClientMock(bucket), report_interval=None,
+                                             manifest_save_every=2)
+
+    def embed_files(self, bucket, embedder):
+        return self.batch_embedder(bucket, embedder).embed_files("examples", ["material"], ["de"])
+
+    def test_embed_files(self, bucket, embedder):
+        changes = self.embed_files(bucket, embedder)
+
+        assert_that(changes.stats["record"]["processed"]).is_equal_to(5)
+        assert_that(changes.added).is_length(5)
+        assert_that(bucket.blobs).contains_key("examples/normalized/image-0.png", "examples/manifest.json")
+        record = json.loads(bucket.blobs["examples/embedded/image-0-png.json"].content)
+        assert_that(record).contains_entry({"id": "image-0.png"}, {"embedding": [1.0, 0.0]})
+
+    def test_skips_unchanged_files(self, bucket, embedder):
+        self.embed_files(bucket, embedder)
+        self.batch_embedder(bucket, embedder).mark_changes_applied("examples")
+        bucket.put("examples/raw/image-1.png", b"changed")
+        bucket.put("examples/raw/image-3.png", b"image-3")
+
+        changes = self.embed_files(bucket, EmbedderMock())
+
+        assert_that(changes.changed).is_equal_to(["examples/raw/image-1.png"])
+        assert_that(changes.unchanged).is_length(4)
+        assert_that(changes.embedded).is_equal_to(["examples/embedded/image-1-png.json"])
+
+    def test_cleans_up_deleted_files(self, bucket, embedder):
+        self.embed_files(bucket, embedder)
+        del bucket.blobs["examples/raw/image-2.png"]
+
+        changes = self.embed_files(bucket, embedder)
+
+        assert_that(changes.deleted).is_equal_to(["examples/raw/image-2.png"])
+        assert_that(changes.removed_ids).is_equal_to({"image-2.png"})
+        assert_that(bucket.blobs).does_not_contain_key("examples/normalized/image-2.png",
+                                                       "examples/embedded/image-2-png.json")
+
+    def test_failed_files_are_retried(self, bucket, embedder):
+        bucket.failing_uploads = "normalized/image-2.png"
+        changes = self.embed_files(bucket, embedder)
+        assert_that(changes.stats["upload"]).contains_entry({"processed": 4}, {"failed": 1})
+        assert_that(changes.stats["record"]).contains_entry({"processed": 4})
+
+        bucket.failing_uploads = None
+        retry_embedder = EmbedderMock()
+        self.embed_files(bucket, retry_embedder)
+
+        assert_that(retry_embedder.embedded).is_equal_to(["image-2.png"])
+
+    def test_files_with_failed_pages_are_retried(self, bucket):
+        changes = self.embed_files(bucket, EmbedderMock(failing_names=["image-2.png"], empty_names=["image-3.png"]))
+
+        assert_that(changes.stats["render"]).contains_entry({"processed": 4}, {"failed": 1})
+        assert_that(changes.stats["embed"]).contains_entry({"processed": 3}, {"failed": 1})
+        assert_that(changes.stats["record"]).contains_entry({"processed": 3})
+        assert_that(bucket.blobs).does_not_contain_key("examples/embedded/image-2-png.json",
+                                                       "examples/embedded/image-3-png.json")
+
+        retry_embedder = EmbedderMock()
+        self.embed_files(bucket, retry_embedder)
+
+        assert_that(retry_embedder.embedded).contains_only("image-2.png", "image-3.png")
+
+    def apply_changes(self, bucket, embedder, changes):
+        applied = apply_changes_to_jsonl_in_gcs(bucket.name, changes, "examples/embedded", "examples/labeled",
+                                                "all.json", storage_client=StorageClientMock(bucket))
+        assert_that(applied).is_true()
+        self.batch_embedder(bucket, embedder).mark_changes_applied("examples")
+
+    def labeled_ids(self, bucket):
+        content = bucket.blobs["examples/labeled/all.json"].content.decode()
+        return [json.loads(line)["id"] for line in content.split("\n")]
+
+    def test_changes_update_labeled_jsonl(self, bucket, embedder):
+        self.apply_changes(bucket, embedder, self.embed_files(bucket, embedder))
+
+        del bucket.blobs["examples/raw/image-2.png"]
+        bucket.put("examples/raw/image-5.png", b"image-5")
+        changes = self.embed_files(bucket, embedder)
+        assert_that(changes.embedded).is_equal_to(["examples/embedded/image-5-png.json"])
+        self.apply_changes(bucket, embedder, changes)
+
+        content = bucket.blobs["examples/labeled/all.json"].content.decode()
+        records = [json.loads(line) for line in content.split("\n")]
+        assert_that([record["id"] for record in records]) \
+            .contains_only("image-0.png", "image-1.png", "image-3.png", "image-4.png", "image-5.png")
+        assert_that(records[0]["restricts"][0]).is_equal_to({"namespace": "type", "allow": ["material"]})
+
+    def test_failed_files_are_not_recorded(self, bucket):
+        self.embed_files(bucket, EmbedderMock(failing_names=["image-2.png"]))
+
+        manifest = json.loads(bucket.blobs["examples/manifest.json"].content)
+        assert_that(manifest["entries"]).does_not_contain_key("examples/raw/image-2.png")
+        assert_that(manifest["entries"]).is_length(4)
+
+    def test_keeps_changes_of_runs_not_applied(self, bucket, embedder):
+        self.apply_changes(bucket, embedder, self.embed_files(bucket, embedder))
+
+        # This run dies before its changes are applied to the labeled JSONL
+        del bucket.blobs["examples/raw/image-2.png"]
+        bucket.put("examples/raw/image-5.png", b"image-5")
+        self.embed_files(bucket, embedder)
+
+        bucket.put("examples/raw/image-6.png", b"image-6")
+        changes = self.embed_files(bucket, embedder)
+        assert_that(changes.embedded).contains_only("examples/embedded/image-5-png.json",
+                                                    "examples/embedded/image-6-png.json")
+        assert_that(changes.removed_ids).is_equal_to({"image-2.png"})
+
+        self.apply_changes(bucket, embedder, changes)
+        assert_that(self.labeled_ids(bucket)).contains_only(
+            "image-0.png", "image-1.png", "image-3.png", "image-4.png", "image-5.png", "image-6.png")
+        assert_that(self.embed_files(bucket, embedder).embedded).is_empty()
+
+    def test_forgets_pending_files_that_were_deleted(self, bucket, embedder):
+        self.embed_files(bucket, embedder)
+        del bucket.blobs["examples/raw/image-2.png"]
+
+        changes = self.embed_files(bucket, embedder)
+
+        assert_that(changes.embedded).does_not_contain("examples/embedded/image-2-png.json")
+        assert_that(changes.embedded).is_length(4)
+
+    def test_embeds_pages_in_batches(self, bucket):
+        batch_embedder = GoogleMultiModalBatchEmbedder("project", "europe-west3", bucket.name,
+                                                       EmbedderMock(page_count=5),
+                                                       storage_client=StorageClientMock(bucket), report_interval=None,
+                                                       page_batch_size=2)
+        changes = batch_embedder.embed_files("examples", ["material"], ["de"])
+
+        assert_that(changes.stats["embed"]["processed"]).is_equal_to(15)
+        assert_that(changes.stats["record"]["processed"]).is_equal_to(5)
+        content = bucket.blobs["examples/embedded/image-0-png.json"].content.decode()
+        assert_that([json.loads(line)["id"] for line in content.split("\n")]).is_equal_to(
+            ["image-0_{}.png".format(page) for page in range(1, 6)])
+        manifest = json.loads(bucket.blobs["examples/manifest.json"].content)
+        assert_that(manifest["entries"]["examples/raw/image-0.png"]["normalized"]).is_length(5)
+
+    def test_renders_pages_while_embedding(self, bucket):
+        class SlowEmbedderMock(EmbedderMock):
+            def embed_images(self, images):
+                # Rendering must not run ahead of embedding by more than the pages in flight
+                assert_that(len(self.rendered) - len(self.embedded)).is_less_than_or_equal_to(20)
+                return super().embed_images(images)
+
+        for name in list(bucket.blobs):
+            if name != "examples/raw/image-0.png":
+                del bucket.blobs[name]
+        embedder = SlowEmbedderMock(page_count=200)
+        batch_embedder = GoogleMultiModalBatchEmbedder("project", "europe-west3", bucket.name, embedder,
+                                                       storage_client=StorageClientMock(bucket), report_interval=None,
+                                                       embed_concurrency=1, page_batch_size=2)
+        changes = batch_embedder.embed_files("examples", ["material"], ["de"])
+
+        assert_that(changes.stats["record"]["processed"]).is_equal_to(1)
+        assert_that(embedder.embedded).is_length(200)
+
+    def test_embeds_files_again_with_other_options(self, bucket, embedder):
+        self.embed_files(bucket, embedder)
+
+        unchanged = self.embed_files(bucket, EmbedderMock())
+        changed = self.embed_files(bucket, EmbedderMock(max_image_size=512))
+
+        assert_that(unchanged.unchanged).is_length(5)
+        assert_that(changed.changed).is_length(5)
+        manifest = json.loads(bucket.blobs["examples/manifest.json"].content)
+        assert_that(manifest["entries"]["examples/raw/image-0.png"]["options"]).contains_entry(
+            {"max_image_size": 512})
+
+    def test_file_with_a_failed_batch_is_not_recorded(self, bucket):
+        batch_embedder = GoogleMultiModalBatchEmbedder("project", "europe-west3", bucket.name,
+                                                       EmbedderMock(page_count=5, failing_names=["image-0_3.png"]),
+                                                       storage_client=StorageClientMock(bucket), report_interval=None,
+                                                       page_batch_size=2)
+        changes = batch_embedder.embed_files("examples", ["material"], ["de"])
+
+        assert_that(changes.stats["record"]["processed"]).is_equal_to(4)
+        assert_that(bucket.blobs).does_not_contain_key("examples/embedded/image-0-png.json")
+        manifest = json.loads(bucket.blobs["examples/manifest.json"].content)
+        assert_that(manifest["entries"]).does_not_contain_key("examples/raw/image-0.png")
+
+    def test_keeps_changes_when_a_file_cannot_be_aggregated(self, bucket, embedder):
+        changes = self.embed_files(bucket, embedder)
+        record = bucket.blobs["examples/embedded/image-3-png.json"].content
+        bucket.put("examples/embedded/image-3-png.json", b"{broken")
+
+        applied = apply_changes_to_jsonl_in_gcs(bucket.name, changes, "examples/embedded", "examples/labeled",
+                                                "all.json", storage_client=StorageClientMock(bucket))
+
+        assert_that(applied).is_false()
+        assert_that(bucket.blobs).does_not_contain_key("examples/labeled/all.json")
+
+        bucket.put("examples/embedded/image-3-png.json", record)
+        self.apply_changes(bucket, embedder, self.embed_files(bucket, embedder))
+        assert_that(self.labeled_ids(bucket)).contains_only(*["image-{}.png".format(i) for i in range(5)])
@@ -0,0 +1,58 @@
+import fitz
+import pytest
+from assertpy import assert_that
+
+from semantic.embeddings.embedder_google import convert_pdf_blob_to_image_blobs, iter_images_of_document, \
+    iter_pdf_pages_as_images
+
+
+class TestPdfRasterization:
+
+    @pytest.fixture
+    def pdf_blob(self):
+        doc = fitz.open()
+        for page_num in range(3):
+            # A4 in points
+            page = doc.new_page(width=595, height=842)
+            page.insert_text((72, 72), "Page {}".format(page_num + 1))
+        pdf_blob = doc.tobytes()
+        doc.close()
+        return pdf_blob
+
+    def image_size(self, image_blob):
+        pix = fitz.Pixmap(image_blob)
+        return pix.width, pix.height
+
+    def test_yields_pages_in_order(self, pdf_blob):
+        pages = iter_pdf_pages_as_images("material.pdf", pdf_blob)
+
+        assert_that(next(pages)[0]).is_equal_to("material_1.png")
+        assert_that([name for name, _ in pages]).is_equal_to(["material_2.png", "material_3.png"])
+
+    def test_downscales_to_max_image_size(self, pdf_blob):
+        name, image_blob = next(iter_pdf_pages_as_images("material.pdf", pdf_blob, max_image_size=500))
+
+        assert_that(max(self.image_size(image_blob))).is_between(499, 500)
+
+    def test_renders_at_dpi_without_max_image_size(self, pdf_blob):
+        name, image_blob = next(iter_pdf_pages_as_images("material.pdf", pdf_blob, dpi=72, max_image_size=None))
+
+        assert_that(self.image_size(image_blob)).is_equal_to((595, 842))
+
+    def test_renders_jpeg(self, pdf_blob):
+        name, image_blob = next(iter_pdf_pages_as_images("material.pdf", pdf_blob, image_format="jpeg"))
+
+        assert_that(name).is_equal_to("material_1.jpg")
+        assert_that(image_blob[:2]).is_equal_to(b"\xff\xd8")
+
+    def test_renders_in_processes(self, pdf_blob):
+        pages = list(iter_pdf_pages_as_images("material.pdf", pdf_blob, processes=2))
+
+        assert_that(pages).is_equal_to(list(iter_pdf_pages_as_images("material.pdf", pdf_blob)))
+
+    def test_convert_returns_none_for_broken_pdf(self):
+        assert_that(convert_pdf_blob_to_image_blobs("broken.pdf", b"not a pdf")).is_none()
+
+    def test_raises_for_broken_pdf(self):
+        with pytest.raises(Exception):
+            list(iter_images_of_document("broken.pdf", b"not a pdf"))
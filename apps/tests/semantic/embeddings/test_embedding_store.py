@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from assertpy import assert_that
+
+from semantic.embeddings.embedding_store import EmbeddingStore, convert_ndjson_to_store
+
+
+class TestEmbeddingStore:
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        return EmbeddingStore(str(tmp_path / "Area"))
+
+    def test_exists(self, store):
+        assert not store.exists()
+        store.write(['a'], [[1.0, 0.0]])
+        assert store.exists()
+
+    def test_open_is_memory_mapped(self, store):
+        store.write(['a', 'b'], [[3.0, 0.0], [0.0, 0.5]])
+        index = store.open()
+        assert isinstance(index.matrix, np.memmap)
+        assert index.matrix.dtype == np.float32
+        assert_that(index.ids).is_equal_to(['a', 'b'])
+        assert np.allclose(index.matrix, [[1.0, 0.0], [0.0, 1.0]])
+
+    def test_open_matches(self, store):
+        store.write(['a', 'b'], [[3.0, 0.0], [0.0, 0.5]])
+        assert store.open().best_match([0.1, 2.0]) == 'b'
+
+    def test_write_rejects_mismatched_ids(self, store):
+        with pytest.raises(ValueError):
+            store.write(['a', 'b'], [[1.0, 0.0]])
+
+    def test_open_rejects_vectors_of_other_ids(self, store):
+        store.write(['a', 'b'], [[1.0, 0.0], [0.0, 1.0]])
+        with open(store.ids_path, "w", encoding="utf-8") as f:
+            f.write('["a"]')
+        with pytest.raises(ValueError):
+            store.open()
+
+    def test_convert_ndjson_to_store(self, store):
+        convert_ndjson_to_store([
+            {"name": "a", "embedding": [1.0, 0.0]},
+            {"id": "b", "embedding": [0.0, 1.0]},
+        ], store)
+        assert_that(store.open().ids).is_equal_to(['a', 'b'])
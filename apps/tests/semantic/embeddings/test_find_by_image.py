@@ -0,0 +1,42 @@
+import pytest
+from assertpy import assert_that
+from google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint import MatchNeighbor
+
+from semantic.embeddings import find_by_image
+from semantic.embeddings.find_by_image import VectorSearchClient
+
+
+class EndpointMock:
+    created = 0
+
+    def __init__(self, index_endpoint_name):
+        EndpointMock.created += 1
+        self.index_endpoint_name = index_endpoint_name
+        self.requests = []
+
+    def find_neighbors(self, deployed_index_id, queries, filter, num_neighbors):
+        self.requests.append(queries)
+        return [[MatchNeighbor(id="neighbor-of-{}".format(query[0]), distance=1.0)] for query in queries]
+
+
+class TestVectorSearchClient:
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        EndpointMock.created = 0
+        monkeypatch.setattr(find_by_image.aiplatform, "init", lambda **kwargs: None)
+        monkeypatch.setattr(find_by_image.aiplatform, "MatchingEngineIndexEndpoint", EndpointMock)
+        return VectorSearchClient("project", "location", "endpoint", "deployed", max_batch_size=2)
+
+    def test_find_neighbors_batches_queries(self, client):
+        neighbors = client.find_neighbors([[1.0], [2.0], [3.0]])
+
+        assert_that([query_neighbors[0].id for query_neighbors in neighbors]) \
+            .is_equal_to(["neighbor-of-1.0", "neighbor-of-2.0", "neighbor-of-3.0"])
+        assert_that(client.endpoint.requests).is_equal_to([[[1.0], [2.0]], [[3.0]]])
+
+    def test_endpoint_is_initialized_once(self, client):
+        client.query([1.0])
+        client.query([2.0])
+
+        assert_that(EndpointMock.created).is_equal_to(1)
@@ -0,0 +1,58 @@
+import pytest
+from assertpy import assert_that
+
+from semantic.call_scheduler import CallScheduler
+from semantic.embeddings.embedding_cache import EmbeddingCache, SqliteEmbeddingCache, embedding_cache_key
+from semantic.embeddings.strategies.embedding_strategy_gemini_v1 import GeminiEmbeddingStrategy
+from tests.genai_mock import ClientMock, embedding_of_text
+
+
+class TestGeminiEmbeddingStrategy:
+
+    @pytest.fixture
+    def client(self):
+        return ClientMock()
+
+    @pytest.fixture
+    def strategy(self, client):
+        return GeminiEmbeddingStrategy(client, scheduler=CallScheduler(), cache=EmbeddingCache())
+
+    def test_embed_entries_preserves_order(self, strategy, client):
+        entries = {i: "text {}".format(i) for i in range(45)}
+        embeddings = strategy.embed_entries(entries)
+        assert_that(list(embeddings.keys())).is_equal_to(list(entries.keys()))
+        for key, text in entries.items():
+            assert_that(embeddings[key]).is_equal_to(embedding_of_text(text))
+        assert_that([len(chunk) for chunk in client.models.embed_calls]).contains_only(20, 5)
+        assert_that(client.models.embed_calls).is_length(3)
+
+    def test_embeds_texts_once(self, strategy, client):
+        strategy.embed_entries({"a": "same text", "b": "same  text ", "c": "other text"})
+        assert_that(client.models.embed_calls).is_equal_to([["same text", "other text"]])
+
+        assert_that(strategy.embed_entry("other text")).is_equal_to(embedding_of_text("other text"))
+        strategy.embed_entries({"d": "same text"})
+        assert_that(client.models.embed_calls).is_length(1)
+
+    def test_persistent_cache(self, client, tmp_path):
+        path = str(tmp_path / "embedding-cache.sqlite3")
+        cache = SqliteEmbeddingCache(path)
+        GeminiEmbeddingStrategy(client, scheduler=CallScheduler(), cache=cache).embed_entry("definition")
+        cache.close()
+
+        reopened = SqliteEmbeddingCache(path)
+        other_client = ClientMock()
+        strategy = GeminiEmbeddingStrategy(other_client, scheduler=CallScheduler(), cache=reopened)
+        assert_that(strategy.embed_entry("definition")).is_equal_to(embedding_of_text("definition"))
+        assert_that(other_client.models.embed_calls).is_empty()
+        reopened.close()
+
+
+class TestEmbeddingCacheKey:
+
+    def test_normalizes_whitespace(self):
+        assert_that(embedding_cache_key("m", "t", " a \n b ")).is_equal_to(embedding_cache_key("m", "t", "a b"))
+
+    def test_depends_on_model_and_task_type(self):
+        assert_that(embedding_cache_key("m", "t", "a")).is_not_equal_to(embedding_cache_key("n", "t", "a"))
+        assert_that(embedding_cache_key("m", "t", "a")).is_not_equal_to(embedding_cache_key("m", "u", "a"))
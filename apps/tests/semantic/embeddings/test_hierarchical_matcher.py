@@ -0,0 +1,49 @@
+import numpy as np
+from assertpy import assert_that
+
+from semantic.embeddings.benchmark_hierarchical_matcher import synthetic_taxonomy, synthetic_queries
+from semantic.embeddings.hierarchical_matcher import HierarchicalMatcher
+from semantic.embeddings.similarity_index import SimilarityIndex
+from semantic.ontology_index import OntologyIndex
+from semantic.ontology_loader import load_from_path
+
+onto_index = OntologyIndex(load_from_path("./tests/test_data/test-ontology.rdf"))
+
+
+class TestHierarchicalMatcher:
+
+    def test_wide_beam_equals_brute_force(self):
+        ids, matrix, children, roots = synthetic_taxonomy(branching=4, depth=3, dimensions=32)
+        queries = synthetic_queries(matrix, count=50)
+        matcher = HierarchicalMatcher(ids, matrix, children, roots, beam_width=16)
+        assert_that(matcher.best_matches(queries)).is_equal_to(SimilarityIndex(ids, matrix).best_matches(queries))
+
+    def test_narrow_beam_keeps_high_recall(self):
+        ids, matrix, children, roots = synthetic_taxonomy(branching=6, depth=3, dimensions=64)
+        queries = synthetic_queries(matrix, count=200)
+        expected = SimilarityIndex(ids, matrix).best_matches(queries)
+        matched = HierarchicalMatcher(ids, matrix, children, roots, beam_width=3).best_matches(queries)
+        recall = np.mean([match == expectation for match, expectation in zip(matched, expected)])
+        assert_that(recall).is_greater_than(0.8)
+
+    def test_search_returns_scores(self):
+        matcher = HierarchicalMatcher(["root", "left", "right"], [[1.0, 1.0], [1.0, 0.0], [0.0, 1.0]],
+                                      [[1, 2], [], []], [0], beam_width=1)
+        matches = matcher.search([[0.0, 2.0]], k=2)[0]
+        assert_that([name for name, _ in matches]).is_equal_to(["right", "root"])
+        assert_that(matches[0][1]).is_close_to(1.0, 1e-6)
+
+    def test_from_ontology_index(self):
+        names = [onto_index.names[entity_id] for entity_id in range(len(onto_index))]
+        rng = np.random.default_rng(0)
+        similarity_index = SimilarityIndex(names, rng.normal(size=(len(names), 16)))
+        matcher = HierarchicalMatcher.from_ontology_index(onto_index, "Area", similarity_index, beam_width=1000)
+        queries = rng.normal(size=(20, 16))
+        assert_that(matcher.best_matches(queries)).is_equal_to(similarity_index.best_matches(queries))
+
+    def test_from_ontology_index_descends_parts(self):
+        names = ["Mathematics", "Arithmetic", "IntegerArithmetic"]
+        similarity_index = SimilarityIndex(names, np.array([[1.0, 0.0], [1.0, 1.0], [0.0, 1.0]]))
+        matcher = HierarchicalMatcher.from_ontology_index(onto_index, "Area", similarity_index)
+        assert_that(matcher.roots.tolist()).is_equal_to([0])
+        assert_that(matcher.best_match([0.0, 1.0])).is_equal_to("IntegerArithmetic")
@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pytest
+from assertpy import assert_that
+from google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint import Namespace
+
+from semantic.embeddings.benchmark_local_vector_index import clustered_vectors
+from semantic.embeddings.local_vector_index import LocalVectorIndex
+from semantic.embeddings.similarity_index import SimilarityIndex
+
+
+def restricts(content_type, locale, deny=None):
+    type_restrict = {"namespace": "type", "allow": [content_type]}
+    if deny is not None:
+        type_restrict["deny"] = deny
+    return [type_restrict, {"namespace": "locale", "allow": [locale]}]
+
+
+class TestLocalVectorIndex:
+
+    @pytest.fixture
+    def jsonl_path(self, tmp_path):
+        records = [
+            {"id": "material-de", "embedding": [1.0, 0.0, 0.0], "restricts": restricts("material", "de")},
+            {"id": "material-en", "embedding": [0.9, 0.1, 0.0], "restricts": restricts("material", "en")},
+            {"id": "taxonomy", "embedding": [0.8, 0.2, 0.0], "restricts": restricts("taxonomy", "en")},
+            {"id": "hidden", "embedding": [0.95, 0.0, 0.05], "restricts": restricts("material", "de", ["material"])},
+            {"id": "far", "embedding": [0.0, 0.0, 1.0], "restricts": restricts("material", "de")},
+        ]
+        path = tmp_path / "embeddings.jsonl"
+        path.write_text("\n".join(json.dumps(record) for record in records))
+        return str(path)
+
+    @pytest.fixture
+    def index(self, jsonl_path):
+        return LocalVectorIndex.from_jsonl([jsonl_path], n_lists=2, n_probe=1)
+
+    def test_query(self, index):
+        neighbors = index.query([1.0, 0.0, 0.0], num_neighbors=2)
+        assert_that([neighbor.id for neighbor in neighbors]).is_equal_to(["material-de", "hidden"])
+        assert_that(neighbors[0].distance).is_close_to(1.0, 1e-6)
+
+    def test_allow_filter(self, index):
+        neighbors = index.query([1.0, 0.0, 0.0], num_neighbors=5,
+                                filter=[Namespace(name="type", allow_tokens=["taxonomy"])])
+        assert_that([neighbor.id for neighbor in neighbors]).is_equal_to(["taxonomy"])
+
+    def test_filters_are_combined(self, index):
+        neighbors = index.query([1.0, 0.0, 0.0], num_neighbors=5, filter=[
+            Namespace(name="type", allow_tokens=["material"]),
+            Namespace(name="locale", allow_tokens=["de"]),
+        ])
+        # "hidden" denies queries for materials
+        assert_that([neighbor.id for neighbor in neighbors]).is_equal_to(["material-de", "far"])
+
+    def test_deny_filter(self, index):
+        neighbors = index.query([1.0, 0.0, 0.0], num_neighbors=5,
+                                filter=[Namespace(name="locale", deny_tokens=["de"])])
+        assert_that([neighbor.id for neighbor in neighbors]).is_equal_to(["material-en", "taxonomy"])
+
+    def test_probes_more_lists_for_restrictive_filters(self, index):
+        neighbors = index.query([0.0, 0.0, 1.0], num_neighbors=1,
+                                filter=[Namespace(name="type", allow_tokens=["taxonomy"])])
+        assert_that([neighbor.id for neighbor in neighbors]).is_equal_to(["taxonomy"])
+
+    def test_save_and_load(self, index, tmp_path):
+        index.save(str(tmp_path / "index"))
+        loaded = LocalVectorIndex.load(str(tmp_path / "index"))
+        assert isinstance(loaded.matrix, np.memmap)
+        assert_that([neighbor.id for neighbor in loaded.query([0.9, 0.1, 0.0], num_neighbors=3)]) \
+            .is_equal_to([neighbor.id for neighbor in index.query([0.9, 0.1, 0.0], num_neighbors=3)])
+
+    def test_recall_against_exact_search(self):
+        vectors = clustered_vectors(count=2050, dimensions=64, clusters=20)
+        vectors, queries = vectors[:2000], vectors[2000:]
+        ids = [str(i) for i in range(len(vectors))]
+        index = LocalVectorIndex.build(ids, vectors, n_probe=4)
+        expected = SimilarityIndex(ids, vectors).search(queries, k=10)
+
+        results = index.find_neighbors(queries, num_neighbors=10)
+        recall = np.mean([len({name for name, _ in expectation} & {neighbor.id for neighbor in neighbors}) / 10
+                          for expectation, neighbors in zip(expected, results)])
+        assert_that(recall).is_greater_than(0.9)
+
+        exhaustive = index.find_neighbors(queries, num_neighbors=10, n_probe=index.n_lists)
+        assert_that([[neighbor.id for neighbor in neighbors] for neighbors in exhaustive]) \
+            .is_equal_to([[name for name, _ in expectation] for expectation in expected])
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from assertpy import assert_that
+
+from semantic.embeddings.similarity_index import SimilarityIndex
+
+
+class TestSimilarityIndex:
+
+    @pytest.fixture
+    def index(self):
+        return SimilarityIndex.from_embedding_map({
+            'x': [1.0, 0.0, 0.0],
+            'y': [0.0, 2.0, 0.0],
+            'xy': [1.0, 1.0, 0.0],
+            'z': [0.0, 0.0, 3.0],
+        })
+
+    def test_matrix_is_normalized_float32(self, index):
+        assert index.matrix.dtype == np.float32
+        assert index.matrix.flags['C_CONTIGUOUS']
+        assert np.allclose(np.linalg.norm(index.matrix, axis=1), 1.0)
+
+    def test_best_match(self, index):
+        assert index.best_match([0.0, 5.0, 0.1]) == 'y'
+
+    def test_best_matches(self, index):
+        result = index.best_matches([[0.0, 0.0, 1.0], [2.0, 0.1, 0.0], [1.0, 0.9, 0.0]])
+        assert_that(result).is_equal_to(['z', 'x', 'xy'])
+
+    def test_search_orders_top_k(self, index):
+        result = index.search([[1.0, 0.2, 0.0]], k=2)
+        assert_that([key for key, _ in result[0]]).is_equal_to(['x', 'xy'])
+        assert result[0][0][1] >= result[0][1][1]
+
+    def test_search_k_larger_than_index(self, index):
+        result = index.search([[0.0, 1.0, 0.0]], k=10)
+        assert len(result[0]) == 4
+        assert result[0][0][0] == 'y'
+
+    def test_zero_query_scores_zero(self, index):
+        assert np.allclose(index.score([0.0, 0.0, 0.0]), 0.0)
+
+    def test_empty_index(self):
+        index = SimilarityIndex.from_embedding_map({})
+        assert_that(index.search([[1.0, 0.0]])).is_equal_to([[]])
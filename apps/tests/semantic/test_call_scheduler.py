@@ -0,0 +1,151 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from assertpy import assert_that
+from google.genai import errors
+
+from semantic.call_scheduler import CallScheduler, TokenBucket, call_priority, retry_after_of, \
+    PRIORITY_BULK
+
+
+def quota_error(retry_delay=None):
+    details = [] if retry_delay is None else [
+        {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": retry_delay}]
+    return errors.APIError(429, {"error": {"code": 429, "message": "quota", "status": "RESOURCE_EXHAUSTED",
+                                           "details": details}})
+
+
+class FlakyCall:
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.calls = 0
+
+    def __call__(self, value):
+        self.calls += 1
+        if len(self.failures) > 0:
+            raise self.failures.pop(0)
+        return value
+
+
+class TestCallScheduler:
+
+    @pytest.fixture
+    def scheduler(self):
+        return CallScheduler(default_requests_per_minute=60_000, base_delay=0.001, max_delay=0.01)
+
+    def test_returns_result(self, scheduler):
+        assert_that(scheduler.call("model", lambda value: value * 2, 21)).is_equal_to(42)
+
+    def test_retries_retryable_errors(self, scheduler):
+        call = FlakyCall([quota_error(), errors.APIError(503, {"error": {"message": "unavailable"}})])
+        assert_that(scheduler.call("model", call, "ok")).is_equal_to("ok")
+        assert_that(call.calls).is_equal_to(3)
+        assert_that(scheduler.stats()["model"]["retries"]).is_equal_to(2)
+
+    def test_raises_other_errors(self, scheduler):
+        call = FlakyCall([errors.APIError(400, {"error": {"message": "bad request"}})])
+        with pytest.raises(errors.APIError):
+            scheduler.call("model", call, "ok")
+        assert_that(call.calls).is_equal_to(1)
+
+    def test_gives_up_after_max_attempts(self):
+        scheduler = CallScheduler(max_attempts=2, base_delay=0.001)
+        call = FlakyCall([quota_error(), quota_error(), quota_error()])
+        with pytest.raises(errors.APIError):
+            scheduler.call("model", call, "ok")
+        assert_that(call.calls).is_equal_to(2)
+
+    def test_throttling_halves_concurrency(self):
+        scheduler = CallScheduler(initial_concurrency=8, base_delay=0.001)
+        scheduler.call("model", FlakyCall([quota_error()]), "ok")
+        assert_that(scheduler.stats()["model"]["concurrency_limit"]).is_equal_to(4)
+        assert_that(scheduler.stats()["model"]["throttled"]).is_equal_to(1)
+
+    def test_fast_calls_raise_concurrency(self, scheduler):
+        for _ in range(20):
+            scheduler.call("model", lambda: None)
+        assert_that(scheduler.stats()["model"]["concurrency_limit"]).is_greater_than(4)
+
+    def test_honours_retry_after(self):
+        scheduler = CallScheduler(default_requests_per_minute=60_000, base_delay=0.001, max_delay=1.0)
+        call = FlakyCall([quota_error("0.2s")])
+        started_at = time.monotonic()
+        scheduler.call("model", call, "ok")
+        assert_that(time.monotonic() - started_at).is_greater_than_or_equal_to(0.2)
+
+    def test_caps_retry_after_at_max_delay(self, scheduler):
+        call = FlakyCall([quota_error("3600s")])
+        started_at = time.monotonic()
+        assert_that(scheduler.call("model", call, "ok")).is_equal_to("ok")
+        assert_that(time.monotonic() - started_at).is_less_than(1.0)
+
+    def test_limits_concurrency(self):
+        scheduler = CallScheduler(initial_concurrency=2, max_concurrency=2)
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def call():
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            for future in [executor.submit(scheduler.call, "model", call) for _ in range(6)]:
+                future.result()
+        assert_that(running[1]).is_equal_to(2)
+
+    def test_rate_limits(self):
+        scheduler = CallScheduler(default_requests_per_minute=600)
+        started_at = time.monotonic()
+        for _ in range(13):
+            scheduler.call("model", lambda: None)
+        # A burst of 10 calls, then one call every 0.1 seconds
+        assert_that(time.monotonic() - started_at).is_greater_than_or_equal_to(0.25)
+
+    def test_serves_interactive_calls_first(self):
+        scheduler = CallScheduler(initial_concurrency=1, max_concurrency=1)
+        release = threading.Event()
+        order = []
+
+        def bulk():
+            with call_priority(PRIORITY_BULK):
+                scheduler.call("model", order.append, "bulk")
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            blocking = executor.submit(scheduler.call, "model", release.wait)
+            while scheduler.stats()["model"]["in_flight"] < 1:
+                time.sleep(0.001)
+            bulk_call = executor.submit(bulk)
+            while scheduler.stats()["model"]["queued"] < 1:
+                time.sleep(0.001)
+            interactive_call = executor.submit(scheduler.call, "model", order.append, "interactive")
+            while scheduler.stats()["model"]["queued"] < 2:
+                time.sleep(0.001)
+            release.set()
+            for future in [blocking, bulk_call, interactive_call]:
+                future.result()
+
+        assert_that(order).is_equal_to(["interactive", "bulk"])
+
+
+class TestRetryAfter:
+
+    def test_of_retry_info(self):
+        assert_that(retry_after_of(quota_error("7s"))).is_equal_to(7.0)
+
+    def test_without_retry_info(self):
+        assert_that(retry_after_of(quota_error())).is_none()
+
+
+class TestTokenBucket:
+
+    def test_bursts_then_waits(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        assert_that(bucket.take()).is_equal_to(0)
+        assert_that(bucket.take()).is_equal_to(0)
+        assert_that(bucket.take()).is_greater_than(0)
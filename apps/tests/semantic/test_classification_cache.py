@@ -3,7 +3,7 @@ import time
 import pytest
 from assertpy import assert_that
 
-from semantic.classification_cache import ClassificationCache
+from semantic.classification_cache import ClassificationCache, ClassificationStore, classification_cache_key
 
 
 class TestClassificationTest:
@@ -22,3 +22,71 @@ class TestClassificationTest:
         time.sleep(0.11)
         result = cache.get('test')
         assert_that(result).is_none()
+
+    def test_timeout_removes_entry(self, cache):
+        cache.update('test', 'value')
+        cache.timeout('test')
+        assert_that(cache.get('test')).is_none()
+
+    def test_sweep(self, cache):
+        cache.update('test', 'value')
+        time.sleep(0.11)
+        assert cache.sweep() == 1
+        assert_that(cache.stats()).contains_entry({'entries': 0}, {'expirations': 1})
+
+    def test_sweeper(self, cache):
+        cache.update('test', 'value')
+        cache.start_sweeper(0.05)
+        time.sleep(0.3)
+        cache.stop_sweeper()
+        assert_that(cache.stats()).contains_entry({'entries': 0})
+
+    def test_stats(self, cache):
+        cache.update('test', 'value')
+        cache.get('test')
+        cache.get('unknown')
+        assert_that(cache.stats()).contains_entry({'hits': 1}, {'misses': 1})
+
+    def test_peek_is_not_counted(self, cache):
+        cache.update('test', 'value')
+        assert_that(cache.peek('test')).is_equal_to('value')
+        assert_that(cache.peek('unknown')).is_none()
+        assert_that(cache.stats()).contains_entry({'hits': 0}, {'misses': 0})
+
+
+class TestClassificationCacheEviction:
+
+    @pytest.fixture
+    def cache(self):
+        return ClassificationCache(max_entries=2)
+
+    def test_evicts_least_recently_used(self, cache):
+        cache.update('a', b'1')
+        cache.update('b', b'2')
+        cache.get('a')
+        cache.update('c', b'3')
+        assert_that(cache.get('a')).is_equal_to(b'1')
+        assert_that(cache.get('b')).is_none()
+        assert_that(cache.get('c')).is_equal_to(b'3')
+        assert_that(cache.stats()).contains_entry({'evictions': 1})
+
+
+class TestClassificationCacheKey:
+
+    def test_key_is_stable(self):
+        key = classification_cache_key('digest', 'strategy', 'v1')
+        assert key == classification_cache_key('digest', 'strategy', 'v1')
+
+    def test_key_depends_on_all_parts(self):
+        key = classification_cache_key('digest', 'strategy', 'v1')
+        assert key != classification_cache_key('other', 'strategy', 'v1')
+        assert key != classification_cache_key('digest', 'other', 'v1')
+        assert key != classification_cache_key('digest', 'strategy', 'v2')
+
+    def test_store_must_implement_all_methods(self):
+        class IncompleteStore(ClassificationStore):
+            def get(self, key):
+                return None
+
+        with pytest.raises(TypeError):
+            IncompleteStore()
@@ -0,0 +1,159 @@
+import datetime
+import io
+import threading
+import time
+
+import pytest
+from assertpy import assert_that
+
+from semantic.classification_jobs import ClassificationJobStore, ClassificationJobs, JobQueueFull, \
+    JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_RUNNING
+
+
+def wait_for_status(jobs, job_id, status, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if jobs.get(job_id)["status"] == status:
+            return
+        time.sleep(0.01)
+    raise AssertionError("job {} did not reach status {}".format(job_id, status))
+
+
+class TestClassificationJobs:
+
+    @pytest.fixture
+    def path(self, tmp_path):
+        return str(tmp_path / "jobs.sqlite3")
+
+    @pytest.fixture
+    def handled(self):
+        return []
+
+    @pytest.fixture
+    def jobs(self, path, handled):
+        def handler(content_digest, content, mime_type):
+            handled.append((content_digest, content.read(), mime_type))
+            return b'{"ok":true}'
+
+        jobs = ClassificationJobs(ClassificationJobStore(path), handler, max_workers=2)
+        yield jobs
+        jobs.close()
+
+    def test_runs_job(self, jobs, handled):
+        job_id = jobs.create("abc", io.BytesIO(b"content"), "image/png")
+        wait_for_status(jobs, job_id, JOB_DONE)
+        assert_that(jobs.get(job_id)["result"]).is_equal_to(b'{"ok":true}')
+        assert_that(handled).is_equal_to([("abc", b"content", "image/png")])
+
+    def test_records_failure(self, path):
+        def handler(content_digest, content, mime_type):
+            raise ValueError("boom")
+
+        jobs = ClassificationJobs(ClassificationJobStore(path), handler)
+        job_id = jobs.create("abc", io.BytesIO(b"content"), "image/png")
+        wait_for_status(jobs, job_id, JOB_FAILED)
+        assert_that(jobs.get(job_id)["error"]).is_equal_to("boom")
+        jobs.close()
+
+    def test_unknown_job(self, jobs):
+        assert_that(jobs.get("missing")).is_none()
+
+    def test_rejects_when_full(self, path):
+        release = threading.Event()
+
+        def handler(content_digest, content, mime_type):
+            release.wait()
+            return b'{}'
+
+        jobs = ClassificationJobs(ClassificationJobStore(path), handler, max_workers=1, max_queued=2)
+        jobs.create("a", io.BytesIO(b"a"), "image/png")
+        jobs.create("b", io.BytesIO(b"b"), "image/png")
+        with pytest.raises(JobQueueFull):
+            jobs.create("c", io.BytesIO(b"c"), "image/png")
+        release.set()
+        jobs.executor.shutdown(wait=True)
+        assert_that(jobs.store.counts()[JOB_DONE]).is_equal_to(2)
+        jobs.close()
+
+    def test_resumes_unfinished_jobs(self, path, handled):
+        store = ClassificationJobStore(path)
+        pending_id = store.create("a", io.BytesIO(b"a"), "image/png")
+        orphaned_id = store.create("b", io.BytesIO(b"b"), "image/png")
+        store.claim(orphaned_id)
+        # The process crashed, so its lease ran out
+        store.connection.execute("UPDATE classification_jobs SET lease_expires_at = 0 WHERE id = ?", (orphaned_id,))
+        store.close()
+
+        def handler(content_digest, content, mime_type):
+            handled.append(content_digest)
+            return b'{}'
+
+        jobs = ClassificationJobs(ClassificationJobStore(path), handler)
+        assert_that(jobs.resume()).is_equal_to(2)
+        wait_for_status(jobs, pending_id, JOB_DONE)
+        wait_for_status(jobs, orphaned_id, JOB_DONE)
+        assert_that(sorted(handled)).is_equal_to(["a", "b"])
+        jobs.close()
+
+    def test_keeps_running_jobs_with_lease(self, path):
+        store = ClassificationJobStore(path)
+        job_id = store.create("a", io.BytesIO(b"a"), "image/png")
+        store.claim(job_id)
+        assert_that(store.requeue_orphaned()).is_empty()
+        assert_that(store.get(job_id)["status"]).is_equal_to(JOB_RUNNING)
+        store.close()
+
+    def test_requeues_jobs_of_restarted_process(self, path):
+        # A restarted process might get the same PID, it still opens the store as a new instance
+        crashed = ClassificationJobStore(path, lease=datetime.timedelta(seconds=0.05))
+        job_id = crashed.create("a", io.BytesIO(b"a"), "image/png")
+        crashed.claim(job_id)
+
+        restarted = ClassificationJobStore(path)
+        assert_that(restarted.instance_id).is_not_equal_to(crashed.instance_id)
+        time.sleep(0.1)
+        assert_that(restarted.requeue_orphaned()).is_equal_to([job_id])
+        assert_that(restarted.get(job_id)["status"]).is_equal_to(JOB_PENDING)
+        crashed.close()
+        restarted.close()
+
+    def test_renews_leases_of_own_jobs(self, path):
+        store = ClassificationJobStore(path, lease=datetime.timedelta(seconds=0.2))
+        other = ClassificationJobStore(path, lease=datetime.timedelta(seconds=0.2))
+        own_id = store.create("a", io.BytesIO(b"a"), "image/png")
+        other_id = store.create("b", io.BytesIO(b"b"), "image/png")
+        store.claim(own_id)
+        other.claim(other_id)
+
+        time.sleep(0.15)
+        assert_that(store.renew_leases()).is_equal_to(1)
+        time.sleep(0.1)
+        assert_that(store.requeue_orphaned()).is_equal_to([other_id])
+        store.close()
+        other.close()
+
+    def test_sweeper_picks_up_orphaned_jobs(self, path, handled):
+        crashed = ClassificationJobStore(path, lease=datetime.timedelta(seconds=0.05))
+        job_id = crashed.create("a", io.BytesIO(b"a"), "image/png")
+        crashed.claim(job_id)
+        crashed.close()
+
+        def handler(content_digest, content, mime_type):
+            return b'{}'
+
+        jobs = ClassificationJobs(ClassificationJobStore(path, lease=datetime.timedelta(seconds=0.05)), handler)
+        jobs.start_sweeper()
+        wait_for_status(jobs, job_id, JOB_DONE)
+        jobs.close()
+
+    def test_removes_content_when_finished(self, jobs, path):
+        job_id = jobs.create("abc", io.BytesIO(b"content"), "image/png")
+        wait_for_status(jobs, job_id, JOB_DONE)
+        assert_that(path + ".contents/abc").does_not_exist()
+
+    def test_purges_finished_jobs(self, jobs):
+        job_id = jobs.create("abc", io.BytesIO(b"content"), "image/png")
+        wait_for_status(jobs, job_id, JOB_DONE)
+        assert_that(jobs.store.purge(older_than=-1)).is_equal_to(1)
+        assert_that(jobs.get(job_id)).is_none()
+        assert_that(jobs.store.counts()[JOB_PENDING]).is_equal_to(0)
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+from assertpy import assert_that
+
+from semantic.classification_cache import ClassificationCache
+from semantic.classification_store_sqlite import SqliteClassificationStore
+
+
+class TestSqliteClassificationStore:
+
+    @pytest.fixture
+    def path(self, tmp_path):
+        return str(tmp_path / "classifications.sqlite3")
+
+    @pytest.fixture
+    def store(self, path):
+        store = SqliteClassificationStore(path, expires=0.2, max_entries=3, batch_size=2)
+        yield store
+        store.close()
+
+    def test_put_get_before_flush(self, store):
+        store.put('a', b'1')
+        assert_that(store.get('a')).is_equal_to(b'1')
+
+    def test_put_get_after_flush(self, store):
+        store.put('a', b'1')
+        store.flush()
+        assert_that(store.get('a')).is_equal_to(b'1')
+
+    def test_shared_between_stores(self, store, path):
+        store.put('a', b'1')
+        store.flush()
+        other = SqliteClassificationStore(path)
+        assert_that(other.get('a')).is_equal_to(b'1')
+        other.close()
+
+    def test_survives_reopen(self, path):
+        store = SqliteClassificationStore(path)
+        store.put('a', b'1')
+        store.close()
+        reopened = SqliteClassificationStore(path)
+        assert_that(reopened.get('a')).is_equal_to(b'1')
+        reopened.close()
+
+    def test_expires(self, store):
+        store.put('a', b'1')
+        store.flush()
+        time.sleep(0.25)
+        assert_that(store.get('a')).is_none()
+        assert store.sweep() == 1
+
+    def test_delete(self, store):
+        store.put('a', b'1')
+        store.flush()
+        store.delete('a')
+        assert_that(store.get('a')).is_none()
+
+    def test_evicts_oldest(self, store):
+        for key in ['a', 'b', 'c', 'd']:
+            store.put(key, key.encode())
+            store.flush()
+        assert_that(store.get('a')).is_none()
+        assert_that(store.get('d')).is_equal_to(b'd')
+        assert_that(store.stats()).contains_entry({'entries': 3}, {'evictions': 1})
+
+    def test_as_cache_backend(self, store):
+        cache = ClassificationCache(store=store)
+        cache.update('a', b'1')
+        assert_that(cache.get('a')).is_equal_to(b'1')
+        assert_that(cache.get('b')).is_none()
+        assert_that(cache.stats()).contains_entry({'hits': 1}, {'misses': 1})
+
+    def test_stats_count_replaced_entries_once(self, path):
+        store = SqliteClassificationStore(path, batch_size=10)
+        store.put('a', b'1')
+        store.flush()
+        store.put('a', b'2')
+        store.put('b', b'1')
+        assert_that(store.stats()).contains_entry({'entries': 2})
+        store.close()
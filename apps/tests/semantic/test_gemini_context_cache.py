@@ -0,0 +1,118 @@
+import datetime
+
+import pytest
+from assertpy import assert_that
+
+from semantic.classifiers.strategies.classifier_split_gemini_with_serialized_taxonomies_v1 import \
+    ClassifierSplitGeminiWithSerializedTaxonomiesV1
+from semantic.gemini_context_cache import GeminiContextCache, context_cache_name
+from semantic.ontology_index import OntologyIndex
+from semantic.ontology_loader import load_from_path
+from tests.genai_mock import ClientMock
+
+onto_index = OntologyIndex(load_from_path("./tests/test_data/test-ontology.rdf"))
+
+
+def build_cache(client, **kwargs):
+    return GeminiContextCache(client, "taxonomy-areas", "model", "instruction", ["taxonomy"], **kwargs)
+
+
+class TestGeminiContextCache:
+
+    def test_get_creates_once(self):
+        client = ClientMock()
+        cache = build_cache(client)
+        assert cache.get() == "cachedContents/1"
+        assert cache.get() == "cachedContents/1"
+        assert len(client.caches.created) == 1
+
+    def test_get_reuses_cache_of_other_worker(self):
+        client = ClientMock()
+        build_cache(client).get()
+        assert build_cache(client).get() == "cachedContents/1"
+        assert len(client.caches.created) == 1
+
+    def test_get_recreates_expiring_cache(self):
+        client = ClientMock()
+        cache = build_cache(client, ttl=datetime.timedelta(minutes=5))
+        cache.get()
+        # A ttl below the refresh margin expires soon right away
+        cache.get()
+        assert len(client.caches.created) == 2
+
+    def test_get_falls_back(self):
+        client = ClientMock(failing_caches=True)
+        cache = build_cache(client)
+        assert_that(cache.get()).is_none()
+        assert_that(cache.get()).is_none()
+        assert len(client.caches.created) == 0
+
+    def test_refresh(self):
+        client = ClientMock()
+        cache = build_cache(client)
+        cache.get()
+        cache.refresh()
+        assert_that(client.caches.updated).is_equal_to(["cachedContents/1"])
+
+    def test_refresh_missing_cache_rebuilds(self):
+        client = ClientMock()
+        cache = build_cache(client)
+        cache.get()
+        client.caches.cached_contents.clear()
+        cache.refresh()
+        assert cache.get() == "cachedContents/2"
+
+    def test_context_cache_name(self):
+        assert context_cache_name("taxonomy", "gemini", "0123456789abcdef") == "taxonomy-gemini-0123456789ab"
+
+
+class TestClassifierContextCaching:
+
+    @pytest.fixture
+    def client(self):
+        return ClientMock(response={"step_1": "description", "step_3": ["Integer Multiplication"]})
+
+    def test_without_context_caching(self, client):
+        classifier = ClassifierSplitGeminiWithSerializedTaxonomiesV1(onto_index, client=client)
+        assert_that(classifier.classify_ability("file")).is_equal_to(["IntegerMultiplication"])
+        call = client.models.calls[0]
+        assert_that(call["contents"][1]).contains(classifier.ability_taxonomy)
+        assert_that(call["config"].cached_content).is_none()
+
+    def test_with_context_caching(self, client):
+        classifier = ClassifierSplitGeminiWithSerializedTaxonomiesV1(
+            onto_index, ontology_version="v1", context_caching=True, client=client)
+        assert_that(classifier.classify_scope("file")).is_equal_to(["IntegerMultiplication"])
+        call = client.models.calls[0]
+        assert_that(call["contents"][1]).does_not_contain(classifier.scope_taxonomy)
+        assert_that(call["config"].cached_content).is_not_none()
+        assert_that(client.caches.created[0].contents).is_equal_to([classifier.scope_taxonomy])
+        assert_that(client.caches.created[0].system_instruction).is_none()
+        for context_cache in classifier.context_caches.values():
+            context_cache.stop_refresher()
+
+    def test_context_caching_does_not_change_the_instructions(self, client):
+        inline = ClassifierSplitGeminiWithSerializedTaxonomiesV1(onto_index, client=client)
+        cached = ClassifierSplitGeminiWithSerializedTaxonomiesV1(
+            onto_index, ontology_version="v1", context_caching=True, client=client)
+        inline.classify_ability("file")
+        cached.classify_ability("file")
+
+        inline_call, cached_call = client.models.calls
+        assert_that(cached_call["config"].system_instruction).is_equal_to(inline_call["config"].system_instruction)
+        assert_that(cached_call["config"].cached_content).is_not_none()
+        assert_that(client.caches.created[0].system_instruction).is_equal_to(inline_call["config"].system_instruction)
+        for context_cache in cached.context_caches.values():
+            context_cache.stop_refresher()
+
+    def test_with_context_caching_falls_back_to_inline(self):
+        client = ClientMock(response={"step_1": "description", "step_3": ["Integer Multiplication"]},
+                            failing_caches=True)
+        classifier = ClassifierSplitGeminiWithSerializedTaxonomiesV1(
+            onto_index, ontology_version="v1", context_caching=True, client=client)
+        classifier.classify_ability("file")
+        call = client.models.calls[0]
+        assert_that(call["contents"][1]).contains(classifier.ability_taxonomy)
+        assert_that(call["config"].cached_content).is_none()
+        for context_cache in classifier.context_caches.values():
+            context_cache.stop_refresher()
@@ -0,0 +1,75 @@
+import datetime
+import threading
+from io import BytesIO
+
+from assertpy import assert_that
+
+from semantic.gemini_file_registry import GeminiFileRegistry
+from tests.genai_mock import ClientMock
+
+
+class TestGeminiFileRegistry:
+
+    def test_uploads_once(self):
+        client = ClientMock()
+        registry = GeminiFileRegistry(client)
+        first = registry.get_or_upload("abc", BytesIO(b"content"), "image/png")
+        second = registry.get_or_upload("abc", BytesIO(b"content"), "image/png")
+        assert first is second
+        assert_that(client.files.uploaded).is_equal_to([b"content"])
+        assert client.files.lookups == 0
+        assert_that(registry.stats()).contains_entry({"hits": 1}, {"uploads": 1})
+
+    def test_concurrent_requests_upload_once(self):
+        client = ClientMock()
+        client.files.upload_delay = 0.05
+        registry = GeminiFileRegistry(client)
+        threads = [threading.Thread(target=registry.get_or_upload, args=("abc", BytesIO(b"content"), "image/png"))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(client.files.uploaded) == 1
+
+    def test_reuses_file_uploaded_elsewhere(self):
+        client = ClientMock()
+        GeminiFileRegistry(client).get_or_upload("abc", BytesIO(b"content"), "image/png")
+        file = GeminiFileRegistry(client).get_or_upload("abc", BytesIO(b"content"), "image/png")
+        assert file.name == "files/abc"
+        assert len(client.files.uploaded) == 1
+
+    def test_purges_expiring_files(self):
+        client = ClientMock()
+        client.files.lifetime = datetime.timedelta(minutes=30)
+        registry = GeminiFileRegistry(client, expiry_margin=datetime.timedelta(hours=1))
+        registry.get_or_upload("abc", BytesIO(b"content"), "image/png")
+        assert_that(registry.get("abc")).is_none()
+        assert registry.purge() == 1
+        assert_that(registry.stats()).contains_entry({"files": 0})
+
+    def test_replaces_expiring_file(self):
+        client = ClientMock()
+        client.files.lifetime = datetime.timedelta(minutes=30)
+        registry = GeminiFileRegistry(client, expiry_margin=datetime.timedelta(hours=1))
+        registry.get_or_upload("abc", BytesIO(b"content"), "image/png")
+
+        client.files.lifetime = datetime.timedelta(hours=48)
+        file = registry.get_or_upload("abc", BytesIO(b"content"), "image/png")
+
+        assert_that(client.files.deleted).is_equal_to(["files/abc"])
+        assert_that(client.files.uploaded).is_length(2)
+        assert client.files.lookups == 0
+        assert_that(registry.get("abc")).is_same_as(file)
+
+    def test_replaces_expiring_file_uploaded_elsewhere(self):
+        client = ClientMock()
+        client.files.lifetime = datetime.timedelta(minutes=30)
+        GeminiFileRegistry(client).get_or_upload("abc", BytesIO(b"content"), "image/png")
+
+        client.files.lifetime = datetime.timedelta(hours=48)
+        registry = GeminiFileRegistry(client, expiry_margin=datetime.timedelta(hours=1))
+        file = registry.get_or_upload("abc", BytesIO(b"content"), "image/png")
+
+        assert_that(client.files.deleted).is_equal_to(["files/abc"])
+        assert_that(registry.get("abc")).is_same_as(file)
@@ -0,0 +1,62 @@
+import pytest
+from assertpy import assert_that
+
+from semantic.classifiers.context_builder import build_taxonomy
+from semantic.ontology_index import OntologyIndex
+from semantic.ontology_loader import load_from_path
+from semantic.ontology_serializer import serialize_entity_tree
+from semantic.ontology_util import OntologyUtil, is_leaf_entity, is_root_entity
+
+onto = load_from_path("./tests/test_data/test-ontology.rdf")
+onto_util = OntologyUtil(onto)
+onto_index = OntologyIndex(onto)
+
+
+def names_of(entities):
+    return [entity.name for entity in entities]
+
+
+class TestOntologyIndex:
+
+    def test_ids(self):
+        entity_id = onto_index.id_of("IntegerMultiplication")
+        assert onto_index.names[entity_id] == "IntegerMultiplication"
+        assert onto_index.node("IntegerMultiplication").id == entity_id
+        assert "IntegerMultiplication" in onto_index
+        assert "Unknown" not in onto_index
+
+    def test_node_attributes(self):
+        node = onto_index.node("IntegerMultiplication")
+        assert node.natural_name == "Integer Multiplication"
+        assert_that(names_of(node.parents)).is_equal_to(["IntegerArithmetic"])
+        assert_that(names_of(node.expansions)).is_equal_to(names_of(onto.IntegerMultiplication.INDIRECT_expands))
+
+    def test_node_is_read_only(self):
+        with pytest.raises(AttributeError):
+            onto_index.node("Mathematics").name = "Other"
+
+    def test_node_relations(self):
+        node = onto_index.node("Mathematics")
+        assert_that(names_of(node.hasPartArea)).is_equal_to(names_of(onto.Mathematics.hasPartArea))
+        assert_that(node.hasPartScope).is_empty()
+        assert not hasattr(node, "unknownRelation")
+
+    def test_roots(self):
+        for dimension in ["Area", "Ability", "Scope"]:
+            expected = onto_util.list_root_entities(getattr(onto, dimension))
+            assert_that(names_of(onto_index.root_nodes(dimension))).is_equal_to(names_of(expected))
+
+    def test_traversals(self):
+        assert is_leaf_entity(onto_index.node("IntegerMultiplication"))
+        assert not is_leaf_entity(onto_index.node("Mathematics"))
+        assert is_root_entity(onto_index.node("Mathematics"))
+        assert not is_root_entity(onto_index.node("IntegerArithmetic"))
+
+    def test_build_taxonomy_matches_ontology(self):
+        for dimension in ["Area", "Ability", "Scope"]:
+            expected = build_taxonomy(dimension, onto_util.list_root_entities(getattr(onto, dimension)))
+            assert build_taxonomy(dimension, onto_index.root_nodes(dimension)) == expected
+
+    def test_serialize_entity_tree_matches_ontology(self):
+        expected = serialize_entity_tree(onto_util.list_root_entities(onto.Area), "hasPartArea")
+        assert_that(serialize_entity_tree(onto_index.root_nodes("Area"), "hasPartArea")).is_equal_to(expected)
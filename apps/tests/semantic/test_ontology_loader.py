@@ -0,0 +1,54 @@
+import os
+
+from assertpy import assert_that
+from owlready2 import World
+
+from semantic.ontology_index import OntologyIndex
+from semantic import ontology_loader
+from semantic.ontology_loader import load_from_world, world_path_of_ontology, ontology_version_of_path
+
+onto_path = "./tests/test_data/test-ontology.rdf"
+
+
+def names_of(entities):
+    return sorted(entity.name for entity in entities)
+
+
+class TestOntologyWorld:
+
+    def test_ontology_version_is_stable(self):
+        assert ontology_version_of_path(onto_path) == ontology_version_of_path(onto_path)
+
+    def test_load_from_world_compiles_once(self, tmp_path):
+        world_dir = str(tmp_path)
+        world_path = world_path_of_ontology(onto_path, world_dir)
+
+        load_from_world(onto_path, world_dir)
+        assert os.path.isfile(world_path)
+        modified = os.path.getmtime(world_path)
+
+        load_from_world(onto_path, world_dir)
+        assert os.path.getmtime(world_path) == modified
+
+    def test_load_from_world_matches_rdf(self, tmp_path):
+        rdf_onto = World().get_ontology(onto_path).load()
+        world_onto = load_from_world(onto_path, str(tmp_path))
+
+        assert_that(names_of(world_onto.individuals())).is_equal_to(names_of(rdf_onto.individuals()))
+        assert_that(names_of(world_onto.Mathematics.INDIRECT_hasPart)) \
+            .is_equal_to(names_of(rdf_onto.Mathematics.INDIRECT_hasPart))
+
+        index = OntologyIndex(world_onto)
+        assert len(index.root_nodes("Ability")) == 7
+
+    def test_load_from_world_does_not_parse_rdf_again(self, tmp_path, monkeypatch):
+        world_dir = str(tmp_path)
+        load_from_world(onto_path, world_dir)
+
+        def compile_world(path, world_path):
+            raise AssertionError("The ontology was compiled again")
+
+        monkeypatch.setattr(ontology_loader, "compile_world", compile_world)
+        onto = load_from_world(onto_path, world_dir)
+
+        assert_that(names_of(onto.Mathematics.INDIRECT_hasPart)).is_not_empty()
@@ -0,0 +1,67 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from assertpy import assert_that
+
+from semantic.single_flight import SingleFlight
+
+
+class TestSingleFlight:
+
+    @pytest.fixture
+    def single_flight(self):
+        return SingleFlight()
+
+    def test_runs_once_for_concurrent_calls(self, single_flight):
+        started = threading.Event()
+        release = threading.Event()
+        runs = []
+
+        def work():
+            runs.append(1)
+            started.set()
+            release.wait()
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            leader = executor.submit(single_flight.do, "key", work)
+            started.wait()
+            followers = [executor.submit(single_flight.do, "key", work) for _ in range(3)]
+            while single_flight.stats()["coalesced"] < 3:
+                time.sleep(0.001)
+            release.set()
+            results = [future.result() for future in [leader] + followers]
+
+        assert_that(results).is_equal_to(["result"] * 4)
+        assert_that(runs).is_length(1)
+        assert_that(single_flight.stats()).is_equal_to({"calls": 4, "coalesced": 3, "in_flight": 0})
+
+    def test_failure_reaches_waiters_and_is_not_kept(self, single_flight):
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing():
+            started.set()
+            release.wait()
+            raise ValueError("failed")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(single_flight.do, "key", failing)
+            started.wait()
+            follower = executor.submit(single_flight.do, "key", failing)
+            while single_flight.stats()["coalesced"] < 1:
+                time.sleep(0.001)
+            release.set()
+            with pytest.raises(ValueError):
+                leader.result()
+            with pytest.raises(ValueError):
+                follower.result()
+
+        assert_that(single_flight.do("key", lambda: "retried")).is_equal_to("retried")
+
+    def test_different_keys_run_independently(self, single_flight):
+        assert_that(single_flight.do("a", lambda: 1)).is_equal_to(1)
+        assert_that(single_flight.do("b", lambda: 2)).is_equal_to(2)
+        assert_that(single_flight.stats()["coalesced"]).is_equal_to(0)
@@ -0,0 +1,107 @@
+import threading
+import time
+
+from assertpy import assert_that
+
+from semantic.staged_pipeline import Stage, StagedPipeline
+
+
+class TestStagedPipeline:
+
+    def test_runs_items_through_all_stages(self):
+        results = []
+        lock = threading.Lock()
+
+        def collect(item):
+            with lock:
+                results.append(item)
+            return item
+
+        pipeline = StagedPipeline([
+            Stage("double", lambda x: 2 * x, concurrency=3),
+            Stage("increment", lambda x: x + 1, concurrency=2),
+            Stage("collect", collect),
+        ], report_interval=None)
+        stats = pipeline.run(range(20))
+
+        assert_that(sorted(results)).is_equal_to([2 * x + 1 for x in range(20)])
+        assert_that(stats["collect"]["processed"]).is_equal_to(20)
+
+    def test_drops_failing_and_skipped_items(self):
+        def check(x):
+            if x == 3:
+                raise ValueError("Broken item")
+            return None if x == 4 else x
+
+        pipeline = StagedPipeline([
+            Stage("check", check),
+            Stage("pass", lambda x: x),
+        ], report_interval=None)
+        stats = pipeline.run(range(6))
+
+        assert_that(stats["check"]).contains_entry({"processed": 5}, {"failed": 1})
+        assert_that(stats["pass"]["processed"]).is_equal_to(4)
+
+    def test_stages_work_at_the_same_time(self):
+        def slow(x):
+            time.sleep(0.05)
+            return x
+
+        pipeline = StagedPipeline([
+            Stage("first", slow, concurrency=4),
+            Stage("second", slow, concurrency=4),
+        ], report_interval=None)
+        started_at = time.monotonic()
+        pipeline.run(range(8))
+
+        # Sequentially this takes 0.8 seconds, overlapped about 0.15
+        assert_that(time.monotonic() - started_at).is_less_than(0.5)
+
+    def test_bounds_items_in_flight(self):
+        fed = []
+        release = threading.Event()
+
+        def items():
+            for x in range(100):
+                fed.append(x)
+                yield x
+
+        def blocked(x):
+            release.wait()
+            return x
+
+        pipeline = StagedPipeline([Stage("blocked", blocked, concurrency=2, queue_size=3)], report_interval=None)
+        runner = threading.Thread(target=pipeline.run, args=(items(),))
+        runner.start()
+        time.sleep(0.1)
+        in_memory = len(fed)
+        release.set()
+        runner.join()
+
+        # 2 items in the workers, 3 in the queue and one waiting to be put
+        assert_that(in_memory).is_less_than_or_equal_to(6)
+
+    def test_fan_out_stage_passes_on_elements_as_produced(self):
+        results = []
+        lock = threading.Lock()
+
+        def split(x):
+            for _ in range(x):
+                yield x
+            if x == 3:
+                raise ValueError("Broken item")
+
+        def collect(item):
+            with lock:
+                results.append(item)
+            return item
+
+        pipeline = StagedPipeline([
+            Stage("split", split, fan_out=True),
+            Stage("collect", collect, queue_size=1),
+        ], report_interval=None)
+        stats = pipeline.run(range(5))
+
+        assert_that(sorted(results)).is_equal_to([1, 2, 2, 3, 3, 3, 4, 4, 4, 4])
+        assert_that(stats["split"]).contains_entry({"processed": 4}, {"failed": 1})
+        assert_that(stats["collect"]).contains_entry({"processed": 10})
@@ -0,0 +1,69 @@
+import base64
+import hashlib
+
+
+class BlobMock:
+    def __init__(self, bucket, name, content=None, generation=None):
+        self.bucket = bucket
+        self.name = name
+        self.content = content
+        self.generation = generation
+        self.md5_hash = base64.b64encode(hashlib.md5(content).digest()).decode() if content is not None else None
+
+    def exists(self):
+        return self.name in self.bucket.blobs
+
+    def download_as_bytes(self):
+        if self.name not in self.bucket.blobs:
+            raise RuntimeError("Blob {} not found".format(self.name))
+        self.bucket.downloads.append(self.name)
+        return self.bucket.blobs[self.name].content
+
+    def upload_from_string(self, content, content_type=None):
+        if self.bucket.failing_uploads and self.name.endswith(self.bucket.failing_uploads):
+            raise RuntimeError("Upload of {} failed".format(self.name))
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        self.bucket.put(self.name, content)
+        self.bucket.uploads.append(self.name)
+
+    def delete(self):
+        if self.name not in self.bucket.blobs:
+            raise RuntimeError("Blob {} not found".format(self.name))
+        del self.bucket.blobs[self.name]
+        self.bucket.deletes.append(self.name)
+
+
+class BucketMock:
+    """
+    An in-memory stand-in for a bucket of google.cloud.storage.
+    """
+
+    def __init__(self, name, failing_uploads=None):
+        self.name = name
+        self.failing_uploads = failing_uploads
+        self.blobs = {}
+        self.generations = 0
+        self.downloads = []
+        self.uploads = []
+        self.deletes = []
+
+    def put(self, name, content):
+        self.generations += 1
+        self.blobs[name] = BlobMock(self, name, content, self.generations)
+        return self.blobs[name]
+
+    def blob(self, name):
+        return self.blobs.get(name, BlobMock(self, name))
+
+    def list_blobs(self, prefix=""):
+        return [blob for name, blob in sorted(self.blobs.items()) if name.startswith(prefix)]
+
+
+class StorageClientMock:
+
+    def __init__(self, bucket):
+        self.buckets = {bucket.name: bucket}
+
+    def bucket(self, name):
+        return self.buckets[name]